@@ -0,0 +1,166 @@
+"""Persistent cache of chatbot answers keyed by database set and query.
+
+A query is answered from the cache when the same databases are selected and
+the query is either identical after normalization or its embedding is within
+the similarity threshold of a cached one. Entries expire after a TTL, the
+least recently used are evicted past max_entries, and every entry touching a
+database is dropped when that database is updated or deleted.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+CACHE_DIR = os.path.expanduser('~/chatbot/cache')
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'answers.sqlite')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so trivially different queries match exactly."""
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+def database_set_key(db_paths):
+    """Return a key identifying a set of databases regardless of selection order."""
+    return "\n".join(sorted(set(db_paths)))
+
+
+class AnswerCache:
+    """SQLite-backed store of answers and their source documents."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, similarity_threshold=0.95, ttl_seconds=7 * 24 * 3600, max_entries=1000, enabled=True):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                db_set TEXT NOT NULL,
+                query_norm TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_answers_query ON answers (db_set, query_norm);
+            CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers (last_used);
+            CREATE TABLE IF NOT EXISTS answer_databases (
+                answer_id INTEGER NOT NULL REFERENCES answers (id) ON DELETE CASCADE,
+                db_path TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_answer_databases_path ON answer_databases (db_path);
+            CREATE INDEX IF NOT EXISTS idx_answer_databases_answer ON answer_databases (answer_id);
+            """
+        )
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.commit()
+
+    def lookup(self, db_paths, query, query_vector):
+        """Return (answer, source_documents) for a cached match, or None."""
+        if not self.enabled:
+            return None
+
+        db_set = database_set_key(db_paths)
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer, sources FROM answers WHERE db_set = ? AND query_norm = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+                (db_set, normalize_query(query), cutoff),
+            ).fetchone()
+
+            if row is None:
+                row = self._nearest(db_set, query_vector, cutoff)
+            if row is None:
+                return None
+
+            answer_id, answer, sources = row
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), answer_id))
+            self._conn.commit()
+
+        # Imported here so invalidating the cache, as deleting a database does, stays light
+        from langchain_core.documents import Document
+
+        documents = [Document(page_content=source["page_content"], metadata=source["metadata"]) for source in json.loads(sources)]
+        return answer, documents
+
+    def _nearest(self, db_set, query_vector, cutoff):
+        """Return the most similar cached row above the threshold, or None."""
+        rows = self._conn.execute(
+            "SELECT id, answer, sources, embedding FROM answers WHERE db_set = ? AND created_at >= ?",
+            (db_set, cutoff),
+        ).fetchall()
+        if not rows:
+            return None
+
+        import numpy as np
+
+        matrix = np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        similarity = matrix @ query / np.clip(norms, 1e-12, None)
+
+        best = int(similarity.argmax())
+        if similarity[best] < self.similarity_threshold:
+            return None
+        return rows[best][:3]
+
+    def store(self, db_paths, query, query_vector, answer, source_documents):
+        """Cache an answer together with its source documents."""
+        if not self.enabled:
+            return
+
+        import numpy as np
+
+        now = time.time()
+        sources = json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in source_documents])
+        embedding = np.asarray(query_vector, dtype=np.float32).tobytes()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers (db_set, query_norm, embedding, answer, sources, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (database_set_key(db_paths), normalize_query(query), embedding, answer, sources, now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO answer_databases (answer_id, db_path) VALUES (?, ?)",
+                [(cursor.lastrowid, db_path) for db_path in set(db_paths)],
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Drop expired entries and the least recently used ones past max_entries."""
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def invalidate(self, db_path):
+        """Drop every cached answer that used a database."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT answer_id FROM answer_databases WHERE db_path = ?)",
+                (db_path,),
+            )
+            self._conn.commit()
+
+
+def get_answer_cache(path=DEFAULT_CACHE_PATH, **settings):
+    """Return the process-wide answer cache for a path, opening it on first use."""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = AnswerCache(path, **settings)
+        return cache
@@ -0,0 +1,6 @@
+"""Offline benchmarks for ingestion, retrieval and crawling.
+
+Run everything with `python -m benchmarks.run` from the repository root, or
+one suite with `python -m benchmarks.bench_ingest` and so on. Results are
+written as JSON so runs can be compared with `python -m benchmarks.compare`.
+"""
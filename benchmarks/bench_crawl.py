@@ -0,0 +1,130 @@
+"""Crawler benchmark against a local HTTP server serving a generated site.
+
+The server hands out HTML pages from a synthetic link graph and a synthetic
+PDF for every PDF link, so scrape_for_pdfs can be timed end to end without
+network access or politeness delays.
+"""
+import os
+import asyncio
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import Timer, peak_rss_mb, write_result
+from benchmarks.synthetic import link_graph, synthetic_pdf
+
+
+def make_handler(graph, pdf_pages, counts):
+    pdf_cache = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like a real server
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            with lock:
+                counts[parts[0]] = counts.get(parts[0], 0) + 1
+
+            if len(parts) == 2 and parts[0] == "page" and parts[1].isdigit() and int(parts[1]) in graph:
+                links, pdfs = graph[int(parts[1])]
+                anchors = [f'<a href="/page/{page}">Page {page}</a>' for page in links]
+                anchors += [f'<a href="/pdf/{pdf}.pdf">Document {pdf}</a>' for pdf in pdfs]
+                body = f"<html><head><title>Page {parts[1]}</title></head><body><p>{'</p><p>'.join(anchors)}</p></body></html>"
+                self._send(200, "text/html; charset=utf-8", body.encode("utf-8"))
+            elif len(parts) == 2 and parts[0] == "pdf" and parts[1].endswith(".pdf"):
+                number = int(parts[1][:-4])
+                if number not in pdf_cache:
+                    pdf_cache[number] = synthetic_pdf(number, pdf_pages)
+                self._send(200, "application/pdf", pdf_cache[number])
+            else:
+                self._send(404, "text/plain", b"Not found")
+
+    return Handler
+
+
+def run(pages=200, links_per_page=5, pdfs_per_page=1, pdf_pages=3, concurrent_pages=8, concurrent_downloads=8, strategy="static", seed=0):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import crawler
+    from logging_models import Base, LogWriter
+    from url_index import UrlIndex
+
+    graph = link_graph(pages, links_per_page, pdfs_per_page, seed)
+    counts = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(graph, pdf_pages, counts))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    start_url = f"http://127.0.0.1:{server.server_address[1]}/page/0"
+
+    metrics = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="scout-bench-") as root:
+            download_dir = os.path.join(root, "downloads")
+            os.makedirs(download_dir)
+
+            # Crawl logs go to a scratch database rather than the real one
+            engine = create_engine(f"sqlite:///{os.path.join(root, 'log.sqlite')}")
+            Base.metadata.create_all(bind=engine)
+            log_writer = LogWriter(sessionmaker(bind=engine))
+
+            total_pdfs = pages * pdfs_per_page
+            with Timer() as timer:
+                asyncio.run(crawler.scrape_for_pdfs(
+                    start_url, download_dir, concurrent_pages, concurrent_downloads, total_pdfs,
+                    1_000_000, "scout-bench", set(), os.path.join(root, "pdf_log.txt"),
+                    os.path.join(root, "pages_log.txt"), UrlIndex(), os.path.join(root, "batch_urls.txt"),
+                    asyncio.Semaphore(concurrent_downloads), log_writer, strategy=strategy
+                ))
+            log_writer.close()
+
+            downloaded = [name for name in os.listdir(download_dir) if name.endswith(".pdf")]
+            megabytes = sum(os.path.getsize(os.path.join(download_dir, name)) for name in downloaded) / (1024 * 1024)
+            metrics.update({
+                "seconds": round(timer.seconds, 3),
+                "pages_fetched": counts.get("page", 0),
+                "pdfs_downloaded": len(downloaded),
+                "pdfs_expected": total_pdfs,
+                "pages_per_second": round(counts.get("page", 0) / timer.seconds, 2),
+                "pdfs_per_second": round(len(downloaded) / timer.seconds, 2),
+                "megabytes_per_second": round(megabytes / timer.seconds, 2),
+            })
+    finally:
+        server.shutdown()
+
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links-per-page", type=int, default=5)
+    parser.add_argument("--pdfs-per-page", type=int, default=1)
+    parser.add_argument("--pdf-pages", type=int, default=3)
+    parser.add_argument("--concurrent-pages", type=int, default=8)
+    parser.add_argument("--concurrent-downloads", type=int, default=8)
+    parser.add_argument("--strategy", choices=["static", "browser", "auto"], default="static")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the result to")
+    args = parser.parse_args(argv)
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    metrics = run(args.pages, args.links_per_page, args.pdfs_per_page, args.pdf_pages, args.concurrent_pages, args.concurrent_downloads, args.strategy, args.seed)
+    return write_result(args.output, "crawl", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
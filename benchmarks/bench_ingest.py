@@ -0,0 +1,102 @@
+"""Ingestion benchmark: parse, chunk, embed and write throughput and peak memory.
+
+Generates a synthetic corpus, then times each stage of the add_database path
+on its own and the whole index_directory pipeline end to end, followed by a
+second update that should find nothing to do.
+"""
+import os
+import argparse
+import tempfile
+
+from benchmarks.common import Timer, make_embeddings, peak_rss_mb, write_result
+from benchmarks.synthetic import generate_corpus
+
+
+def run(files=50, pages=5, words_per_page=400, chunk_size=800, chunk_overlap=80, batch_size=256, workers=None, embeddings="fake", seed=0):
+    from langchain_chroma import Chroma
+
+    from ingestion import find_pdf_files, iter_file_chunks, index_directory
+    from index_manifest import IndexManifest
+    from lexical_index import LexicalIndex
+
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix="scout-bench-") as root:
+        corpus_dir = os.path.join(root, "corpus")
+        with Timer() as timer:
+            paths = generate_corpus(corpus_dir, files, pages, words_per_page, seed)
+        metrics["corpus_mb"] = round(sum(os.path.getsize(path) for path in paths) / (1024 * 1024), 2)
+        metrics["generate_seconds"] = round(timer.seconds, 3)
+
+        # Parse and chunk only
+        chunks = []
+        with Timer() as timer:
+            for _, file_chunks, error in iter_file_chunks(find_pdf_files(corpus_dir), chunk_size, chunk_overlap, max_workers=workers):
+                if error:
+                    raise RuntimeError(error)
+                chunks.extend(file_chunks)
+        metrics["parse_chunk"] = {
+            "seconds": round(timer.seconds, 3),
+            "files_per_second": round(files / timer.seconds, 2),
+            "pages_per_second": round(files * pages / timer.seconds, 2),
+            "chunks": len(chunks),
+        }
+
+        # Embed only
+        embedding_function = make_embeddings(embeddings)
+        texts = [chunk.page_content for chunk in chunks]
+        with Timer() as timer:
+            for start in range(0, len(texts), batch_size):
+                embedding_function.embed_documents(texts[start:start + batch_size])
+        metrics["embed"] = {
+            "seconds": round(timer.seconds, 3),
+            "chunks_per_second": round(len(texts) / timer.seconds, 2),
+        }
+
+        # The full add_database pipeline: parse, chunk, embed, write to Chroma and the lexical index
+        db_dir = os.path.join(root, "db")
+        vector_store = Chroma(persist_directory=db_dir, embedding_function=embedding_function)
+        with Timer() as timer:
+            written, changed, _ = index_directory(
+                vector_store, IndexManifest(db_dir), corpus_dir, chunk_size, chunk_overlap,
+                batch_size=batch_size, max_workers=workers, lexical_index=LexicalIndex(db_dir)
+            )
+        metrics["index_directory"] = {
+            "seconds": round(timer.seconds, 3),
+            "files_per_second": round(changed / timer.seconds, 2),
+            "chunks_per_second": round(written / timer.seconds, 2),
+            "chunks_written": written,
+        }
+        # Write time is what the pipeline spends beyond parsing and embedding
+        metrics["write_seconds_estimate"] = round(max(0.0, timer.seconds - metrics["parse_chunk"]["seconds"] - metrics["embed"]["seconds"]), 3)
+
+        # A repeated update should only stat the files
+        with Timer() as timer:
+            index_directory(vector_store, IndexManifest(db_dir), corpus_dir, chunk_size, chunk_overlap, batch_size=batch_size, max_workers=workers, lexical_index=LexicalIndex(db_dir))
+        metrics["unchanged_update_seconds"] = round(timer.seconds, 3)
+
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    metrics["peak_worker_rss_mb"] = peak_rss_mb(children=True)
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=80)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, help="Parser processes, every CPU by default")
+    parser.add_argument("--embeddings", choices=["fake", "model"], default="fake")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the result to")
+    args = parser.parse_args(argv)
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    metrics = run(args.files, args.pages, args.words_per_page, args.chunk_size, args.chunk_overlap, args.batch_size, args.workers, args.embeddings, args.seed)
+    return write_result(args.output, "ingest", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Query benchmark: retrieval and end-to-end answer latency against Chroma.
+
+Indexes a synthetic corpus, then measures p50/p95 latency of dense and
+hybrid retrieval and of the full RetrievalQA chain with a stub LLM, so the
+numbers show everything the application adds on top of the model.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import Timer, latency_summary, make_embeddings, peak_rss_mb, write_result
+from benchmarks.synthetic import IDENTIFIERS, WORDS, generate_corpus
+
+
+def make_queries(count, seed=0):
+    """Return count questions mixing vocabulary words and identifiers."""
+    rng = random.Random(seed)
+    return [
+        f"What does {rng.choice(IDENTIFIERS)} say about {rng.choice(WORDS)} {rng.choice(WORDS)}?"
+        for _ in range(count)
+    ]
+
+
+def timed_calls(function, queries, concurrency):
+    """Call function on every query with concurrency threads; return (latencies, wall seconds)."""
+    def call(query):
+        start = time.perf_counter()
+        function(query)
+        return time.perf_counter() - start
+
+    with Timer() as timer, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, queries))
+    return latencies, timer.seconds
+
+
+def run(files=50, pages=5, queries=200, k=4, concurrency=4, embeddings="fake", seed=0):
+    from langchain.chains import RetrievalQA
+    from langchain_chroma import Chroma
+    from langchain_core.language_models import FakeListChatModel
+    from langchain_core.prompts import PromptTemplate
+
+    from ingestion import index_directory
+    from index_manifest import IndexManifest
+    from lexical_index import LexicalIndex
+    from retrieval import MultiStoreRetriever
+
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix="scout-bench-") as root:
+        corpus_dir = os.path.join(root, "corpus")
+        db_dir = os.path.join(root, "db")
+        generate_corpus(corpus_dir, files, pages, seed=seed)
+
+        embedding_function = make_embeddings(embeddings)
+        vector_store = Chroma(persist_directory=db_dir, embedding_function=embedding_function)
+        lexical_index = LexicalIndex(db_dir)
+        with Timer() as timer:
+            written, _, _ = index_directory(vector_store, IndexManifest(db_dir), corpus_dir, 800, 80, lexical_index=lexical_index)
+        metrics["chunks"] = written
+        metrics["index_seconds"] = round(timer.seconds, 3)
+
+        query_texts = make_queries(queries, seed)
+        dense = MultiStoreRetriever(vector_stores=[vector_store], names=["bench"], k=k)
+        hybrid = MultiStoreRetriever(vector_stores=[vector_store], names=["bench"], k=k, lexical_indexes=[lexical_index])
+
+        # One untimed query loads everything lazily initialized
+        hybrid.invoke(query_texts[0])
+
+        for name, retriever in (("dense", dense), ("hybrid", hybrid)):
+            latencies, _ = timed_calls(retriever.invoke, query_texts, 1)
+            metrics[f"retrieval_{name}"] = latency_summary(latencies)
+
+        prompt = PromptTemplate(
+            template="Context:\n{context}\n\nQuestion: {question}\nAnswer:",
+            input_variables=["context", "question"],
+        )
+        chain = RetrievalQA.from_chain_type(
+            llm=FakeListChatModel(responses=["Stub answer."]),
+            chain_type="stuff",
+            retriever=hybrid,
+            chain_type_kwargs={"prompt": prompt},
+            return_source_documents=True,
+        )
+        latencies, wall = timed_calls(lambda query: chain.invoke({"query": query}), query_texts, concurrency)
+        metrics["answer"] = latency_summary(latencies)
+        metrics["answer"]["queries_per_second"] = round(len(query_texts) / wall, 2)
+
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads answering queries at once")
+    parser.add_argument("--embeddings", choices=["fake", "model"], default="fake")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the result to")
+    args = parser.parse_args(argv)
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    metrics = run(args.files, args.pages, args.queries, args.k, args.concurrency, args.embeddings, args.seed)
+    return write_result(args.output, "query", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
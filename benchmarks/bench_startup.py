@@ -0,0 +1,52 @@
+"""Startup benchmark: time from launching the script to its main menu.
+
+Starts the script in a scratch directory with --startup-report, exits at the
+first menu, and records both the script's own time to menu and the wall time
+of the whole process, which includes the interpreter itself. Heavy modules
+loaded before the menu are listed so a stray top-level import shows up.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.common import Timer, latency_summary, write_result
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot expanded.py")
+
+
+def run(runs=10):
+    to_menu, wall, heavy = [], [], set()
+    with tempfile.TemporaryDirectory() as scratch:
+        for _ in range(runs):
+            with Timer() as timer:
+                completed = subprocess.run(
+                    [sys.executable, SCRIPT, "--startup-report"],
+                    input="0\n", capture_output=True, text=True, cwd=scratch, check=True,
+                )
+            report = next(json.loads(line) for line in completed.stdout.splitlines() if line.startswith("{"))
+            to_menu.append(report["time_to_menu_ms"] / 1000)
+            wall.append(timer.seconds)
+            heavy.update(report["heavy_modules_loaded"])
+
+    return {
+        "time_to_menu": latency_summary(to_menu),
+        "process_wall": latency_summary(wall),
+        "heavy_modules_loaded": sorted(heavy),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="JSON file to write the result to")
+    args = parser.parse_args(argv)
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    return write_result(args.output, "startup", params, run(args.runs))
+
+
+if __name__ == "__main__":
+    main()
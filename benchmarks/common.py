@@ -0,0 +1,91 @@
+"""Helpers shared by the benchmark suites: timing, memory and result files."""
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def peak_rss_mb(children=False):
+    """Return the peak resident set size in MB of this process, or of its finished children."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss * scale / (1024 * 1024), 1)
+
+
+def percentile(values, fraction):
+    """Return the value at a fraction (0-1) of the sorted values, nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def latency_summary(seconds):
+    """Summarize a list of latencies in milliseconds."""
+    return {
+        "count": len(seconds),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 2) if seconds else None,
+        "p50_ms": round(percentile(seconds, 0.50) * 1000, 2) if seconds else None,
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 2) if seconds else None,
+        "max_ms": round(max(seconds) * 1000, 2) if seconds else None,
+    }
+
+
+class Timer:
+    """Context manager that records elapsed wall time in .seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+
+
+def environment():
+    """Describe the machine and code version a result was measured on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def write_result(path, benchmark, params, metrics):
+    """Write one benchmark's result as JSON and return it."""
+    result = {"benchmark": benchmark, "params": params, "metrics": metrics, "environment": environment()}
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result["metrics"], indent=2))
+    return result
+
+
+def make_embeddings(kind, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    """Return embeddings for a benchmark.
+
+    "fake" hashes text to deterministic vectors, so runs need no model
+    download and measure everything except the model itself. "model" loads
+    the real model, which must already be in the local Hugging Face cache.
+    """
+    if kind == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=384)
+
+    from get_embedding_function import get_embedding_function
+    # The embedding cache would turn repeated runs into cache lookups
+    return get_embedding_function(model_name, use_cache=False)
@@ -0,0 +1,38 @@
+"""Compare two results files from benchmarks.run metric by metric.
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import sys
+import json
+
+
+def flatten(metrics, prefix=""):
+    """Yield (dotted name, value) for every numeric metric."""
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{name}", value
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        raise SystemExit("Usage: python -m benchmarks.compare BEFORE.json AFTER.json")
+
+    with open(argv[0]) as f:
+        before = json.load(f)["results"]
+    with open(argv[1]) as f:
+        after = json.load(f)["results"]
+
+    for suite in sorted(before.keys() & after.keys()):
+        old = dict(flatten(before[suite].get("metrics", {})))
+        new = dict(flatten(after[suite].get("metrics", {})))
+        print(f"\n{suite}")
+        for name in sorted(old.keys() & new.keys()):
+            change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else "n/a"
+            print(f"  {name:45} {old[name]:>12} {new[name]:>12} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Run every benchmark suite and collect the results in one JSON file.
+
+Each suite runs in its own process so peak memory is measured per suite.
+Run a suite module directly to change its parameters beyond --quick.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from datetime import datetime
+
+from benchmarks.common import RESULTS_DIR, environment
+
+SUITES = ["bench_ingest", "bench_query", "bench_crawl", "bench_startup"]
+
+# Small sizes for a fast smoke run
+QUICK_ARGS = {
+    "bench_ingest": ["--files", "10", "--pages", "2"],
+    "bench_query": ["--files", "10", "--pages", "2", "--queries", "50"],
+    "bench_crawl": ["--pages", "30"],
+    "bench_startup": ["--runs", "3"],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suite", action="append", choices=SUITES, help="Run only this suite, can be repeated")
+    parser.add_argument("--quick", action="store_true", help="Use small corpora for a fast check")
+    parser.add_argument("--embeddings", choices=["fake", "model"], default="fake")
+    parser.add_argument("--output", help="Results file, benchmarks/results/<timestamp>.json by default")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    results = {"environment": environment(), "results": {}}
+
+    for suite in args.suite or SUITES:
+        print(f"Running {suite}...")
+        command = [sys.executable, "-m", f"benchmarks.{suite}"]
+        if args.quick:
+            command += QUICK_ARGS[suite]
+        if suite not in ("bench_crawl", "bench_startup"):
+            command += ["--embeddings", args.embeddings]
+
+        with tempfile.TemporaryDirectory() as scratch:
+            suite_output = os.path.join(scratch, "result.json")
+            completed = subprocess.run(command + ["--output", suite_output])
+            if completed.returncode != 0 or not os.path.isfile(suite_output):
+                print(f"{suite} failed with exit code {completed.returncode}")
+                results["results"][suite] = {"error": completed.returncode}
+                continue
+            with open(suite_output) as f:
+                results["results"][suite] = json.load(f)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
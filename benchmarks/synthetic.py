@@ -0,0 +1,106 @@
+"""Deterministic synthetic PDFs and link graphs for benchmarks.
+
+PDFs are written directly in PDF syntax with the standard Helvetica font, so
+no PDF library is needed to create them and pypdf can parse them like real
+documents. The same seed always produces the same corpus.
+"""
+import os
+import random
+
+# Filler vocabulary, plus identifiers of the kind users search for
+WORDS = (
+    "policy claim coverage premium deductible benefit employer employee filing return "
+    "payment schedule agency notice section report annual quarterly income expense "
+    "credit refund account balance federal state county record request approval form "
+    "instructions eligibility application renewal period amount total review audit"
+).split()
+IDENTIFIERS = ["W-2", "1040-ES", "1099-MISC", "I-9", "SF-86", "DD-214", "HIPAA", "FMLA", "COBRA", "ACA"]
+
+_LINES_PER_PAGE = 60
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_text(rng, words_per_page):
+    """Return one page of filler text as lines."""
+    words = [rng.choice(IDENTIFIERS) if rng.random() < 0.02 else rng.choice(WORDS) for _ in range(words_per_page)]
+    per_line = max(1, -(-len(words) // _LINES_PER_PAGE))
+    return [" ".join(words[i:i + per_line]) for i in range(0, len(words), per_line)]
+
+
+def pdf_bytes(pages):
+    """Return a PDF with one page per list of text lines."""
+    objects = []  # Object bodies; object n is objects[n - 1]
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    kids = []
+    for lines in pages:
+        text = "".join(f"({_escape(line)}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 40 760 Td {text}ET".encode("latin-1")
+        contents = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (page_tree, font, contents)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def synthetic_pdf(seed, pages=5, words_per_page=400):
+    """Return the bytes of one deterministic synthetic PDF."""
+    rng = random.Random(seed)
+    return pdf_bytes([page_text(rng, words_per_page) for _ in range(pages)])
+
+
+def generate_corpus(directory, files=50, pages=5, words_per_page=400, seed=0):
+    """Write files synthetic PDFs into directory and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, f"doc_{index:05d}.pdf")
+        with open(path, "wb") as f:
+            f.write(synthetic_pdf(seed * 1_000_003 + index, pages, words_per_page))
+        paths.append(path)
+    return paths
+
+
+def link_graph(pages=100, links_per_page=5, pdfs_per_page=1, seed=0):
+    """Return {page_number: (linked page numbers, pdf numbers)} for a site with one start page.
+
+    Every page is reachable from page 0, and PDFs are numbered so each is
+    linked from exactly one page.
+    """
+    rng = random.Random(seed)
+    graph = {}
+    next_pdf = 0
+    for page in range(pages):
+        # A link to the next page keeps the whole graph reachable
+        links = {page + 1} if page + 1 < pages else set()
+        links.update(rng.randrange(pages) for _ in range(links_per_page - 1))
+        pdfs = list(range(next_pdf, next_pdf + pdfs_per_page))
+        next_pdf += pdfs_per_page
+        graph[page] = (sorted(links), pdfs)
+    return graph
@@ -1,27 +1,27 @@
 import os
+import sys
 import json
+import time
 import warnings
 import random
 import shutil
 import asyncio
 import logging
-from tqdm import tqdm  # Progress bar library
-from langchain.chains import RetrievalQA
-from langchain_ollama import ChatOllama
-from langchain_chroma import Chroma
-from langchain.memory import ConversationBufferMemory
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from urllib.parse import urlparse, urljoin
-from get_embedding_function import get_embedding_function
-from playwright.async_api import async_playwright
-from tqdm.asyncio import tqdm
-import aiofiles
-import aiohttp
-from urllib.parse import urlparse
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from logging_models import PdfDownloadLog, CompletedPagesLog, Base
+import argparse
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+# Measured before anything heavy is imported, for the startup report
+STARTED_AT = time.perf_counter()
+
+# Only lightweight modules are imported here. Langchain, Chroma, the embedding
+# model, Playwright, aiohttp and SQLAlchemy are imported inside the functions
+# that use them, so the menu appears without loading any of them.
+from instrumentation import format_summary, write_metrics_at_exit, start_profiling, stop_profiling
+from static_fetch import FETCH_STRATEGIES
+
+# Modules that should not be loaded before the menu is shown
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_chroma", "chromadb", "torch", "sentence_transformers", "onnxruntime", "numpy", "playwright", "aiohttp", "sqlalchemy")
 
 # Ignore Warnings
 warnings.filterwarnings("ignore")
@@ -29,11 +29,53 @@ warnings.filterwarnings("ignore")
 # Global Variables
 qa_chain = None
 memory = None
+config = None
 
 def load_config(file_path):
     """Load configuration from a JSON file or create one if it does not exist."""
     default_config = {
-        "database_paths": {}  # Define any default values here
+        "database_paths": {},  # Define any default values here
+        "ingest_workers": None,  # Worker processes for PDF parsing, None uses every CPU
+        "ingest_batch_size": 256,  # Chunks embedded and written to the database at a time
+        "crawl_ingest_workers": 2,  # Worker processes parsing PDFs while a crawl is running
+        "embedding": {  # Settings passed to get_embedding_function
+            "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+            "device": "cpu",
+            "batch_size": 32,
+            "num_threads": None,
+            "normalize": False,
+            "backend": "torch",  # "torch" or "onnx", can be overridden per database
+            "quantize": True  # Use the int8 export with the onnx backend
+        },
+        "retrieval": {  # Search across the selected databases
+            "k": 4,  # Documents passed to the LLM after merging every database's results
+            "max_workers": 8,  # Databases searched at the same time
+            "hybrid": True,  # Combine vector search with the BM25 lexical index
+            "candidates": 20,  # Results taken from each search before fusion
+            "rrf_k": 60  # Reciprocal-rank fusion constant, higher flattens rank differences
+        },
+        "answer_cache": {  # Reuse answers to repeated or near-duplicate questions
+            "enabled": True,
+            "similarity_threshold": 0.95,  # Cosine similarity for a near-duplicate query to count as a match
+            "ttl_seconds": 604800,  # Cached answers expire after a week
+            "max_entries": 1000
+        },
+        "dedup": {  # Drop repeated chunks such as cover pages and boilerplate before they are embedded
+            "enabled": True,
+            "near_duplicates": True,  # Also drop chunks that are nearly identical to a stored one, not only exact copies
+            "similarity_threshold": 0.85,  # Estimated share of word 5-grams two chunks must have in common to count as near duplicates
+            "across_databases": False  # Also drop chunks already stored in another database; they are then only found when both are searched
+        },
+        "stream_responses": True,  # Print answers token by token as they are generated
+        "memory": {  # Conversation history included in the prompt
+            "max_tokens": 1000,  # Older turns are dropped once the history passes this size
+            "summarize": False,  # Fold dropped turns into a running summary using the LLM
+            "persist_sessions": False  # Ask for a session name and save the conversation to disk
+        },
+        "instrumentation": {  # Per-stage timings and counters for finding slow spots
+            "metrics_file": None,  # Saved on exit; a .prom file is written in Prometheus text format, anything else as JSON
+            "profile_file": None  # Run cProfile and save the stats here on exit
+        }
     }
     
     try:
@@ -105,26 +147,177 @@ def select_database(database_paths):
             if handle_interrupt():
                 exit()
 
+def get_embeddings(db_path=None):
+    """Return the shared embedding function configured in config.json.
+
+    A database entry may override the global settings with its own "embedding"
+    section, for example {"backend": "onnx", "quantize": true}.
+    """
+    from get_embedding_function import get_embedding_function
+
+    settings = dict(config.get("embedding", {})) if config else {}
+    db_info = find_database_entry(config.get("database_paths", {}), db_path) if config and db_path else None
+    if db_info:
+        settings.update(db_info.get("embedding", {}))
+    return get_embedding_function(**settings)
+
 def initialize_vector_stores(paths):
-    """Initialize ChromaDB instances."""
+    """Initialize ChromaDB instances sharing a single embedding model."""
+    from langchain_chroma import Chroma
+
     vector_stores = []
     for path in paths:
         vector_stores.append(Chroma(
             persist_directory=path,
-            embedding_function=get_embedding_function()
+            embedding_function=get_embeddings(path)
         ))
     return vector_stores
 
-def load_documents(directory_path):
-    """Load documents from the specified directory."""
-     
-    # Initialize the document loader
-    loader = PyPDFDirectoryLoader(directory_path)
-    
-    # Load documents
-    documents = loader.load()
-    
-    return documents
+# Prompt for the "stuff" chain; {history} is filled from the conversation memory on every call
+QA_PROMPT_TEMPLATE = """Use the following pieces of context and the conversation so far to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+Conversation so far:
+{history}
+
+Context:
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+def get_llm(fake_responses=None):
+    """Create the chat model used for answers.
+
+    fake_responses swaps in a stub model that replies with those strings in
+    turn, for trying out the server and batch queries without Ollama.
+    """
+    if fake_responses:
+        from langchain_core.language_models import FakeListChatModel
+        return FakeListChatModel(responses=fake_responses)
+
+    from langchain_ollama import ChatOllama
+    return ChatOllama(model="llama2")
+
+def create_memory(llm):
+    """Create the conversation memory configured in config.json."""
+    from conversation_memory import TokenBudgetMemory, session_path
+
+    settings = config.get("memory", {}) if config else {}
+
+    path = None
+    if settings.get("persist_sessions"):
+        name = input("Enter a session name to resume or start (leave empty for an unsaved session): ").strip()
+        if name:
+            path = session_path(name)
+
+    return TokenBudgetMemory(
+        max_tokens=settings.get("max_tokens", 1000),
+        llm=llm if settings.get("summarize") else None,
+        path=path
+    )
+
+def build_retriever(database_paths, selected_paths):
+    """Create the retriever that searches every selected database."""
+    from dedup import DuplicateSources
+    from lexical_index import open_lexical_index
+    from retrieval import MultiStoreRetriever
+
+    vector_stores = initialize_vector_stores(selected_paths)
+    names = [(find_database_entry(database_paths, path) or {}).get("name", path) for path in selected_paths]
+    settings = dict(config.get("retrieval", {}) if config else {})
+
+    # Exact terms such as form numbers are found through each database's BM25 index
+    if settings.pop("hybrid", True):
+        settings["lexical_indexes"] = [open_lexical_index(path, store) for path, store in zip(selected_paths, vector_stores)]
+
+    # References also cite the files whose chunks were dropped as duplicates of a result
+    settings["duplicate_sources"] = [DuplicateSources(path) for path in selected_paths]
+
+    # Search every selected database and keep the best k results overall
+    return MultiStoreRetriever(vector_stores=vector_stores, names=names, **settings)
+
+def format_reference(doc):
+    """Return a source document's file name, followed by the other files its text was found in."""
+    file_name = os.path.basename(doc.metadata['source'])
+    others = [os.path.basename(found["source"]) for found in doc.metadata.get("duplicates", [])]
+    others = [name for name in dict.fromkeys(others) if name != file_name]
+    return f"{file_name} (also in {', '.join(others)})" if others else file_name
+
+def build_qa_chain(database_paths, selected_paths, llm, memory):
+    """Create the QA chain over every selected database."""
+    from langchain.chains import RetrievalQA
+    from langchain_core.prompts import PromptTemplate
+
+    retriever = build_retriever(database_paths, selected_paths)
+
+    # The history is rendered when the prompt is formatted, so it always reflects the latest turn
+    prompt = PromptTemplate(
+        template=QA_PROMPT_TEMPLATE,
+        input_variables=["context", "question"],
+        partial_variables={"history": memory.render}
+    )
+
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever,
+        chain_type_kwargs={"prompt": prompt},
+        return_source_documents=True
+    )
+
+def answer_cache():
+    """Return the answer cache configured in config.json."""
+    from answer_cache import get_answer_cache
+
+    settings = config.get("answer_cache", {}) if config else {}
+    return get_answer_cache(**settings)
+
+def answer_query(query, selected_paths, callbacks=None):
+    """Answer a query, serving repeated and near-duplicate questions from the answer cache.
+
+    callbacks are passed to the QA chain, for example to stream tokens.
+    The cache is only used at the start of a conversation: once the prompt
+    includes history, the same question can need a different answer.
+    Returns (response, source_documents, cached).
+    """
+    from streaming import LlmMetricsHandler
+
+    cache = answer_cache()
+    use_cache = memory is None or not memory.has_history()
+    # Embedded through the embedding cache, so retrieval reuses this vector
+    query_vector = qa_chain.retriever.vector_stores[0].embeddings.embed_query(query)
+
+    cached = cache.lookup(selected_paths, query, query_vector) if use_cache else None
+    if cached:
+        response, source_docs = cached
+        return response, source_docs, True
+
+    # LLM time and tokens go to the instrumentation registry
+    callbacks = list(callbacks or []) + [LlmMetricsHandler()]
+    result = qa_chain({"query": query}, callbacks=callbacks)
+    response = result["result"]
+    source_docs = result.get("source_documents", [])
+    if use_cache:
+        cache.store(selected_paths, query, query_vector, response, source_docs)
+    return response, source_docs, False
+
+def find_database_entry(database_paths, db_path):
+    """Return the configuration entry for a database path, or None."""
+    for info in database_paths.values():
+        if info["path"] == db_path:
+            return info
+    return None
+
+def prompt_int(prompt, default=None):
+    """Prompt for an integer, returning the default when the input is left empty."""
+    if default is not None:
+        prompt = f"{prompt} [{default}]: "
+    else:
+        prompt = f"{prompt}: "
+    value = input(prompt).strip()
+    if not value and default is not None:
+        return default
+    return int(value)
 
 def ensure_directory_exists(path):
     """Create directory if it does not exist."""
@@ -132,42 +325,75 @@ def ensure_directory_exists(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
-def split_documents(documents, chunk_size, chunk_overlap):
-    """Split documents into chunks based on chunk size and overlap."""
-    # Initialize text splitter with specified chunk size and overlap
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    
-    split_docs = []
-    for doc in documents:
-        split_docs.extend(text_splitter.split_documents([doc]))
-    
-    return split_docs
+def open_dedup(db_path, vector_store):
+    """Return the dedup index for a database, or None when deduplication is turned off."""
+    from dedup import DEFAULT_THRESHOLD, DedupIndex, open_dedup_index
+
+    settings = (config or {}).get("dedup", {})
+    if not settings.get("enabled", True):
+        return None
+
+    others = {}
+    if settings.get("across_databases", False):
+        for info in config.get("database_paths", {}).values():
+            path = os.path.expanduser(info["path"])
+            # Databases not updated since deduplication was added have no index yet and are skipped
+            if path != os.path.expanduser(db_path) and os.path.isdir(path):
+                others[path] = DedupIndex(path)
+
+    return open_dedup_index(
+        db_path, vector_store,
+        threshold=settings.get("similarity_threshold", DEFAULT_THRESHOLD),
+        near_duplicates=settings.get("near_duplicates", True),
+        others=others,
+    )
+
+def reprocess_and_update(data_directory, db_path, chunk_size, chunk_overlap):
+    """Index new and changed documents from a directory into the database in fixed-size batches."""
+    from langchain_chroma import Chroma
+    from ingestion import DEFAULT_BATCH_SIZE, index_directory
+    from index_manifest import IndexManifest
+    from lexical_index import open_lexical_index
 
-def reprocess_and_update(chunks, db_path, chunk_size, chunk_overlap):
-    """Reprocess documents and update the database with new chunks."""
     # Initialize ChromaDB instance for the database
     vector_store = Chroma(
         persist_directory=db_path,
-        embedding_function=get_embedding_function()  # Ensure embedding_function is available in this scope
+        embedding_function=get_embeddings(db_path)
     )
 
-    # Add new chunks to the vector store
+    # Worker processes and batch size, with defaults when not set in config.json
+    max_workers = config.get("ingest_workers") if config else None
+    batch_size = (config.get("ingest_batch_size") if config else None) or DEFAULT_BATCH_SIZE
+
+    # The manifest tracks which files are already indexed so unchanged files are skipped
+    manifest = IndexManifest(db_path)
+
+    # The BM25 index next to the database is updated with the same chunks
+    lexical_index = open_lexical_index(db_path, vector_store)
+
+    # Repeated chunks are dropped before embedding, with their sources kept in the dedup index
+    dedup = open_dedup(db_path, vector_store)
+
+    # Parse, split, embed and write one batch at a time; Chroma persists each write
     print("Adding new documents to the database...")
-    with tqdm(total=len(chunks), desc="Progress (Adding Documents)", unit="chunk") as pbar:
-        vector_store.add_documents(chunks)
-        pbar.update(len(chunks))
+    written, changed, removed = index_directory(vector_store, manifest, data_directory, chunk_size, chunk_overlap, batch_size=batch_size, max_workers=max_workers, lexical_index=lexical_index, dedup=dedup)
 
-    # Save the updated vector store
-    print("Saving the updated database...")
-    vector_store.persist()
+    # Answers based on the old contents are no longer valid
+    answer_cache().invalidate(db_path)
 
-    print(f"Database at '{db_path}' has been updated successfully.")
+    print(f"Database at '{db_path}' has been updated successfully: {written} chunks from {changed} file(s) added, {removed} file(s) removed.")
+    print("Time by stage in this session:")
+    print(format_summary())
 
-def main_loop():
+def main_loop(selected_paths):
     """Run the interactive loop."""
+    from retrieval import format_timings
+    from streaming import StreamingPrinter
+
     global qa_chain, memory  # Declare qa_chain as global
 
-    memory = ConversationBufferMemory()
+    # Prints tokens as they arrive and measures time to first token
+    printer = StreamingPrinter() if config.get("stream_responses", True) else None
 
     print("Welcome to ScoutAI. Type 'exit' to quit.")
     while True:
@@ -181,21 +407,30 @@ def main_loop():
                 break
 
             # Process user input
-            result = qa_chain({"query": user_input})
-            response = result["result"]
-            source_docs = result.get("source_documents", [])
+            if printer:
+                printer.start_turn()
+            response, source_docs, cached = answer_query(user_input, selected_paths, callbacks=[printer] if printer else None)
 
-            # Save to Memory
-            memory.save_context({"query": user_input}, {"result": response})
+            # Save to Memory, older turns are dropped or summarized to stay within the token budget
+            memory.add_turn(user_input, response)
 
-            # Print ScoutAI response
-            print(f"ScoutAI: {response}")
+            # Print ScoutAI response, unless it was already streamed
+            streamed = printer is not None and not cached and printer.tokens > 0
+            if not streamed:
+                print(f"ScoutAI: {response}")
 
             if source_docs:
                 print("References:")
                 for doc in source_docs:
-                    file_name = os.path.basename(doc.metadata['source'])
-                    print(f"- {file_name}")
+                    print(f"- {format_reference(doc)}")
+
+            if cached:
+                print("(Answered from cache)")
+            else:
+                # Show how long each database took so a slow one stands out
+                print(f"Retrieval: {format_timings(qa_chain.retriever.last_timings)}")
+                if streamed:
+                    print(f"Generation: {printer.summary()}")
 
         except KeyboardInterrupt:
             if handle_interrupt():
@@ -215,8 +450,8 @@ def add_database(database_paths):
     ensure_directory_exists(new_path)
 
     # Prompt for chunk size, overlap, and data directory
-    chunk_size = int(input("Enter chunk size for the new database: ").strip())
-    overlap = int(input("Enter overlap size for the new database: ").strip())
+    chunk_size = prompt_int("Enter chunk size for the new database")
+    overlap = prompt_int("Enter overlap size for the new database")
     data_directory = os.path.expanduser(input("Enter the path of the directory containing the data to be added to the database: ").strip())
 
     # Ensure the data directory exists
@@ -224,21 +459,26 @@ def add_database(database_paths):
         print(f"The directory '{data_directory}' does not exist.")
         return
 
-    # Load documents
-    documents = load_documents(data_directory)
-    
-    # Split documents
-    chunks = split_documents(documents, chunk_size, overlap)
+    # The backend is fixed once the database is created since queries must use the same vectors
+    backend = input("Enter the embedding backend (torch/onnx) [torch]: ").strip().lower() or "torch"
+    if backend not in ("torch", "onnx"):
+        print(f"Unknown embedding backend '{backend}'.")
+        return
+
+    create_database(database_paths, new_id, new_name, new_path, chunk_size, overlap, data_directory, backend)
+
+def create_database(database_paths, new_id, new_name, new_path, chunk_size, overlap, data_directory, backend="torch"):
+    """Register a new database, index a directory into it and save the configuration."""
+    # Register the database before indexing so its embedding settings are used
+    database_paths[new_id] = {"name": new_name, "path": new_path, "chunk_size": chunk_size, "chunk_overlap": overlap, "embedding": {"backend": backend}}
+    config["database_paths"] = database_paths
 
     # Create and update the database
     print("Creating and updating the database...")
-    with tqdm(total=100, desc="Progress", unit="%") as pbar:
-        reprocess_and_update(chunks, new_path, chunk_size, overlap)
-        pbar.update(100)
+    reprocess_and_update(data_directory, new_path, chunk_size, overlap)
 
     # Update configuration
-    database_paths[new_id] = {"name": new_name, "path": new_path}
-    save_config("config.json", {"database_paths": database_paths})
+    save_config("config.json", config)
 
     print(f"New database '{new_name}' added successfully with ID '{new_id}'.")
 
@@ -249,9 +489,12 @@ def update_database(database_paths):
         return
 
     for db_path in selected_paths:
-        # Prompt for chunk size, overlap, and data directory
-        chunk_size = int(input("Enter chunk size for the updated database: ").strip())
-        overlap = int(input("Enter overlap size for the updated database: ").strip())
+        db_info = find_database_entry(database_paths, db_path)
+
+        # Prompt for chunk size, overlap, and data directory, keeping the existing settings by default
+        # Changing them re-chunks every file in the directory
+        chunk_size = prompt_int("Enter chunk size for the updated database", db_info.get("chunk_size"))
+        overlap = prompt_int("Enter overlap size for the updated database", db_info.get("chunk_overlap"))
         data_directory = os.path.expanduser(input("Enter the path of the directory containing the new data to be added to the database: ").strip())
 
         # Ensure the data directory exists
@@ -259,19 +502,20 @@ def update_database(database_paths):
             print(f"The directory '{data_directory}' does not exist.")
             return
 
-        # Load documents
-        documents = load_documents(data_directory)
-        
-        # Split documents
-        chunks = split_documents(documents, chunk_size, overlap)
+        update_database_entry(database_paths, db_info, data_directory, chunk_size, overlap)
 
-        # Update the database
-        print(f"Updating the database at '{db_path}'...")
-        with tqdm(total=100, desc="Progress", unit="%") as pbar:
-            reprocess_and_update(chunks, db_path, chunk_size, overlap)
-            pbar.update(100)
+def update_database_entry(database_paths, db_info, data_directory, chunk_size, overlap):
+    """Index a directory into an existing database and save its chunk settings."""
+    db_path = db_info["path"]
+    print(f"Updating the database at '{db_path}'...")
+    reprocess_and_update(data_directory, db_path, chunk_size, overlap)
 
-        print("Database updated successfully.")
+    db_info["chunk_size"] = chunk_size
+    db_info["chunk_overlap"] = overlap
+    config["database_paths"] = database_paths
+    save_config("config.json", config)
+
+    print("Database updated successfully.")
 
 def delete_database(database_paths):
     """Delete one or more databases."""
@@ -302,6 +546,7 @@ def delete_database(database_paths):
             confirm = input(f"Are you sure you want to delete '{db_info['name']}'? This action is irreversible. (y/n): ").strip().lower()
             if confirm == "y":
                 shutil.rmtree(db_info['path'])
+                answer_cache().invalidate(db_info['path'])
                 del database_paths[db_id]
                 print(f"Database '{db_info['name']}' deleted.")
             else:
@@ -310,149 +555,87 @@ def delete_database(database_paths):
             print(f"Invalid database ID: {db_id}. Skipping.")
 
     # Save updated configuration
-    save_config("config.json", {"database_paths": database_paths})
+    config["database_paths"] = database_paths
+    save_config("config.json", config)
     print("Deletion process completed.")
 
-# Suppress SQLAlchemy logging
-logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+def maintain_database(database_paths):
+    """Measure search recall of databases and optionally rebuild them with new HNSW settings."""
+    from maintenance import DEFAULT_HNSW
+
+    selected_paths = select_database(database_paths)
+    if not selected_paths:
+        return
 
+    for db_path in selected_paths:
+        db_info = find_database_entry(database_paths, db_path)
+        current = db_info.get("hnsw", DEFAULT_HNSW)
+        print(f"\nMaintaining '{db_info['name']}'. Higher values raise recall at the cost of speed and memory.")
+        hnsw = {
+            "M": prompt_int("Links per node (M)", current["M"]),
+            "construction_ef": prompt_int("Candidates while building (construction_ef)", current["construction_ef"]),
+            "search_ef": prompt_int("Candidates per query (search_ef)", current["search_ef"]),
+        }
+        k = prompt_int("Results per query to check (k)", 10)
+        samples = prompt_int("Sample queries", 100)
+        rebuild = input("Rebuild the index with these settings and remove stale chunks? Otherwise only measure. (y/n): ").strip().lower() in ["y", "yes"]
+        maintain_database_entry(database_paths, db_info, hnsw if rebuild else None, k, samples)
+
+def maintain_database_entry(database_paths, db_info, hnsw=None, k=10, samples=100, compact=True):
+    """Measure a database's recall@k and latency, rebuilding it first with hnsw settings when given.
+
+    The database's HNSW settings are saved in its config.json entry. Returns the report.
+    """
+    from maintenance import format_report, tune_database
+
+    db_path = db_info["path"]
+    print(f"Measuring recall against exact search for '{db_path}'...")
+    report = tune_database(db_path, hnsw, compact=compact, k=k, samples=samples)
+    print(format_report(report))
+
+    db_info["hnsw"] = report["after" if "after" in report else "before"]["hnsw"]
+    config["database_paths"] = database_paths
+    save_config("config.json", config)
+    if report.get("stale_chunks_removed"):
+        # Answers may cite the removed chunks
+        answer_cache().invalidate(db_path)
+    return report
 
-# Pre-configured User-Agent strings
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:90.0) Gecko/20100101 Firefox/90.0",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edg/91.0.864.48"
-]
+# Suppress SQLAlchemy logging
+logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
 
-# Shared state for tracking downloads
-download_count_lock = asyncio.Lock()
-download_count = 0
-max_downloads = 0  # Will be set by main()
 
-async def download_pdf(pdf_url, download_dir, user_agent, min_delay, max_delay, temp_file, batch_file, pdf_log_file):
-    global download_count
-    async with download_count_lock:
-        if download_count >= max_downloads:
-            return
-        download_count += 1
+def setup_instrumentation(metrics_file=None, profile_file=None):
+    """Save metrics and a cProfile run on exit, when set in config.json or passed on the command line."""
+    settings = config.get("instrumentation", {}) if config else {}
+    metrics_file = metrics_file or settings.get("metrics_file")
+    profile_file = profile_file or settings.get("profile_file")
+    if metrics_file:
+        write_metrics_at_exit(metrics_file)
+    if profile_file:
+        start_profiling()
+        atexit.register(stop_profiling, profile_file)
+
+def startup_report():
+    """Print how long the script took to reach the menu and which heavy modules it loaded on the way."""
+    report = {
+        "time_to_menu_ms": round((time.perf_counter() - STARTED_AT) * 1000, 1),
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+    print(json.dumps(report))
 
-    headers = {'User-Agent': user_agent}
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(pdf_url, headers=headers) as response:
-                filename = pdf_url.split('/')[-1]
-                file_path = os.path.join(download_dir, filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-                total_size = int(response.headers.get('content-length', 0))
-                progress_bar = tqdm(total=total_size, unit='B', unit_scale=True, unit_divisor=1024, desc=filename)
-
-                async with aiofiles.open(file_path, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(1024)
-                        if not chunk:
-                            break
-                        await f.write(chunk)
-                        progress_bar.update(len(chunk))
-
-                progress_bar.close()
-                print(f"Downloaded: {file_path}")
-
-                # Log the successful download
-                async with aiofiles.open(temp_file, 'a') as log:
-                    await log.write(f"Successfully downloaded: {pdf_url}\n")
-
-                async with aiofiles.open(batch_file, 'a') as batch:
-                    await batch.write(f"{pdf_url}\n")
-
-                async with aiofiles.open(pdf_log_file, 'a') as log:
-                    await log.write(f"Successfully downloaded: {pdf_url}\n")
-
-        except Exception as e:
-            print(f"Error downloading PDF: {e}")
-
-    # Rate limiting
-    rate_limit_delay = random.uniform(min_delay, max_delay)
-    await asyncio.sleep(rate_limit_delay)
-
-async def scrape_for_pdfs(url, download_dir, concurrent_pages, concurrent_downloads, max_downloads_param, min_delay, max_delay, max_requests_per_minute, user_agent, visited_urls, pdf_log_file, completed_page_log_file, temp_file, batch_file, semaphore, session):  # **Added session parameter**
-    global max_downloads
-    max_downloads = max_downloads_param  # Set the global max_downloads
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-
-        async def navigate_and_scrape(url):
-            async with download_count_lock:
-                if download_count >= max_downloads:
-                    return
-
-            page = await browser.new_page(user_agent=user_agent)
-            try:
-                # Navigate to the page
-                await page.goto(url, timeout=60000)  # 60 seconds timeout
-
-                # Scraping for PDF links
-                pdf_links = await page.evaluate('''Array.from(document.querySelectorAll('a[href$=".pdf"]')).map(a => a.href)''')
-                pdf_links = list(set(pdf_links))  # Remove duplicates
-
-                # Filter based on remaining max_downloads
-                async with download_count_lock:
-                    remaining_downloads = max_downloads - download_count
-                if len(pdf_links) > remaining_downloads:
-                    pdf_links = pdf_links[:remaining_downloads]
-
-                # Download PDFs while avoiding duplicates based on the temp file
-                async def download_with_semaphore(pdf_url):
-                    async with semaphore:
-                        async with aiofiles.open(temp_file, 'r') as temp_f:
-                            existing_urls = await temp_f.read()
-                        if pdf_url not in existing_urls:
-                            await download_pdf(pdf_url, download_dir, user_agent, min_delay, max_delay, temp_file, batch_file, pdf_log_file)
-
-                # Process PDFs
-                await asyncio.gather(*[download_with_semaphore(pdf_url) for pdf_url in pdf_links])
-
-                # Stop further scraping if the max download count is reached
-                async with download_count_lock:
-                    if download_count >= max_downloads:
-                        return
-
-                # Mark page as completed in the database
-                page_log_entry = CompletedPagesLog(url=url, status="Completed")
-                session.add(page_log_entry)
-                session.commit()
-
-                # Mark page as completed in the log file
-                async with aiofiles.open(completed_page_log_file, 'a') as completed_log:
-                    await completed_log.write(f"Completed: {url}\n")
-
-                # Get all internal links on the page
-                all_links = await page.evaluate('''Array.from(document.querySelectorAll('a[href]')).map(a => a.href)''')
-                for link in all_links:
-                    parsed_link = urlparse(link)
-                    if parsed_link.netloc == urlparse(url).netloc and link not in visited_urls:
-                        visited_urls.add(link)
-                        await navigate_and_scrape(link)
-
-            except Exception as e:
-                print(f"Error navigating to {url}: {e}")
-
-            finally:
-                await page.close()
-
-        # Start scraping from the initial URL
-        await navigate_and_scrape(url)
-
-        await browser.close()
-
-async def main_menu():
+async def main_menu(metrics_file=None, profile_file=None, report_startup=False):
     """Display the main menu and handle user selection."""
+    global config, qa_chain, memory
+
     try:
         config = load_config("config.json")
+        setup_instrumentation(metrics_file, profile_file)
         database_paths = config.get("database_paths", {})
 
+        if report_startup:
+            startup_report()
+
         while True:
             print("\nMain Menu")
             print("1: Chatbot")
@@ -465,20 +648,16 @@ async def main_menu():
             if choice == "1":
                 selected_paths = select_database(database_paths)
                 if selected_paths:
-                    vector_stores = initialize_vector_stores(selected_paths)
-                    qa_chain = RetrievalQA.from_chain_type(
-                        llm=ChatOllama(model="llama2"),
-                        chain_type="stuff",
-                        retriever=vector_stores[0].as_retriever(),
-                        memory=memory,
-                        return_source_documents=True
-                    )
-                    main_loop()
+                    llm = get_llm()
+                    memory = create_memory(llm)
+                    qa_chain = build_qa_chain(database_paths, selected_paths, llm, memory)
+                    main_loop(selected_paths)
             elif choice == "2":
                 print("\nDatabase Management")
                 print("1: Add Database")
                 print("2: Update Database")
                 print("3: Delete Database")
+                print("4: Tune and Compact Database")
                 print("0: Back to Main Menu")
 
                 db_choice = input("Select an option: ").strip()
@@ -488,6 +667,8 @@ async def main_menu():
                     update_database(database_paths)
                 elif db_choice == "3":
                     delete_database(database_paths)
+                elif db_choice == "4":
+                    maintain_database(database_paths)
                 elif db_choice == "0":
                     continue
                 else:
@@ -505,21 +686,96 @@ async def main_menu():
             print("Exiting...")
             exit()
 
-async def main():
-    # Setup database session
-    db_path = os.path.expanduser('~/chatbot/logging/logging_db.sqlite')
-    DATABASE_URL = f'sqlite:///{db_path}'
-    engine = create_engine(DATABASE_URL, echo=True)
-    SessionLocal = sessionmaker(bind=engine)
-
-    # Create the tables if they don't exist
-    Base.metadata.create_all(bind=engine)
+def create_crawl_indexer(database_paths):
+    """Ask for a database to index downloads into, returning a CrawlIndexer or None."""
+    if not database_paths:
+        return None
+
+    print("Index downloaded PDFs into a database as they arrive?")
+    for key, info in database_paths.items():
+        print(f"{key}: {info['name']}")
+    choice = input("Enter a database number (leave empty to skip): ").strip()
+    if not choice:
+        return None
+    if choice not in database_paths:
+        print(f"Invalid Selection '{choice}', downloads will not be indexed.")
+        return None
+
+    info = database_paths[choice]
+    # Databases added before chunk settings were saved have no defaults
+    chunk_size = prompt_int("Enter chunk size", info.get("chunk_size"))
+    overlap = prompt_int("Enter overlap size", info.get("chunk_overlap"))
+    return open_crawl_indexer(info, chunk_size, overlap)
+
+def open_crawl_indexer(info, chunk_size, overlap):
+    """Return a CrawlIndexer that adds downloads to the database described by info."""
+    from langchain_chroma import Chroma
+    from crawl_ingest import CrawlIndexer
+    from ingestion import DEFAULT_BATCH_SIZE
+    from index_manifest import IndexManifest
+    from lexical_index import open_lexical_index
+
+    db_path = info["path"]
+    vector_store = Chroma(persist_directory=db_path, embedding_function=get_embeddings(db_path))
+
+    def invalidate_answers(file_path, chunk_count):
+        # Answers based on the old contents are no longer valid
+        answer_cache().invalidate(db_path)
+
+    print(f"Downloads will be indexed into '{info['name']}'.")
+    return CrawlIndexer(
+        vector_store,
+        IndexManifest(db_path),
+        chunk_size,
+        overlap,
+        batch_size=config.get("ingest_batch_size") or DEFAULT_BATCH_SIZE,
+        max_workers=config.get("crawl_ingest_workers", 2),
+        on_indexed=invalidate_answers,
+        lexical_index=open_lexical_index(db_path, vector_store),
+        dedup=open_dedup(db_path, vector_store),
+    )
 
+async def main():
     url = input("Enter the URL: ")
     download_dir = os.path.expanduser(input("Enter the download directory: "))
     pdf_log_file = os.path.expanduser(input("Enter the PDF log file path (relative to download directory): "))
     completed_page_log_file = os.path.expanduser(input("Enter the completed pages log file path (relative to download directory): "))
 
+    # Optionally index each PDF into a database as soon as it is downloaded
+    indexer = create_crawl_indexer(config.get("database_paths", {}) if config else {})
+
+    settings = {}
+    if url.lower().endswith('.pdf'):
+        print(f"Detected single PDF download: {url}")
+    else:
+        settings["concurrent_pages"] = int(input("Enter the number of concurrent pages to navigate: "))
+        settings["concurrent_downloads"] = int(input("Enter the number of concurrent downloads: "))
+        settings["max_downloads"] = int(input("Enter the maximum number of downloads: "))
+        settings["max_requests_per_minute"] = int(input("Enter the maximum requests per minute: "))
+        max_depth = input("Enter the maximum crawl depth (leave empty for no limit): ").strip()
+        settings["max_depth"] = int(max_depth) if max_depth else None
+    user_agent = input("Enter a User-Agent string (leave empty for random): ")
+    if not url.lower().endswith('.pdf'):
+        strategy = input("Fetch pages with static HTTP, the browser, or auto (static with browser fallback) [auto]: ").strip().lower() or "auto"
+        if strategy not in FETCH_STRATEGIES:
+            print(f"Unknown fetch strategy '{strategy}', using auto.")
+            strategy = "auto"
+        settings["strategy"] = strategy
+
+    await run_crawl(url, download_dir, pdf_log_file, completed_page_log_file, user_agent=user_agent, indexer=indexer, **settings)
+
+async def run_crawl(url, download_dir, pdf_log_file, completed_page_log_file, concurrent_pages=4, concurrent_downloads=4, max_downloads=100, max_requests_per_minute=60, max_depth=None, user_agent=None, strategy="auto", indexer=None):
+    """Download a single PDF, or crawl a site for PDFs, into download_dir.
+
+    Log file paths are relative to download_dir. Downloads are handed to
+    indexer, when given, and it is closed once the crawl finishes.
+    """
+    import aiofiles
+    from crawler import USER_AGENTS, DownloadLimit, download_pdf, scrape_for_pdfs
+    from downloader import PdfDownloader
+    from logging_models import SessionLocal, LogWriter
+    from url_index import UrlIndex
+
     # Ensure the directory for logs and downloads exists
     os.makedirs(download_dir, exist_ok=True)
 
@@ -531,54 +787,286 @@ async def main():
     os.makedirs(os.path.dirname(pdf_log_file), exist_ok=True)
     os.makedirs(os.path.dirname(completed_page_log_file), exist_ok=True)
 
-    # **Initialize database session**
+    if not user_agent:
+        user_agent = random.choice(USER_AGENTS)
+
+    # Initialize database session
     session = SessionLocal()
 
-    # Fetch URLs from the database
-    temp_file_path = os.path.join(download_dir, 'temp_urls.txt')
     batch_file_path = os.path.join(download_dir, 'batch_urls.txt')
 
-    async with aiofiles.open(temp_file_path, 'w') as temp_file:
-        # Fetch completed pages
-        completed_pages = session.query(CompletedPagesLog).filter(CompletedPagesLog.url.like(f"%{urlparse(url).netloc}%")).all()
-        for page in completed_pages:
-            await temp_file.write(f"{page.url}\n")
-        
-        # Fetch downloaded PDFs
-        downloaded_pdfs = session.query(PdfDownloadLog).filter(PdfDownloadLog.url.like(f"%{urlparse(url).netloc}%")).all()
-        for pdf in downloaded_pdfs:
-            await temp_file.write(f"{pdf.url}\n")
+    # Load completed pages and downloaded PDFs from the database once, shared by every crawl task
+    url_index = UrlIndex.load(session, url)
+    session.close()
+    print(f"Loaded {len(url_index)} previously crawled URLs.")
 
-    # Check if URL ends with .pdf
-    if url.lower().endswith('.pdf'):
-        print(f"Detected single PDF download: {url}")
-        user_agent = input("Enter a User-Agent string (leave empty for random): ")
-        if not user_agent:
-            user_agent = random.choice(USER_AGENTS)
-        await download_pdf(url, download_dir, user_agent, 0, 0, temp_file_path, batch_file_path, pdf_log_file)  # No delay for single file
-        # Add single PDF to batch file
-        async with aiofiles.open(batch_file_path, 'a') as batch_file:
-            await batch_file.write(f"{url}\n")
-    else:
-        concurrent_pages = int(input("Enter the number of concurrent pages to navigate: "))
-        concurrent_downloads = int(input("Enter the number of concurrent downloads: "))
-        max_downloads_param = int(input("Enter the maximum number of downloads: "))
-        min_delay = float(input("Enter the minimum delay (in seconds): "))
-        max_delay = float(input("Enter the maximum delay (in seconds): "))
-        max_requests_per_minute = int(input("Enter the maximum requests per minute: "))
-        user_agent = input("Enter a User-Agent string (leave empty for random): ")
-        if not user_agent:
-            user_agent = random.choice(USER_AGENTS)
-
-        visited_urls = set()
-        # **Pass the session object to scrape_for_pdfs**
-        await scrape_for_pdfs(url, download_dir, concurrent_pages, concurrent_downloads, max_downloads_param, min_delay, max_delay, max_requests_per_minute, user_agent, visited_urls, pdf_log_file, completed_page_log_file, temp_file_path, batch_file_path, asyncio.Semaphore(concurrent_downloads), session)  # **Added session parameter**
+    # Completed pages and downloads are written to the database in batches on a background thread
+    log_writer = LogWriter()
+    on_download = indexer.enqueue if indexer else None
+
+    try:
+        # Check if URL ends with .pdf
+        if url.lower().endswith('.pdf'):
+            async with PdfDownloader(download_dir, user_agent) as downloader:
+                await download_pdf(url, downloader, url_index, log_writer, batch_file_path, pdf_log_file, DownloadLimit(max_downloads), on_download=on_download)
+            # Add single PDF to batch file
+            async with aiofiles.open(batch_file_path, 'a') as batch_file:
+                await batch_file.write(f"{url}\n")
+        else:
+            visited_urls = set()
+            await scrape_for_pdfs(url, download_dir, concurrent_pages, concurrent_downloads, max_downloads, max_requests_per_minute, user_agent, visited_urls, pdf_log_file, completed_page_log_file, url_index, batch_file_path, asyncio.Semaphore(concurrent_downloads), log_writer, max_depth=max_depth, strategy=strategy, on_download=on_download)
+    finally:
+        if indexer:
+            if indexer.pending():
+                print(f"Waiting for {indexer.pending()} downloaded file(s) to be indexed...")
+            indexer.close()
+            print(f"Indexed {indexer.indexed_chunks} chunks from {indexer.indexed_files} downloaded file(s).")
+        # Write any log rows still queued
+        log_writer.close()
 
     # Clean up files after processing
-    if os.path.exists(temp_file_path):
-        os.remove(temp_file_path)
     if os.path.exists(batch_file_path):
         os.remove(batch_file_path)
 
+def read_questions(file_path):
+    """Read questions from a JSONL file of {"id": ..., "question": ...} objects."""
+    questions = []
+    with open(file_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            record.setdefault("id", line_number)
+            questions.append(record)
+    return questions
+
+def answer_one(record, selected_paths):
+    """Answer one question record, returning the result row written to the output file."""
+    question = record.get("question") or record.get("query", "")
+    start = time.perf_counter()
+    row = {"id": record["id"], "question": question}
+    try:
+        response, source_docs, cached = answer_query(question, selected_paths)
+        row["answer"] = response
+        row["sources"] = [{"source": doc.metadata.get("source"), "page": doc.metadata.get("page"), "also_in": doc.metadata.get("duplicates", [])} for doc in source_docs]
+        row["cached"] = cached
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - start, 4)
+    return row
+
+def answer_batch(questions, selected_paths, output_path, workers):
+    """Answer questions on a thread pool and write one JSON line per answer, in input order."""
+    from tqdm import tqdm
+
+    start = time.perf_counter()
+    latencies = []
+    errors = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, open(output_path, "w") as output:
+        rows = executor.map(lambda record: answer_one(record, selected_paths), questions)
+        for row in tqdm(rows, total=len(questions), desc="Answering", unit="question"):
+            output.write(json.dumps(row) + "\n")
+            output.flush()
+            latencies.append(row["seconds"])
+            errors += "error" in row
+
+    elapsed = time.perf_counter() - start
+    if latencies:
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Answered {len(latencies)} question(s) in {elapsed:.1f}s ({len(latencies) / elapsed:.2f}/s), p50 {p50:.2f}s, p95 {p95:.2f}s, {errors} error(s).")
+
+def database_entry(database_paths, db_id):
+    """Return the configuration entry for a database ID, exiting with an error if there is none."""
+    if db_id not in database_paths:
+        raise SystemExit(f"Unknown database ID '{db_id}'. Known IDs: {', '.join(database_paths) or 'none'}")
+    return database_paths[db_id]
+
+def build_parser():
+    """Build the command-line parser. Without a subcommand the interactive menu is shown."""
+    parser = argparse.ArgumentParser(description="ScoutAI database management, crawling and batch queries.")
+    parser.add_argument("--metrics", metavar="FILE", help="Save per-stage metrics on exit (.prom for Prometheus text, otherwise JSON)")
+    parser.add_argument("--profile", metavar="FILE", help="Run under cProfile and save the stats on exit")
+    parser.add_argument("--startup-report", action="store_true", help="Print the time to reach the menu and any heavy modules loaded before it")
+    subparsers = parser.add_subparsers(dest="command")
+
+    ingest = subparsers.add_parser("ingest", help="Create a database from a directory of PDFs")
+    ingest.add_argument("--id", required=True, help="Unique ID for the new database")
+    ingest.add_argument("--name", required=True, help="Display name for the new database")
+    ingest.add_argument("--path", required=True, help="Directory to store the database in")
+    ingest.add_argument("--data-dir", required=True, help="Directory containing the PDFs to index")
+    ingest.add_argument("--chunk-size", type=int, required=True)
+    ingest.add_argument("--chunk-overlap", type=int, required=True)
+    ingest.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Embedding backend")
+
+    update = subparsers.add_parser("update", help="Index new and changed PDFs into an existing database")
+    update.add_argument("--id", required=True, help="ID of the database to update")
+    update.add_argument("--data-dir", required=True, help="Directory containing the PDFs to index")
+    update.add_argument("--chunk-size", type=int, help="Defaults to the database's current setting")
+    update.add_argument("--chunk-overlap", type=int, help="Defaults to the database's current setting")
+
+    maintain = subparsers.add_parser("maintain", help="Measure recall@k of a database's vector index and rebuild it with new HNSW settings")
+    maintain.add_argument("--id", required=True, help="ID of the database to maintain")
+    maintain.add_argument("--m", type=int, help="HNSW links per node")
+    maintain.add_argument("--construction-ef", type=int, help="HNSW candidates considered while building")
+    maintain.add_argument("--search-ef", type=int, help="HNSW candidates considered per query")
+    maintain.add_argument("--k", type=int, default=10, help="Results per query compared with exact search")
+    maintain.add_argument("--samples", type=int, default=100, help="Stored chunks used as sample queries")
+    maintain.add_argument("--measure-only", action="store_true", help="Report recall and latency without rebuilding")
+    maintain.add_argument("--keep-stale", action="store_true", help="Copy chunks the manifest no longer lists when rebuilding")
+    maintain.add_argument("--output", help="JSON file to write the report to")
+
+    crawl = subparsers.add_parser("crawl", help="Crawl a site, or download a single PDF URL")
+    crawl.add_argument("url")
+    crawl.add_argument("--download-dir", required=True)
+    crawl.add_argument("--pdf-log", default="pdf_log.txt", help="PDF log file, relative to the download directory")
+    crawl.add_argument("--pages-log", default="completed_pages.txt", help="Completed pages log file, relative to the download directory")
+    crawl.add_argument("--concurrent-pages", type=int, default=4)
+    crawl.add_argument("--concurrent-downloads", type=int, default=4)
+    crawl.add_argument("--max-downloads", type=int, default=100)
+    crawl.add_argument("--max-rpm", type=int, default=60, help="Maximum requests per minute per host")
+    crawl.add_argument("--max-depth", type=int, help="Maximum link depth, no limit by default")
+    crawl.add_argument("--user-agent", help="User-Agent header, random by default")
+    crawl.add_argument("--strategy", choices=FETCH_STRATEGIES, default="auto", help="How pages are fetched")
+    crawl.add_argument("--index-into", metavar="ID", help="Index downloads into this database as they arrive")
+
+    query = subparsers.add_parser("query", help="Answer a JSONL file of questions")
+    query.add_argument("--db", required=True, help="Comma-separated IDs of the databases to search")
+    query.add_argument("--input", required=True, help='JSONL file with one {"id": ..., "question": ...} per line')
+    query.add_argument("--output", required=True, help="JSONL file to write answers and timings to")
+    query.add_argument("--workers", type=int, default=4, help="Questions answered at the same time")
+
+    serve = subparsers.add_parser("serve", help="Serve queries over HTTP with warm models")
+    serve.add_argument("--db", required=True, help="Comma-separated IDs of the databases to search")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--workers", type=int, default=4, help="Queries retrieved and answered at the same time")
+    serve.add_argument("--max-queue", type=int, default=64, help="Queries accepted at once before answering 503")
+    serve.add_argument("--fake-llm", action="store_true", help="Answer with a stub model instead of Ollama, for local testing")
+
+    return parser
+
+def create_query_service(database_paths, selected_ids, args):
+    """Load the selected databases and models once and wrap them in a QueryService."""
+    from langchain_chroma import Chroma
+    from langchain_core.prompts import PromptTemplate
+    from ingestion import DEFAULT_BATCH_SIZE, index_directory
+    from index_manifest import IndexManifest
+    from lexical_index import open_lexical_index
+    from server import QueryService
+
+    selected_paths = [database_entry(database_paths, db_id)["path"] for db_id in selected_ids]
+    retriever = build_retriever(database_paths, selected_paths)
+    stores = dict(zip(selected_paths, retriever.vector_stores))
+    lexical_indexes = dict(zip(selected_paths, retriever.lexical_indexes or [None] * len(selected_paths)))
+
+    def ingest(database_id, directory, chunk_size=None, chunk_overlap=None):
+        # Served databases are updated through their warm store and lexical index so queries see the changes
+        # database_entry() exits the process for an unknown ID, which must not stop the server
+        if database_id not in database_paths:
+            raise ValueError(f"Unknown database ID '{database_id}'")
+        db_info = database_paths[database_id]
+        db_path = db_info["path"]
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            raise ValueError(f"The directory '{directory}' does not exist.")
+        chunk_size = chunk_size or db_info.get("chunk_size")
+        chunk_overlap = chunk_overlap if chunk_overlap is not None else db_info.get("chunk_overlap")
+        if chunk_size is None or chunk_overlap is None:
+            raise ValueError("This database has no saved chunk settings, pass chunk_size and chunk_overlap.")
+
+        vector_store = stores.get(db_path) or Chroma(persist_directory=db_path, embedding_function=get_embeddings(db_path))
+        lexical_index = lexical_indexes.get(db_path) or open_lexical_index(db_path, vector_store)
+        result = index_directory(
+            vector_store, IndexManifest(db_path), directory, chunk_size, chunk_overlap,
+            batch_size=config.get("ingest_batch_size") or DEFAULT_BATCH_SIZE,
+            max_workers=config.get("ingest_workers"), lexical_index=lexical_index,
+            dedup=open_dedup(db_path, vector_store)
+        )
+        answer_cache().invalidate(db_path)
+        return result
+
+    prompt = PromptTemplate(template=QA_PROMPT_TEMPLATE, input_variables=["history", "context", "question"])
+    fake_responses = ["This is a stubbed answer."] if args.fake_llm else None
+    service = QueryService(
+        retriever, get_llm(fake_responses), prompt, selected_paths, names=retriever.names,
+        answer_cache=answer_cache(), ingest=ingest, max_workers=args.workers, max_queue=args.max_queue,
+        embed_batch_size=config.get("embedding", {}).get("batch_size", 32)
+    )
+    service.warm_up()
+    return service
+
+async def run_cli(args):
+    """Run one subcommand without prompting."""
+    global config, qa_chain, memory
+
+    config = load_config("config.json")
+    setup_instrumentation(args.metrics, args.profile)
+    database_paths = config.get("database_paths", {})
+
+    if args.command == "ingest":
+        if args.id in database_paths:
+            raise SystemExit(f"Database ID '{args.id}' already exists.")
+        if not os.path.isdir(os.path.expanduser(args.data_dir)):
+            raise SystemExit(f"The directory '{args.data_dir}' does not exist.")
+        new_path = os.path.expanduser(args.path)
+        ensure_directory_exists(new_path)
+        create_database(database_paths, args.id, args.name, new_path, args.chunk_size, args.chunk_overlap, os.path.expanduser(args.data_dir), args.backend)
+
+    elif args.command == "update":
+        db_info = database_entry(database_paths, args.id)
+        if not os.path.isdir(os.path.expanduser(args.data_dir)):
+            raise SystemExit(f"The directory '{args.data_dir}' does not exist.")
+        chunk_size = args.chunk_size or db_info.get("chunk_size")
+        overlap = args.chunk_overlap if args.chunk_overlap is not None else db_info.get("chunk_overlap")
+        if chunk_size is None or overlap is None:
+            raise SystemExit("This database has no saved chunk settings, pass --chunk-size and --chunk-overlap.")
+        update_database_entry(database_paths, db_info, os.path.expanduser(args.data_dir), chunk_size, overlap)
+
+    elif args.command == "maintain":
+        db_info = database_entry(database_paths, args.id)
+        hnsw = None if args.measure_only else {"M": args.m, "construction_ef": args.construction_ef, "search_ef": args.search_ef}
+        report = maintain_database_entry(database_paths, db_info, hnsw, args.k, args.samples, compact=not args.keep_stale)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+    elif args.command == "crawl":
+        indexer = None
+        if args.index_into:
+            info = database_entry(database_paths, args.index_into)
+            if info.get("chunk_size") is None or info.get("chunk_overlap") is None:
+                raise SystemExit("This database has no saved chunk settings, run update with --chunk-size and --chunk-overlap first.")
+            indexer = open_crawl_indexer(info, info.get("chunk_size"), info.get("chunk_overlap"))
+        await run_crawl(
+            args.url, os.path.expanduser(args.download_dir), args.pdf_log, args.pages_log,
+            concurrent_pages=args.concurrent_pages, concurrent_downloads=args.concurrent_downloads,
+            max_downloads=args.max_downloads, max_requests_per_minute=args.max_rpm, max_depth=args.max_depth,
+            user_agent=args.user_agent, strategy=args.strategy, indexer=indexer
+        )
+
+    elif args.command == "query":
+        selected_paths = [database_entry(database_paths, db_id.strip())["path"] for db_id in args.db.split(",")]
+        questions = read_questions(args.input)
+        llm = get_llm()
+        # Batch questions are independent, so no conversation history is kept
+        from conversation_memory import TokenBudgetMemory
+        memory = TokenBudgetMemory()
+        qa_chain = build_qa_chain(database_paths, selected_paths, llm, memory)
+        answer_batch(questions, selected_paths, args.output, args.workers)
+
+    elif args.command == "serve":
+        service = create_query_service(database_paths, [db_id.strip() for db_id in args.db.split(",")], args)
+        from server import run_server
+        await run_server(service, args.host, args.port)
+
 if __name__ == "__main__":
-    asyncio.run(main_menu())
+    args = build_parser().parse_args()
+    if args.command:
+        asyncio.run(run_cli(args))
+    else:
+        asyncio.run(main_menu(args.metrics, args.profile, args.startup_report))
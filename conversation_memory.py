@@ -0,0 +1,138 @@
+"""Conversation memory kept under a fixed token budget.
+
+Only the most recent turns that fit in the budget are passed to the LLM.
+Older turns are either dropped or, when an LLM is given, folded into a short
+running summary. Sessions can be saved to ~/chatbot/sessions so a
+conversation can be picked up again later.
+"""
+import os
+import json
+import re
+
+SESSIONS_DIR = os.path.expanduser('~/chatbot/sessions')
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in no more than {words} words, keeping names, "
+    "numbers and any facts the user may refer back to.\n\n"
+    "Earlier summary:\n{summary}\n\nNew turns:\n{turns}\n\nSummary:"
+)
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when it is available, otherwise estimate."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def _format_turn(query, response):
+    return f"User: {query}\nScoutAI: {response}"
+
+
+def session_path(name):
+    """Return the file used to persist a named session."""
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+    return os.path.join(SESSIONS_DIR, f"{safe_name}.json")
+
+
+class TokenBudgetMemory:
+    """Sliding window of conversation turns that never exceeds max_tokens."""
+
+    def __init__(self, max_tokens=1000, llm=None, summary_tokens=None, path=None):
+        self.max_tokens = max_tokens
+        self.llm = llm
+        # A quarter of the budget goes to the summary of evicted turns when summarizing
+        self.summary_tokens = summary_tokens or max_tokens // 4
+        self.path = path
+        self.turns = []  # (query, response, tokens)
+        self.summary = ""
+        self._turn_tokens = 0
+
+        if path and os.path.isfile(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        self.summary = data.get("summary", "")
+        for query, response in data.get("turns", []):
+            self.turns.append((query, response, count_tokens(_format_turn(query, response))))
+        self._turn_tokens = sum(tokens for _, _, tokens in self.turns)
+        self._trim()
+
+    def save(self):
+        """Write the session to disk atomically."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"summary": self.summary, "turns": [[q, r] for q, r, _ in self.turns]}, f, indent=4)
+        os.replace(temp_path, self.path)
+
+    def add_turn(self, query, response):
+        """Record a turn, evicting the oldest turns once the budget is exceeded."""
+        tokens = count_tokens(_format_turn(query, response))
+        self.turns.append((query, response, tokens))
+        self._turn_tokens += tokens
+        self._trim()
+        self.save()
+
+    def _budget(self):
+        return self.max_tokens - (count_tokens(self.summary) if self.summary else 0)
+
+    def _trim(self):
+        evicted = []
+        while self.turns and self._turn_tokens > self._budget():
+            query, response, tokens = self.turns.pop(0)
+            self._turn_tokens -= tokens
+            evicted.append(_format_turn(query, response))
+
+        if evicted and self.llm is not None:
+            self._summarize(evicted)
+
+    def _summarize(self, evicted):
+        """Fold evicted turns into the running summary, keeping it within summary_tokens."""
+        prompt = SUMMARY_PROMPT.format(
+            words=max(self.summary_tokens * 3 // 4, 20),
+            summary=self.summary or "(none)",
+            turns="\n\n".join(evicted),
+        )
+        try:
+            result = self.llm.invoke(prompt)
+            summary = getattr(result, "content", result).strip()
+        except Exception as e:
+            print(f"Could not summarize earlier turns: {e}")
+            return
+
+        # Cut the summary down if the model ignored the length limit
+        while summary and count_tokens(summary) > self.summary_tokens:
+            summary = summary[:int(len(summary) * 0.9)]
+        self.summary = summary
+
+        # A longer summary leaves less room for turns
+        while self.turns and self._turn_tokens > self._budget():
+            _, _, tokens = self.turns.pop(0)
+            self._turn_tokens -= tokens
+
+    def has_history(self):
+        """Return True once the prompt would include earlier turns or a summary."""
+        return bool(self.turns or self.summary)
+
+    def render(self):
+        """Return the history text to include in the prompt."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation: {self.summary}")
+        parts.extend(_format_turn(query, response) for query, response, _ in self.turns)
+        return "\n\n".join(parts) if parts else "(no previous conversation)"
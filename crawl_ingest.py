@@ -0,0 +1,149 @@
+"""Index PDFs into a database while a crawl is still downloading them.
+
+Each finished download is handed to a CrawlIndexer. Parsing starts at once in
+a process pool, so it never competes with the crawler's event loop, and a
+background thread embeds the chunks and writes them to Chroma in download
+order. A file can be queried a few seconds after it lands on disk instead of
+after the crawl and a separate database update.
+
+Files are recorded in the database's IndexManifest with the same chunk IDs a
+regular update would produce, so a later "Update Database" on the download
+directory skips everything that was already indexed here.
+"""
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ingestion import DEFAULT_BATCH_SIZE, load_and_split_file, record_file_timings, tag_chunks, delete_chunks, release_orphans
+from instrumentation import span, increment
+
+
+class CrawlIndexer:
+    """Background queue that parses, embeds and adds downloaded PDFs to a vector store.
+
+    on_indexed(file_path, chunk_count) is called from the background thread
+    after each file has been written. A lexical_index is updated with every
+    file and saved at most every lexical_save_interval seconds and on close.
+    A dedup index drops repeated chunks before they are embedded and is saved
+    on the same schedule.
+    """
+
+    def __init__(self, vector_store, manifest, chunk_size, chunk_overlap, batch_size=DEFAULT_BATCH_SIZE, max_workers=2, on_indexed=None, lexical_index=None, lexical_save_interval=30.0, dedup=None):
+        self.vector_store = vector_store
+        self.manifest = manifest
+        self.lexical_index = lexical_index
+        self.dedup = dedup
+        self.lexical_save_interval = lexical_save_interval
+        self._lexical_saved = time.monotonic()
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.on_indexed = on_indexed
+        self.indexed_files = 0
+        self.indexed_chunks = 0
+        # Spawn keeps workers independent of the crawler's threads and event loop
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="crawl-indexer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, file_path):
+        """Start indexing a downloaded file. Returns immediately."""
+        file_path = os.path.abspath(file_path)
+        future = self._executor.submit(load_and_split_file, file_path, self.chunk_size, self.chunk_overlap)
+        self._queue.put((file_path, future, time.monotonic()))
+
+    def pending(self):
+        """Return the number of files waiting to be written."""
+        return self._queue.qsize()
+
+    def close(self):
+        """Finish indexing every queued file, then stop the workers."""
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown()
+        self.manifest.save()
+        if self.lexical_index is not None and self.lexical_index.dirty:
+            self.lexical_index.save()
+        if self.dedup is not None:
+            self.dedup.save()
+            print(self.dedup.report())
+
+    def _run(self):
+        closing = False
+        while not (closing and self._queue.empty()):
+            item = self._queue.get()
+            if item is None:
+                # Orphans re-queued by _index can land behind the sentinel, so stop only once the queue is empty
+                closing = True
+                continue
+            file_path, future, queued_at = item
+            try:
+                self._index(file_path, future.result(), queued_at)
+            except Exception as e:
+                print(f"Error indexing '{file_path}': {e}")
+
+    def _index(self, file_path, result, queued_at):
+        _, chunks, error, timings = result
+        record_file_timings(timings)
+        if error:
+            print(f"Skipping '{file_path}': {error}")
+            return
+
+        changed, _ = self.manifest.plan([file_path], os.path.dirname(file_path), self.chunk_size, self.chunk_overlap)
+        if not changed:
+            # Same content as the copy already indexed
+            return
+        state = changed[0]
+
+        chunk_ids = tag_chunks(state, chunks)
+        old_ids = self.manifest.chunk_ids(file_path)
+        orphans = []
+        if self.dedup is not None:
+            # The previous version's chunks are replaced, so files that duplicated them are indexed again
+            self.manifest.forget(file_path)
+            self.dedup.forget_file(file_path)
+            orphans, orphan_ids = release_orphans(self.manifest, self.dedup, set(self.manifest.files))
+            old_ids += orphan_ids
+            chunks = self.dedup.filter(file_path, chunks)
+            chunk_ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+
+        new_ids = set(chunk_ids)
+        stale_ids = [chunk_id for chunk_id in old_ids if chunk_id not in new_ids]
+        if stale_ids:
+            delete_chunks(self.vector_store, stale_ids, lexical_index=self.lexical_index)
+
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            with span("chroma_add"):
+                self.vector_store.add_documents(batch, ids=chunk_ids[start:start + self.batch_size])
+            increment("chunks_written", len(batch))
+            if self.lexical_index is not None:
+                self.lexical_index.add_documents(batch)
+
+        self.manifest.record(state, chunk_ids, self.chunk_size, self.chunk_overlap)
+        self.manifest.save()
+        if time.monotonic() - self._lexical_saved >= self.lexical_save_interval:
+            # Rewriting the whole index after every file would cost more than the file itself
+            if self.lexical_index is not None:
+                self.lexical_index.save()
+            if self.dedup is not None:
+                self.dedup.save()
+            self._lexical_saved = time.monotonic()
+        self.indexed_files += 1
+        self.indexed_chunks += len(chunks)
+
+        print(f"Indexed: {file_path} ({len(chunks)} chunks, {time.monotonic() - queued_at:.1f}s after download)")
+        if self.on_indexed:
+            self.on_indexed(file_path, len(chunks))
+        for orphan in orphans:
+            self.enqueue(orphan.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,276 @@
+"""Crawl a site for PDF links and download them.
+
+Pages are visited breadth-first from a shared frontier by a fixed number of
+workers, so crawl throughput scales with the concurrent pages setting and
+deep sites never recurse. Pages are fetched over plain HTTP where possible and
+rendered in Playwright only when they need JavaScript. Navigations
+and downloads share one HostRateLimiter, which paces requests per host at up
+to max_requests_per_minute and backs off when a site answers 429 or 503.
+"""
+import asyncio
+import itertools
+from urllib.parse import urlparse, urldefrag
+
+import aiofiles
+
+import static_fetch
+from static_fetch import FETCH_STRATEGIES
+from downloader import PdfDownloader
+from rate_limiter import HostRateLimiter, THROTTLE_STATUSES
+from instrumentation import span, increment
+
+# Pre-configured User-Agent strings
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:90.0) Gecko/20100101 Firefox/90.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edg/91.0.864.48"
+]
+
+# Times a page throttled with 429/503 is put back on the frontier
+MAX_PAGE_RETRIES = 3
+
+class DownloadLimit:
+    """Counts the downloads started by one crawl against its maximum."""
+
+    def __init__(self, max_downloads):
+        self.max_downloads = max_downloads
+        self.count = 0
+        self.lock = asyncio.Lock()
+
+    async def take(self):
+        """Count one more download, or return False if the maximum was already reached."""
+        async with self.lock:
+            if self.count >= self.max_downloads:
+                return False
+            self.count += 1
+            return True
+
+    async def release(self):
+        """Give back a download that fetched nothing, such as an unchanged PDF."""
+        async with self.lock:
+            self.count -= 1
+
+    async def remaining(self):
+        async with self.lock:
+            return max(0, self.max_downloads - self.count)
+
+    async def reached(self):
+        """Return True once the maximum number of downloads has been started."""
+        return await self.remaining() == 0
+
+async def download_pdf(pdf_url, downloader, url_index, log_writer, batch_file, pdf_log_file, limit, on_download=None):
+    """Download one PDF if limit allows another. on_download(file_path) is called after a new or changed file is saved."""
+    if not await limit.take():
+        url_index.release(pdf_url)
+        return
+
+    try:
+        status, file_path = await downloader.download(pdf_url)
+
+        # Later tasks and later runs skip this URL
+        url_index.add(pdf_url)
+
+        if status == "not_modified":
+            # Checking an earlier download does not use up the crawl's limit
+            await limit.release()
+            print(f"Unchanged: {file_path}")
+            log_writer.log_pdf(pdf_url, status="Not Modified")
+        else:
+            print(f"Downloaded: {file_path}")
+            log_writer.log_pdf(pdf_url, status="Downloaded")
+
+            # Log the successful download
+            async with aiofiles.open(batch_file, 'a') as batch:
+                await batch.write(f"{pdf_url}\n")
+
+            async with aiofiles.open(pdf_log_file, 'a') as log:
+                await log.write(f"Successfully downloaded: {pdf_url}\n")
+
+            if on_download:
+                on_download(file_path)
+
+    except Exception as e:
+        print(f"Error downloading PDF: {e}")
+        # Let a later link to the same PDF try again
+        url_index.release(pdf_url)
+
+async def scrape_for_pdfs(url, download_dir, concurrent_pages, concurrent_downloads, max_downloads_param, max_requests_per_minute, user_agent, visited_urls, pdf_log_file, completed_page_log_file, url_index, batch_file, semaphore, log_writer, max_depth=None, downloader=None, strategy="auto", on_download=None):
+    """Crawl from url breadth-first with concurrent_pages workers, downloading every PDF found.
+
+    Links more than max_depth clicks away from the start page are not followed;
+    None means no limit. PDFs already in url_index are skipped unless an
+    earlier download can be revalidated with a conditional GET, and completed
+    pages and downloads are recorded through log_writer. Downloads share one
+    PdfDownloader, created here when none is passed in.
+
+    strategy is one of FETCH_STRATEGIES. "static" fetches pages over the
+    downloader's HTTP session and parses links without running JavaScript,
+    "browser" renders every page in Playwright, and "auto" fetches statically
+    and only renders pages that look like they need JavaScript. Playwright is
+    started the first time a page needs it.
+
+    on_download(file_path) is called for every new or changed PDF, which lets
+    a CrawlIndexer index files while the crawl continues.
+    """
+    if strategy not in FETCH_STRATEGIES:
+        raise ValueError(f"Unknown fetch strategy {strategy!r}, expected one of {FETCH_STRATEGIES}")
+
+    if downloader is None:
+        rate_limiter = HostRateLimiter(max_requests_per_minute)
+        async with PdfDownloader(download_dir, user_agent, max_connections=concurrent_downloads + concurrent_pages, max_connections_per_host=concurrent_downloads + concurrent_pages, rate_limiter=rate_limiter) as downloader:
+            return await scrape_for_pdfs(url, download_dir, concurrent_pages, concurrent_downloads, max_downloads_param, max_requests_per_minute, user_agent, visited_urls, pdf_log_file, completed_page_log_file, url_index, batch_file, semaphore, log_writer, max_depth=max_depth, downloader=downloader, strategy=strategy, on_download=on_download)
+
+    # Page fetches are paced by the same limiter as the downloads
+    if downloader.rate_limiter is None:
+        downloader.rate_limiter = HostRateLimiter(max_requests_per_minute)
+    rate_limiter = downloader.rate_limiter
+    page_retries = {}
+    fetch_counts = {"static": 0, "browser": 0}
+
+    # Each crawl counts its own downloads, so a second crawl in the same process starts from zero
+    limit = DownloadLimit(max_downloads_param)
+
+    # Pages are ordered by depth, then discovery order, which gives a breadth-first crawl
+    frontier = asyncio.PriorityQueue()
+    order = itertools.count()
+    start_url = urldefrag(url)[0]
+    visited_urls.add(start_url)
+    frontier.put_nowait((0, next(order), start_url))
+
+    # Playwright and Chromium are only started if a page has to be rendered
+    playwright = None
+    browser = None
+    browser_lock = asyncio.Lock()
+
+    async def get_browser():
+        nonlocal playwright, browser
+        async with browser_lock:
+            if browser is None:
+                # Imported here so crawls that never need a browser don't load Playwright
+                from playwright.async_api import async_playwright
+                playwright = await async_playwright().start()
+                browser = await playwright.chromium.launch(headless=True)
+        return browser
+
+    def throttled(url, depth, status, headers):
+        """Record a response with the limiter and requeue the page if it was throttled."""
+        rate_limiter.record(url, status, headers.get("retry-after"))
+        if status not in THROTTLE_STATUSES:
+            return False
+        # Try the page again later, after the limiter's back-off
+        page_retries[url] = page_retries.get(url, 0) + 1
+        if page_retries[url] <= MAX_PAGE_RETRIES:
+            frontier.put_nowait((depth, next(order), url))
+        return True
+
+    async def fetch_with_browser(state, url, depth):
+        page = state.get("page")
+        if page is None or page.is_closed():
+            page = state["page"] = await (await get_browser()).new_page(user_agent=user_agent)
+
+        # Navigate to the page once the host's rate allows it
+        await rate_limiter.acquire(url)
+        with span("page_fetch", method="browser"):
+            response = await page.goto(url, timeout=60000)  # 60 seconds timeout
+        if response is not None and throttled(url, depth, response.status, response.headers):
+            return None
+
+        fetch_counts["browser"] += 1
+        increment("pages_fetched", method="browser")
+        return await page.evaluate('''Array.from(document.querySelectorAll('a[href]')).map(a => a.href)''')
+
+    async def fetch_links(state, url, depth):
+        """Return the links on a page, or None if it should not be processed now."""
+        if strategy == "browser":
+            return await fetch_with_browser(state, url, depth)
+
+        await rate_limiter.acquire(url)
+        with span("page_fetch", method="static"):
+            status, headers, links, needs_browser = await static_fetch.fetch_links(downloader.session, url)
+        if throttled(url, depth, status, headers):
+            return None
+        if strategy == "auto" and needs_browser:
+            return await fetch_with_browser(state, url, depth)
+        fetch_counts["static"] += 1
+        increment("pages_fetched", method="static")
+        return links
+
+    async def scrape_page(state, url, depth):
+        all_links = await fetch_links(state, url, depth)
+        if all_links is None:
+            return
+        all_links = [urldefrag(link)[0] for link in all_links]
+
+        # Scraping for PDF links
+        pdf_links = list(dict.fromkeys(link for link in all_links if link.endswith(".pdf")))  # Remove duplicates
+
+        # Filter based on remaining max_downloads
+        remaining_downloads = await limit.remaining()
+        if len(pdf_links) > remaining_downloads:
+            pdf_links = pdf_links[:remaining_downloads]
+
+        # Download PDFs while avoiding duplicates, claiming each URL so concurrent pages don't fetch it twice
+        async def download_with_semaphore(pdf_url):
+            # PDFs from earlier crawls are fetched again conditionally when their validators are known
+            if url_index.claim(pdf_url, revalidate=downloader.can_revalidate(pdf_url)):
+                async with semaphore:
+                    await download_pdf(pdf_url, downloader, url_index, log_writer, batch_file, pdf_log_file, limit, on_download=on_download)
+
+        # Process PDFs
+        await asyncio.gather(*[download_with_semaphore(pdf_url) for pdf_url in pdf_links])
+
+        # Stop further scraping if the max download count is reached
+        if await limit.reached():
+            return
+
+        # Mark page as completed in the database, written in batches off the event loop
+        log_writer.log_page(url)
+
+        # Mark page as completed in the log file
+        async with aiofiles.open(completed_page_log_file, 'a') as completed_log:
+            await completed_log.write(f"Completed: {url}\n")
+
+        if max_depth is not None and depth >= max_depth:
+            return
+
+        # Queue all internal links on the page, PDFs are downloaded above and never visited as pages
+        netloc = urlparse(url).netloc
+        for link in all_links:
+            if urlparse(link).netloc == netloc and not link.endswith(".pdf") and link not in visited_urls:
+                visited_urls.add(link)
+                frontier.put_nowait((depth + 1, next(order), link))
+
+    async def worker():
+        # A worker that falls back to the browser keeps one page open and reuses it
+        state = {}
+        try:
+            while True:
+                depth, _, page_url = await frontier.get()
+                try:
+                    # Once the limit is reached the remaining frontier is drained without visiting
+                    if not await limit.reached():
+                        await scrape_page(state, page_url, depth)
+                except Exception as e:
+                    print(f"Error navigating to {page_url}: {e}")
+                finally:
+                    frontier.task_done()
+        finally:
+            if state.get("page") is not None:
+                await state["page"].close()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrent_pages))]
+
+    try:
+        # Wait until every queued page has been handled, then stop the idle workers
+        await frontier.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        if browser is not None:
+            await browser.close()
+            await playwright.stop()
+
+    print(f"Fetched {fetch_counts['static']} pages over HTTP and {fetch_counts['browser']} in the browser")
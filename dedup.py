@@ -0,0 +1,365 @@
+"""Removal of exact and near-duplicate chunks before they are embedded.
+
+Crawled PDFs repeat a lot of text: cover pages, headers and footers, and
+revised editions of the same manual. Every chunk is checked against the
+chunks already stored in its database before it is embedded:
+
+- exact duplicates have the same text after lowercasing and collapsing
+  whitespace, matched by hash;
+- near duplicates share most of their word 5-grams, estimated with a MinHash
+  signature and found through locality-sensitive hashing on its bands.
+
+Only the first copy, the canonical chunk, is embedded and written. Every
+dropped chunk is recorded against its source file with the ID of the chunk
+it duplicates, in dedup_index.bin next to the database. DuplicateSources
+reads those records back so references can list every file a stored chunk
+stands for.
+
+When a canonical chunk is deleted because its file was removed or changed,
+the files whose chunks were collapsed into it are reported by
+orphaned_files() and indexed again.
+"""
+import os
+import re
+import json
+import struct
+import hashlib
+from array import array
+
+from instrumentation import increment
+
+INDEX_FILE = "dedup_index.bin"
+_MAGIC = b"DEDUPIX1"
+
+# MinHash signature length, split into BANDS bands of ROWS values for LSH.
+# Chunks pass the band test with probability 1 - (1 - s^ROWS)^BANDS at
+# similarity s: about 0.92 at 0.85 and 0.99 at 0.9.
+NUM_HASHES = 64
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+
+SHINGLE_WORDS = 5
+
+# Chunks with fewer shingles than this are only matched exactly, short texts
+# like "Page 3 of 10" differ by one word and are not duplicates
+MIN_SHINGLES = 10
+
+DEFAULT_THRESHOLD = 0.85
+
+# Documents read from Chroma at a time when building an index for an existing database
+BUILD_BATCH_SIZE = 5000
+
+_WORD_PATTERN = re.compile(r"\w+")
+_EMPTY = 1 << 32
+_MASK = 0xFFFFFFFF
+
+
+def normalize(text):
+    """Lowercase a text and collapse its whitespace."""
+    return " ".join(text.lower().split())
+
+
+def content_hash(text):
+    """Return the hex digest exact duplicates are matched by."""
+    return hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def shingles(text):
+    """Return the set of word 5-grams of a text, or the whole text if it is shorter."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(shingle_set):
+    """Return a MinHash signature of NUM_HASHES 32-bit values as bytes.
+
+    Uses one-permutation hashing: each shingle is hashed once, the low bits
+    pick a bin and the bin keeps the smallest high bits. Empty bins borrow
+    from the next filled one so short texts still get a full signature.
+    """
+    bins = [_EMPTY] * NUM_HASHES
+    for shingle in shingle_set:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        index = h % NUM_HASHES
+        value = h >> 32
+        if value < bins[index]:
+            bins[index] = value
+
+    filled = [i for i, value in enumerate(bins) if value != _EMPTY]
+    if filled and len(filled) < NUM_HASHES:
+        for i in range(NUM_HASHES):
+            if bins[i] == _EMPTY:
+                distance = next(d for d in range(1, NUM_HASHES) if bins[(i + d) % NUM_HASHES] != _EMPTY)
+                bins[i] = (bins[(i + distance) % NUM_HASHES] + distance * 0x9E3779B1) & _MASK
+    return array("I", (value & _MASK for value in bins)).tobytes()
+
+
+def similarity(signature_a, signature_b):
+    """Estimate the Jaccard similarity of two texts from their signatures."""
+    a = memoryview(signature_a).cast("I")
+    b = memoryview(signature_b).cast("I")
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def _band_keys(signature):
+    size = ROWS * 4
+    return [hash(signature[band * size:(band + 1) * size]) for band in range(BANDS)]
+
+
+class DedupIndex:
+    """Hashes and signatures of one database's stored chunks, and the chunks dropped as their duplicates.
+
+    others maps the paths of other databases to their DedupIndex; chunks
+    already stored in one of them are dropped too. Those chunks are then
+    only found when both databases are queried together.
+    """
+
+    def __init__(self, db_path, threshold=DEFAULT_THRESHOLD, near_duplicates=True, others=None):
+        self.db_path = os.path.expanduser(db_path)
+        self.path = os.path.join(self.db_path, INDEX_FILE)
+        self.threshold = threshold
+        self.near_duplicates = near_duplicates
+        self.others = others or {}
+        self.signatures = {}  # Chunk ID -> MinHash signature
+        self.hashes = {}  # Content hash -> chunk ID
+        self.chunk_hashes = {}  # Chunk ID -> content hash
+        self.files = {}  # Source path -> IDs of its stored chunks
+        self.dropped = {}  # Source path -> records of its dropped chunks
+        self._bands = [{} for _ in range(BANDS)]  # Band hash -> chunk IDs
+        self.stats = {"checked": 0, "exact": 0, "near": 0}
+        self.dirty = False
+        if os.path.isfile(self.path):
+            self._load()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.signatures
+
+    def add(self, chunk_id, source, text, signature=None):
+        """Record a stored chunk as canonical."""
+        if signature is None:
+            signature = minhash(shingles(text))
+        digest = content_hash(text)
+        self.signatures[chunk_id] = signature
+        self.hashes.setdefault(digest, chunk_id)
+        self.chunk_hashes[chunk_id] = digest
+        self.files.setdefault(source, []).append(chunk_id)
+        for band, key in zip(self._bands, _band_keys(signature)):
+            band.setdefault(key, []).append(chunk_id)
+        self.dirty = True
+
+    def _remove(self, chunk_id):
+        signature = self.signatures.pop(chunk_id, None)
+        if signature is None:
+            return
+        digest = self.chunk_hashes.pop(chunk_id)
+        if self.hashes.get(digest) == chunk_id:
+            del self.hashes[digest]
+        for band, key in zip(self._bands, _band_keys(signature)):
+            ids = band.get(key)
+            if ids and chunk_id in ids:
+                ids.remove(chunk_id)
+                if not ids:
+                    del band[key]
+
+    def forget_file(self, source):
+        """Drop a file's stored chunks and the record of its duplicates."""
+        for chunk_id in self.files.pop(source, []):
+            self._remove(chunk_id)
+        self.dropped.pop(source, None)
+        self.dirty = True
+
+    def paths(self):
+        """Return every source file with stored or dropped chunks."""
+        return set(self.files) | set(self.dropped)
+
+    def find(self, text, signature, shingle_count):
+        """Return (kind, database, chunk_id, similarity) of the stored chunk text duplicates, or None.
+
+        kind is "exact" or "near". database is None for this database and the
+        other database's path otherwise.
+        """
+        digest = content_hash(text)
+        for database, index in [(None, self)] + list(self.others.items()):
+            chunk_id = index.hashes.get(digest)
+            if chunk_id is not None:
+                return "exact", database, chunk_id, 1.0
+
+        if not self.near_duplicates or shingle_count < MIN_SHINGLES:
+            return None
+        best = None
+        keys = _band_keys(signature)
+        for database, index in [(None, self)] + list(self.others.items()):
+            seen = set()
+            for band, key in zip(index._bands, keys):
+                for chunk_id in band.get(key, ()):
+                    if chunk_id in seen:
+                        continue
+                    seen.add(chunk_id)
+                    score = similarity(signature, index.signatures[chunk_id])
+                    if score >= self.threshold and (best is None or score > best[3]):
+                        best = ("near", database, chunk_id, score)
+        return best
+
+    def filter(self, source, chunks):
+        """Return the chunks of one file that are not duplicates, recording the rest.
+
+        Chunks must carry metadata["chunk_id"]. Kept chunks become canonical,
+        so later chunks of the same file are checked against them too.
+        """
+        kept = []
+        for chunk in chunks:
+            text = chunk.page_content
+            shingle_set = shingles(text)
+            signature = minhash(shingle_set)
+            match = self.find(text, signature, len(shingle_set))
+            self.stats["checked"] += 1
+            if match is None:
+                self.add(chunk.metadata["chunk_id"], source, text, signature)
+                kept.append(chunk)
+                increment("dedup_chunks", status="kept")
+                continue
+
+            kind, database, duplicate_of, score = match
+            self.stats[kind] += 1
+            increment("dedup_chunks", status=kind)
+            self.dropped.setdefault(source, []).append({
+                "chunk_id": chunk.metadata["chunk_id"],
+                "page": chunk.metadata.get("page"),
+                "duplicate_of": duplicate_of,
+                "database": database,
+                "similarity": round(score, 3),
+            })
+            self.dirty = True
+        return kept
+
+    def orphaned_files(self):
+        """Return files with dropped chunks whose stored copy no longer exists.
+
+        Their duplicates are no longer represented anywhere, so the files
+        need indexing again.
+        """
+        orphaned = []
+        for source, records in self.dropped.items():
+            for record in records:
+                index = self if record["database"] is None else self.others.get(record["database"])
+                if index is None or record["duplicate_of"] not in index.signatures:
+                    orphaned.append(source)
+                    break
+        return orphaned
+
+    def report(self):
+        """Describe how many chunks were dropped since the index was opened."""
+        checked = self.stats["checked"]
+        dropped = self.stats["exact"] + self.stats["near"]
+        if not checked:
+            return "Deduplication: no new chunks to check."
+        return (
+            f"Deduplication: {dropped} of {checked} chunks dropped ({100 * dropped / checked:.1f}%), "
+            f"{self.stats['exact']} exact and {self.stats['near']} near duplicates; "
+            f"{dropped} embeddings and vectors saved."
+        )
+
+    def save(self):
+        """Write the index atomically."""
+        chunk_ids = list(self.signatures)
+        sources = {}
+        for source, ids in self.files.items():
+            for chunk_id in ids:
+                sources[chunk_id] = source
+        header = json.dumps({
+            "version": 1,
+            "chunk_ids": chunk_ids,
+            "sources": [sources[chunk_id] for chunk_id in chunk_ids],
+            "hashes": [self.chunk_hashes[chunk_id] for chunk_id in chunk_ids],
+            "dropped": self.dropped,
+        }).encode("utf-8")
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for chunk_id in chunk_ids:
+                f.write(self.signatures[chunk_id])
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            header = _read_header(f, self.path)
+            size = NUM_HASHES * 4
+            for chunk_id, source, digest in zip(header["chunk_ids"], header["sources"], header["hashes"]):
+                signature = f.read(size)
+                self.signatures[chunk_id] = signature
+                self.hashes.setdefault(digest, chunk_id)
+                self.chunk_hashes[chunk_id] = digest
+                self.files.setdefault(source, []).append(chunk_id)
+                for band, key in zip(self._bands, _band_keys(signature)):
+                    band.setdefault(key, []).append(chunk_id)
+        self.dropped = header["dropped"]
+
+
+def _read_header(f, path):
+    if f.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError(f"'{path}' is not a dedup index")
+    (header_length,) = struct.unpack("<Q", f.read(8))
+    return json.loads(f.read(header_length))
+
+
+class DuplicateSources:
+    """Files and pages of the chunks dropped as duplicates of each stored chunk in one database.
+
+    Only the index header is read, without the signatures, and it is read
+    again whenever the index file changes, so a served database stays current
+    after an update.
+    """
+
+    def __init__(self, db_path):
+        self.path = os.path.join(os.path.expanduser(db_path), INDEX_FILE)
+        self._mtime = None
+        self._by_chunk = {}
+
+    def get(self, chunk_id):
+        """Return [{"source", "page"}] for the chunks dropped as duplicates of chunk_id."""
+        mtime = os.path.getmtime(self.path) if os.path.isfile(self.path) else None
+        if mtime != self._mtime:
+            by_chunk = {}
+            if mtime is not None:
+                with open(self.path, "rb") as f:
+                    dropped = _read_header(f, self.path)["dropped"]
+                for source, records in dropped.items():
+                    for record in records:
+                        by_chunk.setdefault(record["duplicate_of"], []).append({"source": source, "page": record["page"]})
+            self._by_chunk, self._mtime = by_chunk, mtime
+        return self._by_chunk.get(chunk_id, [])
+
+
+def open_dedup_index(db_path, vector_store, threshold=DEFAULT_THRESHOLD, near_duplicates=True, others=None):
+    """Load a database's dedup index, building it from Chroma if it does not exist yet.
+
+    Chunks already in an existing database are all kept as canonical; only
+    new chunks are checked.
+    """
+    index = DedupIndex(db_path, threshold, near_duplicates, others)
+    if os.path.isfile(index.path):
+        return index
+
+    offset = 0
+    while True:
+        batch = vector_store.get(include=["documents", "metadatas"], limit=BUILD_BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            break
+        for chunk_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            index.add(chunk_id, (metadata or {}).get("source", ""), text or "")
+        offset += len(batch["ids"])
+
+    if offset:
+        print(f"Built dedup index for '{db_path}' from {offset} existing chunks.")
+    index.save()
+    return index
@@ -0,0 +1,181 @@
+"""PDF download engine shared by every crawl task.
+
+One pooled aiohttp session is used for all downloads, so connections are kept
+alive and reused with a per-host limit. Bodies are streamed in large chunks to
+a .part file that is renamed into place only when complete. An interrupted
+download resumes with an HTTP Range request, and PDFs downloaded before are
+fetched with If-None-Match/If-Modified-Since so unchanged files are skipped.
+When a HostRateLimiter is given, every request waits for its host's token and
+429/503 responses are retried after the limiter's back-off.
+"""
+import os
+import json
+
+import aiofiles
+import aiohttp
+from tqdm.asyncio import tqdm
+
+from rate_limiter import THROTTLE_STATUSES
+from instrumentation import span, increment
+
+VALIDATORS_FILE = ".download_validators.json"
+
+# Bytes read from the response per iteration
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Validators are written to disk after this many updates, and on close
+_SAVE_EVERY = 50
+
+
+class PdfDownloader:
+    """Downloads PDFs into a directory over one shared, pooled HTTP session.
+
+    Use as an async context manager. download() returns (status, file_path)
+    where status is "downloaded" or "not_modified", and raises on HTTP or
+    network errors.
+    """
+
+    def __init__(self, download_dir, user_agent, max_connections=10, max_connections_per_host=4, chunk_size=DEFAULT_CHUNK_SIZE, rate_limiter=None, max_retries=3):
+        self.download_dir = download_dir
+        self.user_agent = user_agent
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.chunk_size = chunk_size
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.session = None
+
+        self._validators_path = os.path.join(download_dir, VALIDATORS_FILE)
+        self._validators = {}
+        self._unsaved = 0
+        if os.path.isfile(self._validators_path):
+            with open(self._validators_path, "r") as f:
+                self._validators = json.load(f)
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        # No total timeout since large PDFs can take a while, but a stalled read fails
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'User-Agent': self.user_agent})
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self._save_validators()
+
+    def _save_validators(self):
+        os.makedirs(self.download_dir, exist_ok=True)
+        temp_path = f"{self._validators_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._validators, f)
+        os.replace(temp_path, self._validators_path)
+        self._unsaved = 0
+
+    def _remember(self, pdf_url, key, response):
+        """Store the ETag/Last-Modified of a response under key ("complete" or "partial")."""
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        entry = self._validators.setdefault(pdf_url, {})
+        if validators["etag"] or validators["last_modified"]:
+            entry[key] = validators
+        else:
+            entry.pop(key, None)
+
+        self._unsaved += 1
+        if self._unsaved >= _SAVE_EVERY:
+            self._save_validators()
+
+    def file_path_for(self, pdf_url):
+        filename = pdf_url.split('/')[-1]
+        return os.path.join(self.download_dir, filename)
+
+    def can_revalidate(self, pdf_url):
+        """Return True if an earlier complete download of pdf_url can be checked with a conditional GET."""
+        return bool(self._validators.get(pdf_url, {}).get("complete")) and os.path.isfile(self.file_path_for(pdf_url))
+
+    async def download(self, pdf_url, retry_range=True, attempt=0):
+        file_path = self.file_path_for(pdf_url)
+        part_path = f"{file_path}.part"
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        # Retries go round the loop, so each response releases its connection before the next request waits
+        while True:
+            entry = self._validators.get(pdf_url, {})
+            headers = {}
+
+            # Ask the server to skip the body if the copy we already have is current
+            complete = entry.get("complete")
+            if complete and os.path.isfile(file_path):
+                if complete.get("etag"):
+                    headers["If-None-Match"] = complete["etag"]
+                if complete.get("last_modified"):
+                    headers["If-Modified-Since"] = complete["last_modified"]
+
+            # Resume a partial download, but only if the file has not changed since it started
+            resume_from = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+            partial = entry.get("partial")
+            if resume_from and partial:
+                headers["Range"] = f"bytes={resume_from}-"
+                headers["If-Range"] = partial.get("etag") or partial.get("last_modified")
+            else:
+                resume_from = 0
+
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(pdf_url)
+
+            async with self.session.get(pdf_url, headers=headers) as response:
+                if self.rate_limiter:
+                    self.rate_limiter.record(pdf_url, response.status, response.headers.get("Retry-After"))
+
+                if response.status in THROTTLE_STATUSES and self.rate_limiter and attempt < self.max_retries:
+                    # The limiter has backed off this host, so the retry waits its turn
+                    attempt += 1
+                    continue
+
+                if response.status == 304:
+                    increment("pdf_downloads", status="not_modified")
+                    return "not_modified", file_path
+
+                if response.status == 416 and retry_range:
+                    # The partial file is not usable, start over
+                    os.remove(part_path)
+                    entry.pop("partial", None)
+                    retry_range = False
+                    continue
+
+                response.raise_for_status()
+
+                if response.status != 206:
+                    # Full body, either a fresh download or the server ignored the range
+                    resume_from = 0
+                self._remember(pdf_url, "partial", response)
+
+                total_size = int(response.headers.get('content-length', 0)) + resume_from
+                filename = os.path.basename(file_path)
+                progress_bar = tqdm(total=total_size, initial=resume_from, unit='B', unit_scale=True, unit_divisor=1024, desc=filename)
+
+                try:
+                    # Bytes over the summed pdf_download time gives the download rate
+                    with span("pdf_download"):
+                        async with aiofiles.open(part_path, 'ab' if resume_from else 'wb') as f:
+                            async for chunk in response.content.iter_chunked(self.chunk_size):
+                                await f.write(chunk)
+                                progress_bar.update(len(chunk))
+                                increment("download_bytes", len(chunk))
+                finally:
+                    progress_bar.close()
+
+            # Only a complete file ever appears under the final name
+            os.replace(part_path, file_path)
+            entry = self._validators.setdefault(pdf_url, {})
+            entry.pop("partial", None)
+            self._remember(pdf_url, "complete", response)
+            increment("pdf_downloads", status="downloaded")
+            return "downloaded", file_path
@@ -0,0 +1,172 @@
+"""Persistent on-disk cache of embedding vectors keyed by model name and text hash.
+
+Vectors are stored as float32 blobs in a SQLite database shared by every
+vector store and every run, so identical text is only ever encoded once per
+model. When the cache grows past its size limit the least recently used
+vectors are evicted.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from instrumentation import span, increment, observe
+
+CACHE_DIR = os.path.expanduser('~/chatbot/cache')
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'embeddings.sqlite')
+DEFAULT_MAX_BYTES = 1024 ** 3  # 1 GiB of vectors
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def text_hash(text):
+    """Return the binary SHA-256 digest used as the cache key for a text."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """SQLite-backed store of float32 vectors with size-based LRU eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash BLOB NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, hashes):
+        """Return {hash: vector} for the hashes present in the cache."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                group = hashes[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(group))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *group],
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                # Refresh recency so frequently used vectors survive eviction
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model, items):
+        """Store (hash, vector) pairs for a model."""
+        now = time.time()
+        blobs = {key: array("f", vector).tobytes() for key, vector in items}
+        keys = list(blobs)
+        with self._lock:
+            # Replaced rows only change the size by the difference, or the size would drift past the real one
+            replaced = 0
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                group = keys[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(group))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *group],
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(model, key, blob, now) for key, blob in blobs.items()],
+            )
+            self._conn.commit()
+            self._size += sum(len(blob) for blob in blobs.values()) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used vectors until the cache is at 90% of its limit."""
+        target = int(self.max_bytes * 0.9)
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            self._conn.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND text_hash = ?",
+                [(model, key) for model, key, _ in rows],
+            )
+            self._size -= sum(length for _, _, length in rows)
+        self._conn.commit()
+
+
+def get_embedding_cache(path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+    """Return the process-wide cache for a path, opening it on first use."""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = EmbeddingCache(path, max_bytes)
+        return cache
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an EmbeddingCache."""
+
+    def __init__(self, embeddings, model_name, cache=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or get_embedding_cache()
+
+    def _embed(self, model, texts, encode):
+        hashes = [text_hash(text) for text in texts]
+        found = self.cache.get_many(model, list(set(hashes)))
+
+        # Encode each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        increment("embed_cache_hits", len(texts) - len(missing), model=model)
+        if missing:
+            observe("embed_batch_size", len(missing), model=model)
+            increment("embed_texts", len(missing), model=model)
+            with span("embed", model=model):
+                vectors = encode(list(missing.values()))
+            # Round to float32 so fresh and cached vectors are identical
+            computed = [(key, array("f", vector).tolist()) for key, vector in zip(missing.keys(), vectors)]
+            self.cache.put_many(model, computed)
+            found.update(computed)
+
+        return [found[key] for key in hashes]
+
+    def embed_documents(self, texts):
+        return self._embed(self.model_name, texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        # Queries get their own key space since some models embed queries differently
+        return self._embed(f"{self.model_name}:query", [text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
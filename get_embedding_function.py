@@ -1,16 +1,79 @@
 #Based off of Pixegami and modified to Use HuggingFace instead of Ollama and Bedrock embeddings
+import time
+import threading
+
 from langchain_huggingface import HuggingFaceEmbeddings
+from embedding_cache import CachedEmbeddings
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Loaded sentence-transformers models keyed by (model, device), and the
+# embedding functions built on them keyed by their full settings
+_models = {}
+_embedding_functions = {}
+_registry_lock = threading.Lock()
 
 
-def get_embedding_function():
-    model_name = "sentence-transformers/all-MiniLM-L6-v2"
-    model_kwargs = {'device': 'cpu'}
-    encode_kwargs = {'normalize_embeddings': False}
-    hf = HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs=model_kwargs,
-        encode_kwargs=encode_kwargs
+def _load_model(model_name, device, num_threads):
+    """Load a model once per process and return the shared instance."""
+    key = (model_name, device)
+    hf = _models.get(key)
+    if hf is None:
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
 
-    )
+        start = time.perf_counter()
+        hf = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device}
+        )
+        print(f"Loaded embedding model '{model_name}' on {device} in {time.perf_counter() - start:.2f}s")
+        _models[key] = hf
     return hf
+
+
+def _load_onnx(model_name, quantize, batch_size, num_threads, normalize):
+    """Create an ONNX Runtime embedding function, reporting how long it took."""
+    from onnx_embeddings import OnnxEmbeddings
+
+    start = time.perf_counter()
+    embeddings = OnnxEmbeddings(model_name, quantize=quantize, batch_size=batch_size, num_threads=num_threads, normalize=normalize)
+    print(f"Loaded ONNX embedding model '{model_name}'{' (int8)' if quantize else ''} in {time.perf_counter() - start:.2f}s")
+    return embeddings
+
+
+def get_embedding_function(model_name=DEFAULT_MODEL, device="cpu", batch_size=32, num_threads=None, normalize=False, use_cache=True, backend="torch", quantize=True):
+    """Return the shared embedding function for these settings.
+
+    backend is "torch" for sentence-transformers or "onnx" for ONNX Runtime,
+    where quantize selects the int8 export. The model is loaded lazily the
+    first time it is needed and every vector store using the same settings
+    gets the same instance.
+    """
+    if backend not in ("torch", "onnx"):
+        raise ValueError(f"Unknown embedding backend '{backend}'.")
+
+    key = (model_name, device, batch_size, num_threads, normalize, use_cache, backend, quantize)
+    with _registry_lock:
+        embeddings = _embedding_functions.get(key)
+        if embeddings is not None:
+            return embeddings
+
+        if backend == "onnx":
+            embeddings = _load_onnx(model_name, quantize, batch_size, num_threads, normalize)
+            cache_model = f"{model_name}:onnx-int8" if quantize else f"{model_name}:onnx"
+        else:
+            # Copies share the loaded model and only differ in how they encode
+            encode_kwargs = {'normalize_embeddings': normalize, 'batch_size': batch_size}
+            embeddings = _load_model(model_name, device, num_threads).copy(update={'encode_kwargs': encode_kwargs})
+            cache_model = model_name
+
+        if use_cache:
+            # Serve texts that were already embedded, in any database or run, from the on-disk cache
+            if normalize:
+                cache_model = f"{cache_model}:normalized"
+            embeddings = CachedEmbeddings(embeddings, cache_model)
+
+        _embedding_functions[key] = embeddings
+        return embeddings
@@ -0,0 +1,108 @@
+"""Per-database record of which files have been indexed and the chunks they produced.
+
+The manifest lives inside the database directory as ingest_manifest.json. For
+every indexed file it stores the size, modification time and SHA-256 of the
+content, the chunk settings used, and the IDs of the chunks written to Chroma.
+Updates use it to skip unchanged files and to delete the chunks of files that
+were removed or replaced.
+"""
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+# A file that needs (re)indexing, captured when the update is planned
+FileState = namedtuple("FileState", ["path", "size", "mtime", "sha256"])
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id_prefix(path, sha256):
+    """Return the ID prefix for chunks of one version of a file.
+
+    Depends only on the path and content, so re-indexing the same file produces
+    the same IDs and Chroma upserts them instead of storing duplicates.
+    """
+    return hashlib.sha1(f"{path}\0{sha256}".encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """Indexed files of one database, loaded from and saved to its directory."""
+
+    def __init__(self, db_path):
+        self.path = os.path.join(os.path.expanduser(db_path), MANIFEST_FILE)
+        self.files = {}
+        # Whether Chroma may still hold chunks added before the manifest existed
+        self.legacy_chunks = True
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.legacy_chunks = data.get("legacy_chunks", True)
+
+    def save(self):
+        """Write the manifest atomically so an interrupted save never corrupts it."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": 1, "files": self.files, "legacy_chunks": self.legacy_chunks}, f)
+        os.replace(temp_path, self.path)
+
+    def plan(self, files, directory, chunk_size, chunk_overlap):
+        """Compare files on disk against the manifest.
+
+        Returns (changed, removed): FileState entries for new or modified files,
+        and the paths of previously indexed files under directory that no longer
+        exist. Files whose size and mtime are unchanged are not re-hashed.
+        """
+        changed = []
+        for path in files:
+            stat = os.stat(path)
+            entry = self.files.get(path)
+            same_settings = entry is not None and (entry["chunk_size"], entry["chunk_overlap"]) == (chunk_size, chunk_overlap)
+
+            if same_settings and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+
+            sha256 = file_sha256(path)
+            if same_settings and entry["sha256"] == sha256:
+                # Touched but not modified, remember the new mtime so it is not hashed again
+                entry["mtime"] = stat.st_mtime
+                continue
+
+            changed.append(FileState(path, stat.st_size, stat.st_mtime, sha256))
+
+        prefix = os.path.join(os.path.abspath(directory), "")
+        present = set(files)
+        removed = [path for path in self.files if path.startswith(prefix) and path not in present]
+
+        return changed, removed
+
+    def chunk_ids(self, path):
+        """Return the chunk IDs recorded for a file, or an empty list."""
+        entry = self.files.get(path)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def record(self, state, chunk_ids, chunk_size, chunk_overlap):
+        """Record a file as fully indexed."""
+        self.files[state.path] = {
+            "size": state.size,
+            "mtime": state.mtime,
+            "sha256": state.sha256,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, path):
+        """Drop a file from the manifest."""
+        self.files.pop(path, None)
@@ -0,0 +1,317 @@
+"""Streaming PDF ingestion pipeline used when building or updating a database.
+
+PDFs are parsed and chunked across a process pool, one file per task, and the
+chunks are handed on in fixed-size batches. Only a bounded number of files is
+in flight at any time, so memory use depends on the batch size and worker
+count rather than on the size of the corpus.
+
+Every chunk gets a deterministic ID derived from its file's path and content,
+and the database's IndexManifest records which files are indexed, so updates
+only parse and embed files that are new or changed. With a DedupIndex, chunks
+that repeat ones already stored are dropped after splitting, and the manifest
+records only the chunks that were written.
+"""
+import os
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from tqdm import tqdm
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from index_manifest import FileState, chunk_id_prefix
+from instrumentation import span, increment, observe
+
+DEFAULT_BATCH_SIZE = 256
+
+# Largest number of IDs sent to Chroma in one delete call
+DELETE_BATCH_SIZE = 5000
+
+# Records read from Chroma per call when scanning chunk metadata
+SCAN_BATCH_SIZE = 5000
+
+
+def find_pdf_files(directory_path):
+    """Return the PDF files under a directory in a stable order."""
+    # Same pattern PyPDFDirectoryLoader uses, sorted so chunk order does not depend on the filesystem
+    return sorted(os.path.abspath(p) for p in Path(directory_path).glob("**/[!.]*.pdf") if p.is_file())
+
+
+def load_and_split_file(file_path, chunk_size, chunk_overlap):
+    """Parse one PDF and split its pages into chunks.
+
+    Runs inside a worker process. Errors are returned rather than raised so a
+    corrupt PDF only fails its own task. Returns (file_path, chunks, error,
+    timings); timings holds the parse and split seconds and the page count,
+    for record_file_timings() in the parent process.
+    """
+    timings = {}
+    try:
+        start = time.perf_counter()
+        pages = PyPDFLoader(file_path).load()
+        timings["parse"] = time.perf_counter() - start
+        timings["pages"] = len(pages)
+
+        start = time.perf_counter()
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks = text_splitter.split_documents(pages)
+        timings["split"] = time.perf_counter() - start
+        return file_path, chunks, None, timings
+    except Exception as e:
+        return file_path, [], f"{type(e).__name__}: {e}", timings
+
+
+def record_file_timings(timings):
+    """Record the timings measured by load_and_split_file in a worker."""
+    if "parse" in timings:
+        observe("pdf_parse_seconds", timings["parse"])
+        increment("pdf_pages", timings["pages"])
+    if "split" in timings:
+        observe("pdf_split_seconds", timings["split"])
+
+
+def iter_file_chunks(files, chunk_size, chunk_overlap, max_workers=None):
+    """Yield (file_path, chunks, error) for each file, in file order.
+
+    At most two tasks per worker are queued ahead of the consumer, which keeps
+    the pool busy without letting parsed files pile up in memory.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_workers * 2
+
+    # Spawn keeps workers independent of any model or thread state already in this process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        remaining = iter(files)
+        pending = deque()
+
+        for file_path in remaining:
+            pending.append(executor.submit(load_and_split_file, file_path, chunk_size, chunk_overlap))
+            if len(pending) >= max_pending:
+                break
+
+        while pending:
+            # Collect results in submission order so chunk order matches file order
+            file_path, chunks, error, timings = pending.popleft().result()
+            next_file = next(remaining, None)
+            if next_file is not None:
+                pending.append(executor.submit(load_and_split_file, next_file, chunk_size, chunk_overlap))
+            record_file_timings(timings)
+            increment("pdf_files", status="failed" if error else "parsed")
+            yield file_path, chunks, error
+
+
+def tag_chunks(state, chunks):
+    """Set metadata["chunk_id"] on a file's chunks and return the IDs in order."""
+    prefix = chunk_id_prefix(state.path, state.sha256)
+    chunk_ids = [f"{prefix}-{i}" for i in range(len(chunks))]
+    for chunk, chunk_id in zip(chunks, chunk_ids):
+        chunk.metadata["chunk_id"] = chunk_id
+    return chunk_ids
+
+
+def iter_chunk_batches(file_states, chunk_size, chunk_overlap, batch_size=DEFAULT_BATCH_SIZE, max_workers=None, dedup=None):
+    """Yield (chunks, completed_files) with at most batch_size chunks per batch.
+
+    Each chunk carries its ID in metadata["chunk_id"]. completed_files lists
+    (file_path, chunk_ids) for every file whose last chunk is in this batch or
+    an earlier one; chunk_ids is None for files that failed to parse. Chunks
+    dropped by dedup are left out of both.
+    """
+    states = {state.path: state for state in file_states}
+    batch = []
+    waiting = deque()  # (file_path, chunk_ids, position of the file's last chunk)
+    queued = 0
+    emitted = 0
+    failed = 0
+
+    def take_completed():
+        completed = []
+        while waiting and waiting[0][2] <= emitted:
+            file_path, chunk_ids, _ = waiting.popleft()
+            completed.append((file_path, chunk_ids))
+        return completed
+
+    files = [state.path for state in file_states]
+    for file_path, file_chunks, error in iter_file_chunks(files, chunk_size, chunk_overlap, max_workers=max_workers):
+        if error:
+            print(f"Skipping '{file_path}': {error}")
+            failed += 1
+            waiting.append((file_path, None, queued))
+            continue
+
+        chunk_ids = tag_chunks(states[file_path], file_chunks)
+        if dedup is not None:
+            file_chunks = dedup.filter(file_path, file_chunks)
+            chunk_ids = [chunk.metadata["chunk_id"] for chunk in file_chunks]
+        batch.extend(file_chunks)
+        queued += len(file_chunks)
+        waiting.append((file_path, chunk_ids, queued))
+
+        while len(batch) >= batch_size:
+            chunks, batch = batch[:batch_size], batch[batch_size:]
+            emitted += len(chunks)
+            yield chunks, take_completed()
+
+    if batch or waiting:
+        emitted += len(batch)
+        yield batch, take_completed()
+
+    if failed:
+        print(f"{failed} file(s) could not be processed and were skipped.")
+
+
+def add_batches(vector_store, batches, total_files, on_file_done=None, lexical_index=None):
+    """Embed and write chunk batches to a vector store, reporting progress per batch.
+
+    on_file_done(file_path, chunk_ids) is called once all of a file's chunks
+    have been written. Chunks are also added to lexical_index when one is
+    given. Returns the number of chunks written.
+    """
+    written = 0
+    with tqdm(total=total_files, desc="Progress (Adding Documents)", unit="file") as pbar:
+        for chunks, completed in batches:
+            if chunks:
+                # Upsert by ID so re-running an interrupted update never duplicates chunks
+                with span("chroma_add"):
+                    vector_store.add_documents(chunks, ids=[chunk.metadata["chunk_id"] for chunk in chunks])
+                if lexical_index is not None:
+                    with span("lexical_add"):
+                        lexical_index.add_documents(chunks)
+                written += len(chunks)
+                increment("chunks_written", len(chunks))
+
+            if on_file_done:
+                for file_path, chunk_ids in completed:
+                    on_file_done(file_path, chunk_ids)
+
+            pbar.update(len(completed))
+            pbar.set_postfix(chunks=written)
+    return written
+
+
+def delete_chunks(vector_store, chunk_ids, lexical_index=None):
+    """Delete chunks from a vector store, and from lexical_index if given, by ID."""
+    for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+        with span("chroma_delete"):
+            vector_store.delete(ids=chunk_ids[start:start + DELETE_BATCH_SIZE])
+    if lexical_index is not None:
+        lexical_index.remove_many(chunk_ids)
+
+
+def legacy_chunk_ids(vector_store, paths):
+    """Find chunks that were added before the manifest existed.
+
+    Those chunks have random IDs and no chunk_id, so indexing their files
+    again would store a second copy next to them. They are matched to paths
+    by their source metadata, which PyPDFLoader sets to the path it was
+    given. Returns (IDs of the chunks from paths, number of other such chunks).
+    """
+    paths = set(paths)
+    legacy_ids = []
+    others = 0
+    offset = 0
+    while True:
+        batch = vector_store.get(include=["metadatas"], limit=SCAN_BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            return legacy_ids, others
+        for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            metadata = metadata or {}
+            if metadata.get("chunk_id"):
+                continue
+            if metadata.get("source") and os.path.abspath(metadata["source"]) in paths:
+                legacy_ids.append(chunk_id)
+            else:
+                others += 1
+        offset += len(batch["ids"])
+
+
+def release_orphans(manifest, dedup, paths):
+    """Take files whose dropped duplicates lost their stored copy out of the manifest.
+
+    Only files in paths are released. Returns (FileState entries to index
+    again, IDs of their stored chunks to delete). Deleting those chunks can
+    orphan further files, so this repeats until nothing changes.
+    """
+    states, stale_ids = [], []
+    while True:
+        orphans = [path for path in dedup.orphaned_files() if path in paths and path in manifest.files]
+        if not orphans:
+            return states, stale_ids
+        for path in orphans:
+            entry = manifest.files[path]
+            states.append(FileState(path, entry["size"], entry["mtime"], entry["sha256"]))
+            stale_ids.extend(manifest.chunk_ids(path))
+            manifest.forget(path)
+            dedup.forget_file(path)
+
+
+def index_directory(vector_store, manifest, data_directory, chunk_size, chunk_overlap, batch_size=DEFAULT_BATCH_SIZE, max_workers=None, lexical_index=None, dedup=None):
+    """Bring a database up to date with the PDFs in a directory.
+
+    Only new or changed files are parsed and embedded. Chunks belonging to
+    files that were removed, or to the previous version of a changed file, are
+    deleted, and so are chunks a database built before the manifest existed
+    holds for the files being indexed. lexical_index, when given, is kept in
+    step with the vector store.
+    dedup, a DedupIndex, drops repeated chunks before they are embedded; files
+    whose chunks were collapsed into a deleted chunk are indexed again.
+    Returns (chunks_written, files_changed, files_removed).
+    """
+    files = find_pdf_files(data_directory)
+    changed, removed = manifest.plan(files, data_directory, chunk_size, chunk_overlap)
+    print(f"{len(changed)} new or changed file(s), {len(removed)} removed, {len(files) - len(changed)} unchanged.")
+
+    stale_ids = []
+    legacy_left = None
+    if manifest.legacy_chunks and changed:
+        # A database built before the manifest existed, replace its copies of the files being indexed
+        legacy_ids, legacy_left = legacy_chunk_ids(vector_store, [state.path for state in changed])
+        stale_ids.extend(legacy_ids)
+    for path in removed + [state.path for state in changed]:
+        stale_ids.extend(manifest.chunk_ids(path))
+        manifest.forget(path)
+
+    if dedup is not None:
+        # Also clears entries left by files an interrupted update never finished
+        prefix = os.path.join(os.path.abspath(data_directory), "")
+        for path in dedup.paths():
+            if path.startswith(prefix) and path not in manifest.files:
+                dedup.forget_file(path)
+        orphans, orphan_ids = release_orphans(manifest, dedup, set(files))
+        if orphans:
+            print(f"{len(orphans)} file(s) had duplicates of removed chunks and will be indexed again.")
+            changed = sorted(changed + orphans, key=lambda state: state.path)
+            stale_ids.extend(orphan_ids)
+
+    states = {state.path: state for state in changed}
+
+    def file_done(file_path, chunk_ids):
+        # Files that failed stay out of the manifest so the next update retries them
+        if chunk_ids is not None:
+            manifest.record(states[file_path], chunk_ids, chunk_size, chunk_overlap)
+
+    try:
+        if stale_ids:
+            print(f"Removing {len(stale_ids)} outdated chunk(s)...")
+            delete_chunks(vector_store, stale_ids, lexical_index=lexical_index)
+        if legacy_left is not None:
+            # Later updates only scan Chroma while chunks from before the manifest are left
+            manifest.legacy_chunks = legacy_left > 0
+
+        batches = iter_chunk_batches(changed, chunk_size, chunk_overlap, batch_size=batch_size, max_workers=max_workers, dedup=dedup)
+        written = add_batches(vector_store, batches, len(changed), on_file_done=file_done, lexical_index=lexical_index)
+    finally:
+        manifest.save()
+        if lexical_index is not None:
+            lexical_index.save()
+        if dedup is not None:
+            dedup.save()
+
+    if dedup is not None:
+        print(dedup.report())
+
+    return written, len(changed), len(removed)
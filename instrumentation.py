@@ -0,0 +1,216 @@
+"""Spans, counters and profiling for finding where time goes.
+
+Hot paths record into one process-wide registry:
+
+    with span("chroma_query", store=name):
+        ...
+    increment("download_bytes", len(chunk))
+    observe("embed_batch_size", len(texts))
+
+Every span is kept as a histogram of seconds, so totals, counts and rates
+are available per stage and per label. Embedding throughput, for example,
+is embed_texts_total over embed_seconds_sum, and download speed is
+download_bytes_total over pdf_download_seconds_sum. snapshot() returns
+everything as a dict, and write_metrics() saves it as JSON or, for a .prom
+file, in the Prometheus text format a node-exporter textfile collector can
+pick up.
+
+start_profiling() runs cProfile over the whole process until
+stop_profiling() writes the stats. For a sampling profile of a live process
+use py-spy instead (`py-spy record -o profile.svg --pid <pid>`); worker
+threads are named so its output is readable.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+import cProfile
+from contextlib import contextmanager
+
+PREFIX = "scout_"
+
+# Histogram bucket upper bounds for spans (seconds) and for everything else, such as batch sizes
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, float("inf"))
+
+
+class _Histogram:
+    __slots__ = ("bounds", "count", "total", "minimum", "maximum", "buckets")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+        self.buckets = [0] * len(bounds)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[index] += 1
+                break
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(SECONDS_BUCKETS if name.endswith("_seconds") else SIZE_BUCKETS)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Return counters and histogram summaries as plain data."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": round(histogram.total, 6),
+                    "mean": round(histogram.total / histogram.count, 6),
+                    "min": round(histogram.minimum, 6),
+                    "max": round(histogram.maximum, 6),
+                }
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms}
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+                for (counter_name, labels), value in self._counters.items():
+                    if counter_name == name:
+                        lines.append(f"{PREFIX}{name}_total{label_text(labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (histogram_name, labels), histogram in self._histograms.items():
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds, histogram.buckets):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{PREFIX}{name}_bucket{label_text(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{label_text(labels)} {histogram.total}")
+                    lines.append(f"{PREFIX}{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def increment(name, amount=1, **labels):
+    """Add to a counter."""
+    registry.increment(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    """Record one value, such as a batch size, in a histogram."""
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block into the <name>_seconds histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def format_summary():
+    """Return one line per span with its count, total and mean time."""
+    lines = []
+    for histogram in sorted(registry.snapshot()["histograms"], key=lambda h: -h["sum"]):
+        if not histogram["name"].endswith("_seconds"):
+            continue
+        labels = ",".join(f"{key}={value}" for key, value in histogram["labels"].items())
+        name = histogram["name"][:-len("_seconds")] + (f"[{labels}]" if labels else "")
+        lines.append(f"{name:40} {histogram['count']:>8} calls {histogram['sum']:>10.3f}s total {histogram['mean'] * 1000:>10.2f}ms mean")
+    return "\n".join(lines)
+
+
+def write_metrics(path):
+    """Write the metrics to path, in Prometheus text format for .prom files and JSON otherwise."""
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    content = registry.prometheus() if path.endswith(".prom") else json.dumps(registry.snapshot(), indent=2)
+    # Written atomically so a collector never reads half a file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def write_metrics_at_exit(path):
+    """Save the metrics to path when the process exits."""
+    atexit.register(write_metrics, path)
+
+
+_profiler = None
+
+
+def start_profiling():
+    """Start cProfile for the rest of the run. Only the calling thread is profiled."""
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop_profiling(path):
+    """Stop cProfile and write the stats to path, readable with pstats or snakeviz."""
+    global _profiler
+    if _profiler is None:
+        return
+    _profiler.disable()
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _profiler.dump_stats(path)
+    _profiler = None
+    print(f"Profile written to {path}")
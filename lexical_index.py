@@ -0,0 +1,267 @@
+"""Persistent BM25 index over a database's chunks, for exact-term search.
+
+Dense embeddings blur terms like form numbers, acronyms and policy IDs, so
+each database also keeps an inverted index in lexical_index.bin inside its
+persist directory. Postings are stored as flat arrays (document numbers and
+term frequencies) with one offset per term, which loads with a few array
+reads and keeps memory to a few bytes per posting.
+
+The index is updated incrementally by chunk ID. New chunks go into an
+in-memory segment that is merged into the arrays on save; removed chunks are
+tombstoned and dropped when enough of them have built up.
+"""
+import os
+import re
+import json
+import math
+import heapq
+import struct
+import threading
+from array import array
+from collections import Counter
+
+INDEX_FILE = "lexical_index.bin"
+_MAGIC = b"BM25IDX1"
+
+# BM25 parameters, the usual defaults
+K1 = 1.2
+B = 0.75
+
+# Removed documents are purged on save once they are this fraction of the index
+COMPACT_RATIO = 0.25
+
+# Documents read from Chroma at a time when building an index for an existing database
+BUILD_BATCH_SIZE = 5000
+
+# Words, plus identifiers joined by hyphens, dots or slashes such as "W-2" or "1040-ES"
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text):
+    """Lowercase a text and split it into terms.
+
+    Compound identifiers are kept whole and also split into their parts, so
+    "form 1040-ES" matches queries for "1040-es" as well as "1040".
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-./]", token) if part)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 inverted index keyed by chunk ID, loaded from and saved to a directory."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(os.path.expanduser(directory), INDEX_FILE)
+        self.chunk_ids = []  # Document number -> chunk ID
+        self.lengths = array("I")  # Document number -> term count
+        self.alive = array("B")  # Document number -> 0 once removed
+        self.total_length = 0
+        self.live_count = 0
+        # Merged postings: term -> (offset, count) into the two arrays
+        self.terms = {}
+        self.doc_postings = array("I")
+        self.tf_postings = array("I")
+        # Postings added since the last save: term -> (documents, frequencies)
+        self._pending = {}
+        self._doc_numbers = {}
+        self.dirty = False
+        # Lets a server search while an ingest on another thread updates the index
+        self._lock = threading.RLock()
+        if os.path.isfile(self.path):
+            self._load()
+
+    def __len__(self):
+        return self.live_count
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._doc_numbers
+
+    def add(self, chunk_id, text):
+        """Index a chunk, replacing any earlier version with the same ID."""
+        with self._lock:
+            self._add(chunk_id, text)
+
+    def _add(self, chunk_id, text):
+        self._remove(chunk_id)
+        doc = len(self.chunk_ids)
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+
+        self.chunk_ids.append(chunk_id)
+        self.lengths.append(length)
+        self.alive.append(1)
+        self._doc_numbers[chunk_id] = doc
+        self.total_length += length
+        self.live_count += 1
+
+        for term, tf in counts.items():
+            postings = self._pending.get(term)
+            if postings is None:
+                postings = self._pending[term] = (array("I"), array("I"))
+            postings[0].append(doc)
+            postings[1].append(tf)
+        self.dirty = True
+
+    def add_documents(self, documents, ids=None):
+        """Index langchain Documents, by ids or by their metadata["chunk_id"]."""
+        if ids is None:
+            ids = [document.metadata["chunk_id"] for document in documents]
+        for chunk_id, document in zip(ids, documents):
+            self.add(chunk_id, document.page_content)
+
+    def remove(self, chunk_id):
+        """Tombstone a chunk. Its postings are dropped at the next compaction."""
+        with self._lock:
+            self._remove(chunk_id)
+
+    def _remove(self, chunk_id):
+        doc = self._doc_numbers.pop(chunk_id, None)
+        if doc is None:
+            return
+        self.alive[doc] = 0
+        self.total_length -= self.lengths[doc]
+        self.live_count -= 1
+        self.dirty = True
+
+    def remove_many(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            self.remove(chunk_id)
+
+    def _postings(self, term):
+        """Yield (document, frequency) pairs for a term across both segments."""
+        entry = self.terms.get(term)
+        if entry:
+            offset, count = entry
+            yield from zip(self.doc_postings[offset:offset + count], self.tf_postings[offset:offset + count])
+        pending = self._pending.get(term)
+        if pending:
+            yield from zip(*pending)
+
+    def search(self, query, k=10):
+        """Return up to k (chunk_id, score) pairs, best first."""
+        with self._lock:
+            return self._search(query, k)
+
+    def _search(self, query, k):
+        if not self.live_count:
+            return []
+        average_length = self.total_length / self.live_count
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = [(doc, tf) for doc, tf in self._postings(term) if self.alive[doc]]
+            if not postings:
+                continue
+            idf = math.log(1 + (self.live_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = K1 * (1 - B + B * self.lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.chunk_ids[doc], score) for doc, score in best]
+
+    def _merge(self):
+        """Fold pending postings into the arrays, purging removed documents if there are enough."""
+        removed = len(self.chunk_ids) - self.live_count
+        compact = removed and removed >= COMPACT_RATIO * len(self.chunk_ids)
+        if not self._pending and not compact:
+            return
+
+        if compact:
+            # Renumber the surviving documents densely
+            remap = {}
+            chunk_ids, lengths = [], array("I")
+            for doc, chunk_id in enumerate(self.chunk_ids):
+                if self.alive[doc]:
+                    remap[doc] = len(chunk_ids)
+                    chunk_ids.append(chunk_id)
+                    lengths.append(self.lengths[doc])
+            self.chunk_ids, self.lengths = chunk_ids, lengths
+            self.alive = array("B", [1]) * len(chunk_ids)
+            self._doc_numbers = {chunk_id: doc for doc, chunk_id in enumerate(chunk_ids)}
+        else:
+            remap = None
+
+        terms = {}
+        doc_postings, tf_postings = array("I"), array("I")
+        for term in self.terms.keys() | self._pending.keys():
+            offset = len(doc_postings)
+            for doc, tf in self._postings(term):
+                if remap is not None:
+                    doc = remap.get(doc)
+                    if doc is None:
+                        continue
+                doc_postings.append(doc)
+                tf_postings.append(tf)
+            if len(doc_postings) > offset:
+                terms[term] = (offset, len(doc_postings) - offset)
+
+        self.terms, self.doc_postings, self.tf_postings = terms, doc_postings, tf_postings
+        self._pending = {}
+
+    def save(self):
+        """Merge pending changes and write the index atomically."""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        self._merge()
+        header = json.dumps({
+            "version": 1,
+            "chunk_ids": self.chunk_ids,
+            "terms": self.terms,
+            "documents": len(self.chunk_ids),
+            "postings": len(self.doc_postings),
+        }).encode("utf-8")
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for values in (self.lengths, self.alive, self.doc_postings, self.tf_postings):
+                values.tofile(f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"'{self.path}' is not a lexical index")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+            documents, postings = header["documents"], header["postings"]
+            for values, count in ((self.lengths, documents), (self.alive, documents), (self.doc_postings, postings), (self.tf_postings, postings)):
+                values.fromfile(f, count)
+
+        self.chunk_ids = header["chunk_ids"]
+        self.terms = {term: tuple(entry) for term, entry in header["terms"].items()}
+        self._doc_numbers = {chunk_id: doc for doc, chunk_id in enumerate(self.chunk_ids) if self.alive[doc]}
+        self.live_count = len(self._doc_numbers)
+        self.total_length = sum(self.lengths[doc] for doc in self._doc_numbers.values())
+
+
+def open_lexical_index(db_path, vector_store):
+    """Load a database's lexical index, building it from Chroma if it does not exist yet."""
+    index = LexicalIndex(db_path)
+    if os.path.isfile(index.path):
+        return index
+
+    offset = 0
+    while True:
+        # Chroma IDs are the chunk IDs for everything written by the ingestion pipeline
+        batch = vector_store.get(include=["documents"], limit=BUILD_BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            break
+        for chunk_id, text in zip(batch["ids"], batch["documents"]):
+            index.add(chunk_id, text or "")
+        offset += len(batch["ids"])
+
+    if offset:
+        print(f"Built lexical index for '{db_path}' from {offset} existing chunks.")
+    index.save()
+    return index
@@ -1,20 +1,28 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+from urllib.parse import urlparse
 import os
+import queue
+import threading
+
+from instrumentation import span, increment
 
 Base = declarative_base()
 
-# Ensure the directory exists
 db_dir = os.path.expanduser('~/chatbot/logging')
-os.makedirs(db_dir, exist_ok=True)
+
+def url_host(url):
+    """Return the lowercase host of a URL, as stored in the host columns."""
+    return urlparse(url).netloc.lower()
 
 # Define the PdfDownloadLog model
 class PdfDownloadLog(Base):
     __tablename__ = 'pdf_download_log'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    url = Column(String, nullable=False)
+    url = Column(String, nullable=False, index=True)
+    host = Column(String, index=True)
     status = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
@@ -22,14 +30,137 @@ class PdfDownloadLog(Base):
 class CompletedPagesLog(Base):
     __tablename__ = 'completed_pages_log'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    url = Column(String, nullable=False)
+    url = Column(String, nullable=False, index=True)
+    host = Column(String, index=True)
     status = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 # SQLite database setup
 DATABASE_URL = f'sqlite:///{os.path.join(db_dir, "logging_db.sqlite")}'
-engine = create_engine(DATABASE_URL, echo=True)
-SessionLocal = sessionmaker(bind=engine)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Created by get_engine() on first use, so importing this module touches no files
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers continue during writes and avoids an fsync per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def _migrate(engine):
+    """Add the host column and indexes to databases created before they existed."""
+    for model in (PdfDownloadLog, CompletedPagesLog):
+        table = model.__table__
+        columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+        if "host" not in columns:
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN host VARCHAR"))
+
+        # Fill in hosts for rows written before the column existed
+        while True:
+            with engine.begin() as connection:
+                rows = connection.execute(text(f"SELECT id, url FROM {table.name} WHERE host IS NULL LIMIT 10000")).fetchall()
+                if not rows:
+                    break
+                connection.execute(
+                    text(f"UPDATE {table.name} SET host = :host WHERE id = :id"),
+                    [{"id": row_id, "host": url_host(url)} for row_id, url in rows]
+                )
+
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def get_engine():
+    """Return the logging database engine, creating the database and tables on first use."""
+    global _engine, _session_factory
+    with _engine_lock:
+        if _engine is None:
+            os.makedirs(db_dir, exist_ok=True)
+            engine = create_engine(DATABASE_URL, echo=False)
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+            Base.metadata.create_all(bind=engine)
+            _migrate(engine)
+            _session_factory = sessionmaker(bind=engine)
+            _engine = engine
+    return _engine
+
+def SessionLocal():
+    """Return a new session on the logging database."""
+    get_engine()
+    return _session_factory()
+
+class LogWriter:
+    """Writes log rows in batches on a background thread.
+
+    log_page() and log_pdf() only put a row on a queue, so callers on the
+    event loop never wait for SQLite. Rows are committed once batch_size have
+    been queued or flush_interval seconds have passed. Call close() to write
+    whatever is left.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size=500, flush_interval=1.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def log_page(self, url, status="Completed"):
+        self._queue.put((CompletedPagesLog, {"url": url, "host": url_host(url), "status": status, "timestamp": datetime.utcnow()}))
+
+    def log_pdf(self, url, status="Downloaded"):
+        self._queue.put((PdfDownloadLog, {"url": url, "host": url_host(url), "status": status, "timestamp": datetime.utcnow()}))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+            closing = item is None
+
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        rows = {}
+        for model, row in batch:
+            rows.setdefault(model, []).append(row)
+
+        session = self.session_factory()
+        try:
+            with span("sqlite_commit"):
+                for model, mappings in rows.items():
+                    session.bulk_insert_mappings(model, mappings)
+                session.commit()
+            increment("log_rows", len(batch))
+        except Exception as e:
+            session.rollback()
+            print(f"Error writing crawl log: {e}")
+        finally:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,248 @@
+"""Rebuilding a database's Chroma collection with tuned HNSW parameters.
+
+Chroma fixes a collection's HNSW parameters when it is created, and an index
+that is only ever appended to and deleted from keeps the tombstones of every
+replaced chunk. rebuild_collection() copies the stored vectors, text and
+metadata into a new collection created with the given parameters and swaps
+it in, so nothing is embedded again. Chunks written by the ingestion
+pipeline that the manifest no longer lists are left behind.
+
+measure_recall() samples stored vectors as queries and compares the HNSW
+results with an exact brute-force search, reporting recall@k and query
+latency, so parameters can be chosen per database:
+
+- M: graph links per node; more improves recall at the cost of memory.
+- construction_ef: candidates considered while building; slower builds, better graphs.
+- search_ef: candidates considered per query; higher recall, slower queries.
+"""
+import os
+import time
+import random
+
+from index_manifest import IndexManifest
+from lexical_index import INDEX_FILE as LEXICAL_INDEX_FILE, LexicalIndex
+from dedup import INDEX_FILE as DEDUP_INDEX_FILE, DedupIndex
+
+# Collection langchain_chroma uses when no name is given
+COLLECTION_NAME = "langchain"
+_REBUILD_NAME = f"{COLLECTION_NAME}_rebuild"
+
+# Chroma's defaults, used for collections created without HNSW settings
+DEFAULT_HNSW = {"M": 16, "construction_ef": 100, "search_ef": 10}
+_HNSW_KEYS = {"M": "hnsw:M", "construction_ef": "hnsw:construction_ef", "search_ef": "hnsw:search_ef"}
+
+# Records copied or scanned per Chroma call
+BATCH_SIZE = 5000
+
+
+def open_collection(db_path):
+    """Return (client, collection) for a database, finishing any interrupted rebuild first."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.expanduser(db_path))
+    names = {getattr(collection, "name", collection) for collection in client.list_collections()}
+    if _REBUILD_NAME in names:
+        if COLLECTION_NAME in names:
+            # The copy never finished, the original is intact
+            client.delete_collection(_REBUILD_NAME)
+        else:
+            # The original was already deleted, only the rename is missing
+            client.get_collection(_REBUILD_NAME, embedding_function=None).modify(name=COLLECTION_NAME)
+    return client, client.get_collection(COLLECTION_NAME, embedding_function=None)
+
+
+def hnsw_params(collection):
+    """Return the collection's HNSW parameters, with Chroma's defaults for unset ones."""
+    metadata = collection.metadata or {}
+    return {name: metadata.get(key, DEFAULT_HNSW[name]) for name, key in _HNSW_KEYS.items()}
+
+
+def _batches(collection, include):
+    offset = 0
+    while True:
+        batch = collection.get(include=include, limit=BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def _distances(np, space, vectors, queries):
+    """Return the (queries x vectors) distance matrix Chroma would compute for a space."""
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        return 1.0 - queries @ vectors.T
+    if space == "ip":
+        return 1.0 - queries @ vectors.T
+    # Squared L2
+    return (queries ** 2).sum(axis=1)[:, None] - 2.0 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+
+
+def measure_recall(collection, k=10, samples=100, seed=0):
+    """Compare HNSW results for sampled stored vectors with an exact search.
+
+    Each sampled vector is used as a query and itself is left out of both
+    result lists. The exact search streams the collection in batches, so
+    memory stays at one batch plus the running top k per query. Returns a
+    dict with recall_at_k, the queries run, and HNSW and brute-force
+    latency in milliseconds.
+    """
+    import numpy as np
+
+    ids = collection.get(include=[])["ids"]
+    if len(ids) <= k:
+        return {"chunks": len(ids), "k": k, "queries": 0, "recall_at_k": None}
+
+    query_ids = random.Random(seed).sample(ids, min(samples, len(ids)))
+    found = collection.get(ids=query_ids, include=["embeddings"])
+    by_id = dict(zip(found["ids"], found["embeddings"]))
+    query_ids = [chunk_id for chunk_id in query_ids if chunk_id in by_id]
+    queries = np.asarray([by_id[chunk_id] for chunk_id in query_ids], dtype=np.float32)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+
+    # Exact top k + 1 per query, merged batch by batch
+    start = time.perf_counter()
+    best_distances = np.full((len(query_ids), 0), np.inf, dtype=np.float32)
+    best_ids = np.empty((len(query_ids), 0), dtype=object)
+    for batch in _batches(collection, ["embeddings"]):
+        distances = np.concatenate([best_distances, _distances(np, space, np.asarray(batch["embeddings"], dtype=np.float32), queries)], axis=1)
+        candidates = np.concatenate([best_ids, np.broadcast_to(np.asarray(batch["ids"], dtype=object), (len(query_ids), len(batch["ids"])))], axis=1)
+        keep = min(k + 1, distances.shape[1])
+        top = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+        best_distances = np.take_along_axis(distances, top, axis=1)
+        best_ids = np.take_along_axis(candidates, top, axis=1)
+    brute_force_seconds = time.perf_counter() - start
+
+    order = np.argsort(best_distances, axis=1)
+    exact = np.take_along_axis(best_ids, order, axis=1)
+
+    latencies = []
+    hits = 0
+    for row, (chunk_id, query) in enumerate(zip(query_ids, queries)):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k + 1, include=[])
+        latencies.append(time.perf_counter() - start)
+        approximate = [found_id for found_id in result["ids"][0] if found_id != chunk_id][:k]
+        expected = [found_id for found_id in exact[row] if found_id != chunk_id][:k]
+        hits += len(set(approximate) & set(expected))
+
+    latencies.sort()
+    return {
+        "chunks": len(ids),
+        "k": k,
+        "queries": len(query_ids),
+        "recall_at_k": round(hits / (len(query_ids) * k), 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+        "brute_force_ms_per_query": round(brute_force_seconds / len(query_ids) * 1000, 2),
+    }
+
+
+def stale_chunk_ids(collection, manifest):
+    """Return IDs of pipeline-written chunks whose files the manifest no longer lists.
+
+    Chunks without a chunk_id were added before the manifest existed and are
+    never considered stale. Returns an empty list when the manifest is empty,
+    since then nothing can be told apart.
+    """
+    if not manifest.files:
+        return []
+    recorded = {chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"]}
+    stale = []
+    for batch in _batches(collection, ["metadatas"]):
+        for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            if (metadata or {}).get("chunk_id") and chunk_id not in recorded:
+                stale.append(chunk_id)
+    return stale
+
+
+def rebuild_collection(client, collection, hnsw, skip_ids=()):
+    """Copy a collection into a new one with the given HNSW parameters and swap it in.
+
+    Records in skip_ids are not copied. Returns the new collection.
+    """
+    metadata = dict(collection.metadata or {})
+    metadata.update({_HNSW_KEYS[name]: int(value) for name, value in hnsw.items()})
+    skip_ids = set(skip_ids)
+
+    new = client.create_collection(_REBUILD_NAME, metadata=metadata, embedding_function=None)
+    for batch in _batches(collection, ["embeddings", "documents", "metadatas"]):
+        rows = [row for row in zip(batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"]) if row[0] not in skip_ids]
+        # Chroma rejects empty metadata, so chunks without any are added separately
+        for with_metadata in (True, False):
+            selected = [row for row in rows if bool(row[3]) == with_metadata]
+            if selected:
+                chunk_ids, embeddings, documents, metadatas = zip(*selected)
+                new.add(
+                    ids=list(chunk_ids),
+                    embeddings=[embedding.tolist() if hasattr(embedding, "tolist") else list(embedding) for embedding in embeddings],
+                    documents=list(documents),
+                    metadatas=list(metadatas) if with_metadata else None,
+                )
+
+    # If interrupted after this point, open_collection() completes the swap
+    client.delete_collection(COLLECTION_NAME)
+    new.modify(name=COLLECTION_NAME)
+    return client.get_collection(COLLECTION_NAME, embedding_function=None)
+
+
+def _drop_from_side_indexes(db_path, chunk_ids):
+    """Remove chunk IDs from the lexical and dedup indexes next to the database, if they exist."""
+    db_path = os.path.expanduser(db_path)
+    if os.path.isfile(os.path.join(db_path, LEXICAL_INDEX_FILE)):
+        lexical_index = LexicalIndex(db_path)
+        lexical_index.remove_many(chunk_ids)
+        lexical_index.save()
+    if os.path.isfile(os.path.join(db_path, DEDUP_INDEX_FILE)):
+        dedup = DedupIndex(db_path)
+        dropped = set(chunk_ids)
+        for source, stored in list(dedup.files.items()):
+            if dropped.intersection(stored):
+                dedup.forget_file(source)
+        dedup.save()
+
+
+def tune_database(db_path, hnsw=None, compact=True, k=10, samples=100, seed=0):
+    """Measure a database's recall and latency, rebuild it with hnsw parameters, and measure again.
+
+    hnsw maps M, construction_ef and search_ef to values; missing ones keep
+    the collection's current settings. With hnsw=None only the measurement
+    runs. compact leaves out stale chunks while rebuilding. Returns a report
+    dict with the parameters and the before and after measurements.
+    """
+    client, collection = open_collection(db_path)
+    current = hnsw_params(collection)
+    report = {"database": db_path, "before": {"hnsw": current, **measure_recall(collection, k, samples, seed)}}
+    if hnsw is None:
+        return report
+
+    params = {**current, **{name: value for name, value in hnsw.items() if value is not None}}
+    stale = stale_chunk_ids(collection, IndexManifest(db_path)) if compact else []
+    start = time.perf_counter()
+    collection = rebuild_collection(client, collection, params, skip_ids=stale)
+    report["rebuild_seconds"] = round(time.perf_counter() - start, 2)
+    report["stale_chunks_removed"] = len(stale)
+    if stale:
+        _drop_from_side_indexes(db_path, stale)
+
+    report["after"] = {"hnsw": hnsw_params(collection), **measure_recall(collection, k, samples, seed)}
+    return report
+
+
+def format_report(report):
+    """Return a report from tune_database as readable lines."""
+    def line(label, result):
+        hnsw = ", ".join(f"{name}={value}" for name, value in result["hnsw"].items())
+        if result.get("recall_at_k") is None:
+            return f"{label}: {result['chunks']} chunks, too few to measure ({hnsw})"
+        return (
+            f"{label}: recall@{result['k']} {result['recall_at_k']:.3f}, p50 {result['p50_ms']}ms, "
+            f"p95 {result['p95_ms']}ms over {result['queries']} queries, {result['chunks']} chunks ({hnsw})"
+        )
+
+    lines = [line("Before", report["before"])]
+    if "after" in report:
+        lines.append(f"Rebuilt in {report['rebuild_seconds']}s, {report['stale_chunks_removed']} stale chunk(s) removed.")
+        lines.append(line("After", report["after"]))
+    return "\n".join(lines)
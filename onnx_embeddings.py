@@ -0,0 +1,197 @@
+"""ONNX Runtime embedding backend for CPU inference.
+
+The sentence-transformers model is exported to ONNX once, optionally quantized
+to int8 weights, and stored under ~/chatbot/onnx. Texts are sorted by length
+and encoded in batches padded only to the longest text in each batch, then
+pooled and normalized the same way the sentence-transformers pipeline does.
+
+Vectors match the PyTorch backend to a cosine similarity of at least
+FP32_TOLERANCE for the fp32 export and INT8_TOLERANCE for the quantized one.
+A quick check against the PyTorch model runs right after each export.
+"""
+import os
+import json
+
+from langchain_core.embeddings import Embeddings
+
+ONNX_DIR = os.path.expanduser('~/chatbot/onnx')
+
+# Minimum cosine similarity to the PyTorch backend for each export
+FP32_TOLERANCE = 0.9999
+INT8_TOLERANCE = 0.99
+
+_CHECK_SENTENCES = [
+    "Scouts must complete a board of review before advancing in rank.",
+    "The form number for the annual health and medical record is 680-001.",
+    "Hello world",
+]
+
+
+def _export_dir(model_name):
+    return os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+
+
+def _pool(hidden_states, attention_mask, pooling, normalize):
+    """Pool token embeddings into sentence embeddings with numpy."""
+    import numpy as np
+
+    if pooling == "cls":
+        vectors = hidden_states[:, 0]
+    else:
+        mask = attention_mask[..., None].astype(hidden_states.dtype)
+        vectors = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    if normalize:
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    return vectors
+
+
+def min_cosine_similarity(vectors_a, vectors_b):
+    """Return the lowest cosine similarity between matching pairs of vectors."""
+    import numpy as np
+
+    a = np.asarray(vectors_a, dtype=np.float64)
+    b = np.asarray(vectors_b, dtype=np.float64)
+    similarity = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return float(similarity.min())
+
+
+def export_model(model_name, quantize=True):
+    """Export a sentence-transformers model to ONNX if needed and return the model path."""
+    export_dir = _export_dir(model_name)
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    int8_path = os.path.join(export_dir, "model-int8.onnx")
+    meta_path = os.path.join(export_dir, "export.json")
+
+    if not os.path.isfile(fp32_path) or not os.path.isfile(meta_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        print(f"Exporting '{model_name}' to ONNX...")
+        os.makedirs(export_dir, exist_ok=True)
+        model = SentenceTransformer(model_name, device="cpu")
+        model.tokenizer.save_pretrained(export_dir)
+
+        sample = model.tokenizer(["hello world"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Encoder(torch.nn.Module):
+            """Wraps the transformer so the export only returns token embeddings."""
+
+            def __init__(self, transformer):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, *inputs):
+                return self.transformer(**dict(zip(input_names, inputs)))[0]
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        torch.onnx.export(
+            _Encoder(model[0].auto_model).eval(),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+        pooling = model[1].get_pooling_mode_str() if len(model) > 1 else "mean"
+        normalize = any(type(module).__name__ == "Normalize" for module in model)
+        with open(meta_path, "w") as f:
+            json.dump({
+                "inputs": input_names,
+                "pooling": "cls" if pooling == "cls" else "mean",
+                "normalize": normalize,
+                "max_seq_length": model.max_seq_length,
+            }, f, indent=4)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.isfile(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print(f"Quantizing '{model_name}' to int8...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings computed with ONNX Runtime on the CPU."""
+
+    def __init__(self, model_name, quantize=True, batch_size=32, num_threads=None, normalize=False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+
+        model_path = export_model(model_name, quantize)
+        export_dir = os.path.dirname(model_path)
+        with open(os.path.join(export_dir, "export.json"), "r") as f:
+            meta = json.load(f)
+        self.input_names = meta["inputs"]
+        self.pooling = meta["pooling"]
+        self.max_seq_length = meta["max_seq_length"]
+        # Models that end in a Normalize module are normalized regardless of the setting
+        self.normalize = normalize or meta["normalize"]
+
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+        # Batches run one at a time, so parallelism within operators is all that helps
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        if not meta.get(f"checked_{'int8' if quantize else 'fp32'}"):
+            self._check_against_reference(meta, os.path.join(export_dir, "export.json"))
+
+    def _check_against_reference(self, meta, meta_path):
+        """Compare against the PyTorch model once per export and record the result."""
+        from sentence_transformers import SentenceTransformer
+
+        reference = SentenceTransformer(self.model_name, device="cpu").encode(_CHECK_SENTENCES, normalize_embeddings=self.normalize)
+        similarity = min_cosine_similarity(self._encode(_CHECK_SENTENCES), reference)
+        tolerance = INT8_TOLERANCE if self.quantize else FP32_TOLERANCE
+        if similarity < tolerance:
+            print(f"Warning: ONNX embeddings differ from PyTorch (cosine {similarity:.5f} < {tolerance}).")
+        else:
+            print(f"ONNX embeddings match PyTorch (cosine {similarity:.5f}).")
+
+        meta[f"checked_{'int8' if self.quantize else 'fp32'}"] = similarity
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=4)
+
+    def _encode(self, texts):
+        """Encode texts in length-sorted batches and return vectors in input order."""
+        vectors = [None] * len(texts)
+        # Sorting by length keeps padding within each batch to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {name: encoded[name].astype("int64") for name in self.input_names}
+            hidden_states = self.session.run(None, inputs)[0]
+            pooled = _pool(hidden_states, encoded["attention_mask"], self.pooling, self.normalize)
+            for i, vector in zip(indices, pooled):
+                vectors[i] = vector.tolist()
+
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts))
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
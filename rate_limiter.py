@@ -0,0 +1,98 @@
+"""Per-host token-bucket rate limiting for crawling and downloading.
+
+Every page navigation and PDF download takes a token from its host's bucket
+before it is sent. Buckets refill at up to max_requests_per_minute. A 429 or
+503 response halves the host's rate and pauses it for the Retry-After period;
+after a run of successful responses the rate climbs back toward the maximum.
+"""
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Statuses that mean the server wants us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+# Successful responses needed before the rate is raised again
+_RECOVERY_STREAK = 10
+
+
+def parse_retry_after(value):
+    """Return the delay in seconds from a Retry-After header, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.streak = 0
+        self.lock = asyncio.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class HostRateLimiter:
+    """Adaptive token bucket per host, shared by every crawl task."""
+
+    def __init__(self, max_requests_per_minute, burst=None, min_requests_per_minute=1, default_backoff=30.0):
+        self.max_rate = max(max_requests_per_minute, min_requests_per_minute) / 60.0
+        self.min_rate = min_requests_per_minute / 60.0
+        # Allow up to one second's worth of requests at once, and always at least one
+        self.burst = burst or max(1, int(self.max_rate))
+        self.default_backoff = default_backoff
+        self._buckets = {}
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc.lower()
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = _HostBucket(self.max_rate, self.burst)
+        return bucket
+
+    async def acquire(self, url):
+        """Wait until a request to url's host is allowed."""
+        bucket = self._bucket(url)
+        # Waiters queue on the lock, so requests to a host go out in arrival order
+        async with bucket.lock:
+            while True:
+                now = time.monotonic()
+                if now < bucket.blocked_until:
+                    await asyncio.sleep(bucket.blocked_until - now)
+                    continue
+
+                bucket.refill(now)
+                if bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+
+    def record(self, url, status, retry_after=None):
+        """Adjust the host's rate from a response status and Retry-After header."""
+        bucket = self._bucket(url)
+        if status in THROTTLE_STATUSES:
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.tokens = 0
+            bucket.streak = 0
+            delay = parse_retry_after(retry_after)
+            bucket.blocked_until = time.monotonic() + (delay if delay is not None else self.default_backoff)
+            print(f"Throttled by {urlparse(url).netloc} ({status}), slowing to {bucket.rate * 60:.1f} requests/minute")
+        elif status < 400:
+            bucket.streak += 1
+            if bucket.rate < self.max_rate and bucket.streak >= _RECOVERY_STREAK:
+                # Additive increase, so recovery is gradual after a multiplicative cut
+                bucket.rate = min(self.max_rate, bucket.rate + self.max_rate / 10)
+                bucket.streak = 0
@@ -0,0 +1,150 @@
+"""Retrieval across several Chroma databases at once."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from instrumentation import span
+
+
+def _fusion_key(doc):
+    # Chunks written by the ingestion pipeline carry their ID; older ones are matched by text
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def reciprocal_rank_fusion(ranked_lists, k, rrf_k=60):
+    """Merge ranked document lists, scoring each document by the sum of 1 / (rrf_k + rank)."""
+    scores = {}
+    docs = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked, start=1):
+            key = _fusion_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+class MultiStoreRetriever(BaseRetriever):
+    """Search several vector stores concurrently and merge the hits into one top-k.
+
+    The query is embedded once for every distinct embedding function, each
+    store is searched on a thread pool, and the hits are ranked together by
+    distance. Per-store latency of the last search is kept in last_timings.
+
+    When lexical_indexes are given (one per store, None to skip a store), each
+    store also runs a BM25 search, and the dense and lexical lists of every
+    store are combined with reciprocal-rank fusion over the top candidates.
+
+    duplicate_sources (DuplicateSources, one per store) add a "duplicates"
+    list to each result's metadata with the files whose chunks were dropped
+    as copies of it, so references can cite them.
+    """
+
+    vector_stores: list
+    names: list = []
+    k: int = 4
+    max_workers: int = 8
+    lexical_indexes: list = []
+    candidates: int = 20
+    rrf_k: int = 60
+    duplicate_sources: list = []
+    last_timings: dict = {}
+
+    def _store_name(self, index):
+        return self.names[index] if index < len(self.names) else f"store {index + 1}"
+
+    def _hybrid(self):
+        return any(index is not None for index in self.lexical_indexes)
+
+    def _lexical_search(self, store, lexical_index, query):
+        hits = lexical_index.search(query, k=self.candidates)
+        if not hits:
+            return []
+        chunk_ids = [chunk_id for chunk_id, _ in hits]
+        found = store.get(ids=chunk_ids, include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: Document(page_content=text or "", metadata=metadata or {})
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        # Keep BM25 order; chunks missing from the store are skipped
+        return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+    def _search(self, index, query, query_vector):
+        start = time.perf_counter()
+        store = self.vector_stores[index]
+        lexical_index = self.lexical_indexes[index] if index < len(self.lexical_indexes) else None
+        k = self.candidates if self._hybrid() else self.k
+        name = self._store_name(index)
+        with span("chroma_query", store=name):
+            results = store.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+        lexical = []
+        if lexical_index is not None:
+            with span("lexical_query", store=name):
+                lexical = self._lexical_search(store, lexical_index, query)
+        return results, lexical, time.perf_counter() - start
+
+    def embedding_functions(self):
+        """Return the distinct embedding functions of the stores, keyed by id()."""
+        functions = {}
+        for store in self.vector_stores:
+            functions.setdefault(id(store.embeddings), store.embeddings)
+        return functions
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        # Stores sharing an embedding function only need the query embedded once
+        start = time.perf_counter()
+        with span("query_embed"):
+            query_vectors = {key: embeddings.embed_query(query) for key, embeddings in self.embedding_functions().items()}
+        return self.search_by_vectors(query, query_vectors, {"embed": time.perf_counter() - start})
+
+    def search_by_vectors(self, query, query_vectors, timings=None):
+        """Search with query vectors embedded elsewhere, keyed like embedding_functions()."""
+        timings = dict(timings or {})
+        hits = []
+        ranked_lists = []
+        workers = max(1, min(self.max_workers, len(self.vector_stores)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._search, index, query, query_vectors[id(store.embeddings)])
+                for index, store in enumerate(self.vector_stores)
+            ]
+            for index, future in enumerate(futures):
+                name = self._store_name(index)
+                try:
+                    results, lexical, elapsed = future.result()
+                except Exception as e:
+                    # One failing database should not stop the others from answering
+                    print(f"Error searching '{name}': {e}")
+                    continue
+                timings[name] = elapsed
+                hits.extend(results)
+                ranked_lists.append([doc for doc, _ in results])
+                if lexical:
+                    ranked_lists.append(lexical)
+
+        self.last_timings = timings
+
+        if self._hybrid():
+            return self._add_duplicates(reciprocal_rank_fusion(ranked_lists, self.k, self.rrf_k))
+
+        # Chroma returns distances, so smaller is closer
+        hits.sort(key=lambda hit: hit[1])
+        return self._add_duplicates([doc for doc, _ in hits[:self.k]])
+
+    def _add_duplicates(self, docs):
+        for doc in docs:
+            chunk_id = doc.metadata.get("chunk_id")
+            if not chunk_id:
+                continue
+            # Chunk IDs are unique across databases, so a chunk dropped in one database can point at another
+            duplicates = [found for sources in self.duplicate_sources for found in sources.get(chunk_id)]
+            if duplicates:
+                doc.metadata = {**doc.metadata, "duplicates": duplicates}
+        return docs
+
+
+def format_timings(timings):
+    """Format retrieval timings as a single line in milliseconds."""
+    return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items())
@@ -0,0 +1,285 @@
+"""Long-running HTTP server for answering queries against warm models.
+
+Started with the script's `serve` command. The embedding model, vector
+stores, lexical indexes and LLM client are loaded once and shared by every
+request:
+
+- POST /query  {"question": "..."} -> {"answer", "sources", "cached", "timings"}
+- POST /ingest {"database": "<id>", "directory": "..."} -> chunk and file counts
+- GET  /health -> status, databases and load
+- GET  /metrics -> instrumentation counters and spans in Prometheus text format
+
+Queries arriving together have their embeddings computed in one batch, then
+retrieval and generation run on a bounded thread pool. Once max_queue
+queries are in progress, further ones are turned away with 503 instead of
+piling up.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import instrumentation
+from instrumentation import span
+
+
+class EmbeddingBatcher:
+    """Collects texts from concurrent requests and embeds them in one call.
+
+    A batch is sent once max_batch_size texts are waiting or max_wait seconds
+    after the first one arrived, whichever comes first.
+    """
+
+    def __init__(self, embeddings, executor, max_batch_size=32, max_wait=0.005):
+        self.embeddings = embeddings
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.texts = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def embed(self, text):
+        """Return the embedding of one text, computed together with any concurrent ones."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                # Query and document embeddings are the same for the sentence-transformer models used here
+                vectors = await loop.run_in_executor(self.executor, self.embeddings.embed_documents, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+class QueryService:
+    """Answers questions over one set of databases with a shared retriever and LLM.
+
+    prompt is the QA PromptTemplate, formatted with an empty history since
+    server requests are independent. ingest(database_id, directory, chunk_size,
+    chunk_overlap), when given, indexes a directory and returns
+    (chunks_written, files_changed, files_removed); ingests run one at a time.
+    """
+
+    def __init__(self, retriever, llm, prompt, selected_paths, names=(), answer_cache=None, ingest=None, max_workers=4, max_queue=64, embed_batch_size=32, embed_wait=0.005):
+        self.retriever = retriever
+        self.llm = llm
+        self.prompt = prompt
+        self.selected_paths = selected_paths
+        self.names = list(names)
+        self.answer_cache = answer_cache
+        self.ingest_function = ingest
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self.ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        # Embedding has its own thread so batches are not held up behind LLM calls
+        self.embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.batchers = {
+            key: EmbeddingBatcher(embeddings, self.embed_executor, embed_batch_size, embed_wait)
+            for key, embeddings in retriever.embedding_functions().items()
+        }
+        self.started = time.time()
+        self.waiting = 0
+        self.answered = 0
+
+    def warm_up(self):
+        """Load models and indexes before the first request by running a throwaway search."""
+        start = time.perf_counter()
+        query_vectors = {key: embeddings.embed_query("warm up") for key, embeddings in self.retriever.embedding_functions().items()}
+        self.retriever.search_by_vectors("warm up", query_vectors)
+        print(f"Warmed up in {time.perf_counter() - start:.2f}s")
+
+    async def start(self):
+        for batcher in self.batchers.values():
+            batcher.start()
+
+    async def stop(self):
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        for executor in (self.executor, self.embed_executor, self.ingest_executor):
+            executor.shutdown(wait=False)
+
+    def _generate(self, question, query_vectors, timings):
+        first_vector = next(iter(query_vectors.values()))
+        if self.answer_cache is not None:
+            cached = self.answer_cache.lookup(self.selected_paths, question, first_vector)
+            if cached:
+                response, source_docs = cached
+                return response, source_docs, True, timings
+
+        start = time.perf_counter()
+        docs = self.retriever.search_by_vectors(question, query_vectors)
+        timings["retrieval"] = time.perf_counter() - start
+
+        # Same layout as the "stuff" chain: documents separated by blank lines
+        context = "\n\n".join(doc.page_content for doc in docs)
+        start = time.perf_counter()
+        with span("llm_generation"):
+            message = self.llm.invoke(self.prompt.format(history="", context=context, question=question))
+        response = getattr(message, "content", message)
+        timings["generation"] = time.perf_counter() - start
+
+        if self.answer_cache is not None:
+            self.answer_cache.store(self.selected_paths, question, first_vector, response, docs)
+        return response, docs, False, timings
+
+    async def answer(self, question):
+        """Return (answer, source_documents, cached, timings) for a question."""
+        start = time.perf_counter()
+        keys = list(self.batchers)
+        vectors = await asyncio.gather(*[self.batchers[key].embed(question) for key in keys])
+        timings = {"embed": time.perf_counter() - start}
+
+        loop = asyncio.get_running_loop()
+        response, docs, cached, timings = await loop.run_in_executor(self.executor, self._generate, question, dict(zip(keys, vectors)), timings)
+        timings["total"] = time.perf_counter() - start
+        self.answered += 1
+        return response, docs, cached, timings
+
+    async def ingest(self, database_id, directory, chunk_size=None, chunk_overlap=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.ingest_executor, self.ingest_function, database_id, directory, chunk_size, chunk_overlap)
+
+
+def _source(doc):
+    # also_in lists the files whose chunks were dropped as duplicates of this one
+    return {"source": doc.metadata.get("source"), "page": doc.metadata.get("page"), "also_in": doc.metadata.get("duplicates", [])}
+
+
+async def handle_query(request):
+    service = request.app["service"]
+    try:
+        body = await request.json()
+        question = body["question"].strip()
+    except (ValueError, KeyError, AttributeError):
+        return web.json_response({"error": 'Expected a JSON body with a "question" string'}, status=400)
+
+    if service.waiting >= service.max_queue:
+        return web.json_response({"error": "Too many queries waiting, try again shortly"}, status=503, headers={"Retry-After": "1"})
+
+    service.waiting += 1
+    try:
+        response, docs, cached, timings = await service.answer(question)
+    except Exception as e:
+        return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=500)
+    finally:
+        service.waiting -= 1
+
+    return web.json_response({
+        "answer": response,
+        "sources": [_source(doc) for doc in docs],
+        "cached": cached,
+        "timings": {name: round(seconds, 4) for name, seconds in timings.items()},
+    })
+
+
+async def handle_ingest(request):
+    service = request.app["service"]
+    if service.ingest_function is None:
+        return web.json_response({"error": "Ingestion is not enabled on this server"}, status=404)
+    try:
+        body = await request.json()
+        database_id = str(body["database"])
+        directory = body["directory"]
+    except (ValueError, KeyError):
+        return web.json_response({"error": 'Expected a JSON body with "database" and "directory"'}, status=400)
+
+    start = time.perf_counter()
+    try:
+        written, changed, removed = await service.ingest(database_id, directory, body.get("chunk_size"), body.get("chunk_overlap"))
+    except (KeyError, ValueError) as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=500)
+
+    return web.json_response({
+        "chunks_written": written,
+        "files_changed": changed,
+        "files_removed": removed,
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+
+
+async def handle_health(request):
+    service = request.app["service"]
+    batches = sum(batcher.batches for batcher in service.batchers.values())
+    texts = sum(batcher.texts for batcher in service.batchers.values())
+    return web.json_response({
+        "status": "ok",
+        "databases": service.names,
+        "uptime_seconds": round(time.time() - service.started, 1),
+        "queries_answered": service.answered,
+        "queries_waiting": service.waiting,
+        "average_embedding_batch": round(texts / batches, 2) if batches else 0,
+    })
+
+
+async def handle_metrics(request):
+    return web.Response(text=instrumentation.registry.prometheus(), content_type="text/plain", charset="utf-8")
+
+
+def create_app(service):
+    """Build the aiohttp application for a QueryService."""
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/ingest", handle_ingest)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+
+    async def on_startup(app):
+        await service.start()
+
+    async def on_cleanup(app):
+        await service.stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def run_server(service, host="127.0.0.1", port=8080):
+    """Serve until cancelled."""
+    runner = web.AppRunner(create_app(service))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"Serving {', '.join(service.names)} on http://{host}:{port} (POST /query, POST /ingest, GET /health)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
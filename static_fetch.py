@@ -0,0 +1,95 @@
+"""Fetch pages over plain HTTP and pull out their links without a browser.
+
+The response body is fed to an HTMLParser chunk by chunk as it arrives, so
+pages are never held in memory as a whole. The parser also notes signs that a
+page builds its content with JavaScript, which is when the crawler falls back
+to Playwright.
+"""
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urldefrag
+
+# How pages are fetched: plain HTTP, a headless browser, or HTTP with a browser fallback
+FETCH_STRATEGIES = ("static", "browser", "auto")
+
+# Bytes read from the response per iteration
+CHUNK_SIZE = 64 * 1024
+
+# Pages larger than this are cut off; links past this point are ignored
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+
+# Element ids used as mount points by common single-page app frameworks
+_APP_ROOT_IDS = {"root", "app", "__next", "__nuxt", "svelte"}
+
+# Pages with less visible text than this and scripts are probably rendered client-side
+_MIN_TEXT_LENGTH = 200
+
+
+class LinkExtractor(HTMLParser):
+    """Collects <a href> links, resolved against the page URL and any <base href>."""
+
+    def __init__(self, url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = url
+        self.links = []
+        self.script_count = 0
+        self.text_length = 0
+        self.has_app_root = False
+        self._in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
+        elif tag == "a" and attrs.get("href"):
+            href = attrs["href"].strip()
+            if not href.lower().startswith(("javascript:", "mailto:", "tel:", "data:")):
+                self.links.append(urldefrag(urljoin(self.base_url, href))[0])
+        elif tag == "script":
+            self.script_count += 1
+            self._in_script = True
+        elif attrs.get("id") in _APP_ROOT_IDS:
+            self.has_app_root = True
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self._in_script = False
+
+    def handle_data(self, data):
+        if not self._in_script:
+            self.text_length += len(data.strip())
+
+    def needs_browser(self):
+        """Guess whether the page only shows its links after JavaScript runs."""
+        if not self.script_count:
+            return False
+        return not self.links or self.has_app_root or self.text_length < _MIN_TEXT_LENGTH
+
+
+async def fetch_links(session, url):
+    """GET a page and return (status, headers, links, needs_browser).
+
+    Non-HTML responses return no links. needs_browser is True when the page
+    looks like it is rendered client-side.
+    """
+    async with session.get(url) as response:
+        content_type = response.headers.get("Content-Type", "")
+        if response.status >= 400 or "html" not in content_type.lower():
+            return response.status, response.headers, [], False
+
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+        except LookupError:
+            # An unknown charset label should not cost the page its links
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        extractor = LinkExtractor(str(response.url))
+        received = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            extractor.feed(decoder.decode(chunk))
+            received += len(chunk)
+            if received >= MAX_PAGE_BYTES:
+                break
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+
+        return response.status, response.headers, extractor.links, extractor.needs_browser()
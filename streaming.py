@@ -0,0 +1,85 @@
+"""Print LLM tokens as they arrive and time each streamed answer."""
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from instrumentation import increment, observe
+
+
+class StreamingPrinter(BaseCallbackHandler):
+    """Callback handler that prints tokens as they are generated.
+
+    Call start_turn() when the user submits a query; time to first token is
+    measured from then, so it includes retrieval. Tokens per second covers the
+    generation after the first token.
+    """
+
+    def __init__(self, prefix="ScoutAI: "):
+        self.prefix = prefix
+        self.start_turn()
+
+    def start_turn(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.tokens = 0
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            print(self.prefix, end="", flush=True)
+        self.tokens += 1
+        print(token, end="", flush=True)
+
+    def on_llm_end(self, response, **kwargs):
+        self.finished_at = time.perf_counter()
+        if self.tokens:
+            print()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_token_at
+        return self.tokens / elapsed if elapsed > 0 else None
+
+    def summary(self):
+        """Return the timing of the last turn as a single line."""
+        ttft = self.time_to_first_token
+        rate = self.tokens_per_second
+        parts = [f"time to first token {ttft:.2f}s" if ttft is not None else "no tokens streamed"]
+        if rate is not None:
+            parts.append(f"{rate:.1f} tokens/s")
+        parts.append(f"{self.tokens} tokens")
+        return ", ".join(parts)
+
+
+class LlmMetricsHandler(BaseCallbackHandler):
+    """Records the duration and streamed token count of every LLM call."""
+
+    def __init__(self):
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token, **kwargs):
+        increment("llm_tokens")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            observe("llm_generation_seconds", time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        increment("llm_errors")
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+from langchain_core.documents import Document
+
+from answer_cache import AnswerCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_invalidate_does_not_load_numpy_or_langchain(tmp_path):
+    # Run in a fresh interpreter, since this one has already imported both
+    code = (
+        "import sys, answer_cache\n"
+        f"answer_cache.AnswerCache({str(tmp_path / 'answers.sqlite')!r}).invalidate('/db')\n"
+        "print(sorted(name for name in ('numpy', 'langchain_core') if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_lookup_matches_exact_and_similar_queries(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), similarity_threshold=0.9)
+    cache.store(["/db/a"], "What is the W-2 policy?", [1.0, 0.0, 0.0], "An answer.", [Document(page_content="text", metadata={"source": "a.pdf"})])
+
+    answer, documents = cache.lookup(["/db/a"], "  what is the w-2 POLICY? ", [0.0, 1.0, 0.0])
+    assert answer == "An answer."
+    assert documents[0].metadata == {"source": "a.pdf"}
+    assert cache.lookup(["/db/a"], "Something else", [0.99, 0.05, 0.0])[0] == "An answer."
+    assert cache.lookup(["/db/a"], "Something else", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup(["/db/b"], "What is the W-2 policy?", [1.0, 0.0, 0.0]) is None
+
+    cache.invalidate("/db/a")
+    assert cache.lookup(["/db/a"], "What is the W-2 policy?", [1.0, 0.0, 0.0]) is None
+
+
+def test_expired_and_least_recently_used_entries_are_dropped(tmp_path, monkeypatch):
+    import answer_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl_seconds=100, max_entries=2)
+    for number in range(2):
+        cache.store(["/db"], f"question {number}", [1.0, float(number)], f"answer {number}", [])
+        now[0] += 1
+    # Using the first answer makes the second the least recently used
+    assert cache.lookup(["/db"], "question 0", [0.0, 0.0])[0] == "answer 0"
+    cache.store(["/db"], "question 2", [0.0, 1.0], "answer 2", [])
+
+    assert cache.lookup(["/db"], "question 1", [-1.0, 0.0]) is None
+    assert cache.lookup(["/db"], "question 0", [-1.0, 0.0])[0] == "answer 0"
+
+    now[0] += 200
+    assert cache.lookup(["/db"], "question 2", [0.0, 1.0]) is None
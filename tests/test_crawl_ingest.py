@@ -0,0 +1,24 @@
+import time
+
+from crawl_ingest import CrawlIndexer
+from index_manifest import IndexManifest
+
+
+def test_close_indexes_files_queued_while_draining(tmp_path):
+    indexer = CrawlIndexer(None, IndexManifest(str(tmp_path)), 500, 50, max_workers=1)
+    indexed = []
+
+    def index(file_path, result, queued_at):
+        indexed.append(file_path)
+        if len(indexed) == 1:
+            # Wait for close() to queue its sentinel, then re-queue an orphan behind it
+            deadline = time.monotonic() + 10
+            while indexer.pending() == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            indexer.enqueue(str(tmp_path / "orphan.pdf"))
+
+    indexer._index = index
+    indexer.enqueue(str(tmp_path / "first.pdf"))
+    indexer.close()
+
+    assert indexed == [str(tmp_path / "first.pdf"), str(tmp_path / "orphan.pdf")]
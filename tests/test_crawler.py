@@ -0,0 +1,141 @@
+import asyncio
+import os
+
+from aiohttp import web
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from crawler import DownloadLimit, download_pdf, scrape_for_pdfs
+from logging_models import Base, CompletedPagesLog, LogWriter, PdfDownloadLog
+from url_index import UrlIndex
+
+
+class FakeDownloader:
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.urls = []
+
+    async def download(self, url):
+        self.urls.append(url)
+        return "downloaded", os.path.join(self.download_dir, os.path.basename(url))
+
+
+class FakeLogWriter:
+    def log_pdf(self, url, status):
+        pass
+
+
+async def download_all(urls, limit, tmp_path):
+    downloader = FakeDownloader(str(tmp_path))
+    url_index = UrlIndex()
+    for url in urls:
+        await download_pdf(url, downloader, url_index, FakeLogWriter(), str(tmp_path / "batch.txt"), str(tmp_path / "pdf_log.txt"), limit)
+    return downloader.urls
+
+
+async def test_single_pdf_is_downloaded(tmp_path):
+    assert await download_all(["http://example.com/a.pdf"], DownloadLimit(1), tmp_path) == ["http://example.com/a.pdf"]
+
+
+async def test_limit_is_per_crawl(tmp_path):
+    urls = [f"http://example.com/{name}.pdf" for name in "abc"]
+    assert len(await download_all(urls, DownloadLimit(2), tmp_path)) == 2
+    # A second crawl in the same process gets its own count
+    assert len(await download_all(urls, DownloadLimit(2), tmp_path)) == 2
+
+
+def test_previous_downloads_are_claimed_only_to_revalidate():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(PdfDownloadLog(url="http://example.com/a.pdf", host="example.com", status="Downloaded"))
+    session.commit()
+    url_index = UrlIndex.load(session, "http://example.com/")
+    session.close()
+
+    assert "http://example.com/a.pdf" in url_index
+    assert not url_index.claim("http://example.com/a.pdf")
+    assert url_index.claim("http://example.com/a.pdf", revalidate=True)
+    url_index.add("http://example.com/a.pdf")
+    # Checked once per crawl
+    assert not url_index.claim("http://example.com/a.pdf", revalidate=True)
+
+
+# Two pages that link to each other and share one of their PDFs
+SITE = {
+    "/page/0": ["/page/1", "/pdf/0.pdf", "/pdf/1.pdf"],
+    "/page/1": ["/page/0", "/pdf/1.pdf", "/pdf/2.pdf"],
+}
+
+
+async def serve_site(aiohttp_server, requests, etag=None):
+    async def page(request):
+        requests.append((request.path, request.headers.get("If-None-Match")))
+        body = "".join(f'<a href="{link}">{link}</a>' for link in SITE[request.path])
+        return web.Response(text=f"<html><body>{body}</body></html>", content_type="text/html")
+
+    async def pdf(request):
+        requests.append((request.path, request.headers.get("If-None-Match")))
+        if etag and request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.Response(body=b"%PDF-1.4 " + request.path.encode(), headers={"ETag": etag} if etag else {})
+
+    app = web.Application()
+    app.router.add_get("/page/{number}", page)
+    app.router.add_get("/pdf/{name}", pdf)
+    return await aiohttp_server(app)
+
+
+async def crawl(server, tmp_path, session_factory):
+    """Run one crawl of the site, loading the URL index from the crawl log like run_crawl."""
+    session = session_factory()
+    url_index = UrlIndex.load(session, str(server.make_url("/page/0")))
+    session.close()
+    log_writer = LogWriter(session_factory)
+    await scrape_for_pdfs(
+        str(server.make_url("/page/0")), str(tmp_path / "downloads"), 2, 2, 100, 60000, "test", set(),
+        str(tmp_path / "pdf_log.txt"), str(tmp_path / "pages_log.txt"), url_index, str(tmp_path / "batch_urls.txt"),
+        asyncio.Semaphore(2), log_writer, strategy="static",
+    )
+    await asyncio.to_thread(log_writer.close)
+
+
+def log_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'log.sqlite'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+async def test_crawl_requests_each_url_once(aiohttp_server, tmp_path):
+    requests = []
+    server = await serve_site(aiohttp_server, requests)
+    session_factory = log_database(tmp_path)
+
+    await crawl(server, tmp_path, session_factory)
+
+    paths = [path for path, _ in requests]
+    assert sorted(paths) == ["/page/0", "/page/1", "/pdf/0.pdf", "/pdf/1.pdf", "/pdf/2.pdf"]
+    session = session_factory()
+    assert sorted(url.split("/", 3)[3] for (url,) in session.query(CompletedPagesLog.url)) == ["page/0", "page/1"]
+    session.close()
+
+
+async def test_second_crawl_revalidates_pdfs(aiohttp_server, tmp_path):
+    requests = []
+    server = await serve_site(aiohttp_server, requests, etag='"v1"')
+    session_factory = log_database(tmp_path)
+    # Written by crawls before PDF links were kept off the page frontier
+    session = session_factory()
+    session.add(CompletedPagesLog(url=str(server.make_url("/pdf/0.pdf")), host=f"127.0.0.1:{server.port}", status="Completed"))
+    session.commit()
+    session.close()
+
+    await crawl(server, tmp_path, session_factory)
+    first = len(requests)
+    await crawl(server, tmp_path, session_factory)
+
+    pdf_requests = sorted(request for request in requests[first:] if request[0].startswith("/pdf/"))
+    assert pdf_requests == [("/pdf/0.pdf", '"v1"'), ("/pdf/1.pdf", '"v1"'), ("/pdf/2.pdf", '"v1"')]
+    with open(tmp_path / "batch_urls.txt") as f:
+        # Unchanged PDFs are not downloaded or logged again
+        assert len(f.read().splitlines()) == 3
@@ -0,0 +1,46 @@
+import random
+
+from langchain_core.documents import Document
+
+from dedup import DedupIndex, DuplicateSources
+
+WORDS = "policy employee travel expense report manager approval receipt mileage hotel meal budget quarter form".split()
+
+
+def text(seed, words=120):
+    generator = random.Random(seed)
+    return " ".join(generator.choice(WORDS) for _ in range(words))
+
+
+def chunks(source, texts):
+    return [Document(page_content=content, metadata={"chunk_id": f"{source}:{number}", "page": number}) for number, content in enumerate(texts)]
+
+
+def test_exact_and_near_duplicates_are_dropped(tmp_path):
+    index = DedupIndex(str(tmp_path))
+    original = text(1)
+    kept = index.filter("a.pdf", chunks("a.pdf", [original, text(2)]))
+    assert len(kept) == 2
+
+    # Same text with different spacing and case, and the same text with its last word changed
+    near = original.rsplit(" ", 1)[0] + " zebra"
+    kept = index.filter("b.pdf", chunks("b.pdf", ["  " + original.upper() + "  ", near, text(3)]))
+
+    assert [chunk.metadata["chunk_id"] for chunk in kept] == ["b.pdf:2"]
+    assert index.stats == {"checked": 5, "exact": 1, "near": 1}
+    assert [record["duplicate_of"] for record in index.dropped["b.pdf"]] == ["a.pdf:0", "a.pdf:0"]
+
+
+def test_files_are_orphaned_when_their_canonical_file_is_removed(tmp_path):
+    index = DedupIndex(str(tmp_path))
+    shared = text(1)
+    index.filter("a.pdf", chunks("a.pdf", [shared]))
+    index.filter("b.pdf", chunks("b.pdf", [shared, text(2)]))
+    index.save()
+
+    assert DuplicateSources(str(tmp_path)).get("a.pdf:0") == [{"source": "b.pdf", "page": 0}]
+
+    loaded = DedupIndex(str(tmp_path))
+    assert loaded.orphaned_files() == []
+    loaded.forget_file("a.pdf")
+    assert loaded.orphaned_files() == ["b.pdf"]
@@ -0,0 +1,58 @@
+import asyncio
+
+from aiohttp import web
+
+from downloader import PdfDownloader
+from rate_limiter import HostRateLimiter
+
+BODY = b"%PDF-1.4 test body"
+
+
+async def test_throttled_download_retries_on_one_connection(aiohttp_server, tmp_path):
+    requests = []
+
+    async def pdf(request):
+        requests.append(request)
+        if len(requests) == 1:
+            # A body too large to be read ahead keeps the connection busy until the response is released
+            return web.Response(status=503, headers={"Retry-After": "0"}, body=b"x" * (4 * 1024 * 1024))
+        return web.Response(body=BODY)
+
+    app = web.Application()
+    app.router.add_get("/doc.pdf", pdf)
+    server = await aiohttp_server(app)
+
+    # With a single pooled connection the retry can only proceed once the 503 has released it
+    async with PdfDownloader(str(tmp_path), "test", max_connections=1, max_connections_per_host=1, rate_limiter=HostRateLimiter(6000)) as downloader:
+        status, file_path = await asyncio.wait_for(downloader.download(str(server.make_url("/doc.pdf"))), timeout=10)
+
+    assert status == "downloaded"
+    assert len(requests) == 2
+    with open(file_path, "rb") as f:
+        assert f.read() == BODY
+
+
+async def test_unchanged_download_is_revalidated(aiohttp_server, tmp_path):
+    conditions = []
+
+    async def pdf(request):
+        conditions.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=BODY, headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/doc.pdf", pdf)
+    server = await aiohttp_server(app)
+    url = str(server.make_url("/doc.pdf"))
+
+    async with PdfDownloader(str(tmp_path), "test") as downloader:
+        assert not downloader.can_revalidate(url)
+        assert (await downloader.download(url))[0] == "downloaded"
+
+    # A later crawl reads the stored validators from the download directory
+    async with PdfDownloader(str(tmp_path), "test") as downloader:
+        assert downloader.can_revalidate(url)
+        assert (await downloader.download(url))[0] == "not_modified"
+
+    assert conditions == [None, '"v1"']
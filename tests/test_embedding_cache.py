@@ -0,0 +1,49 @@
+from embedding_cache import CachedEmbeddings, EmbeddingCache, text_hash
+
+
+def stored_bytes(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+
+def test_size_counts_replaced_vectors_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    items = [(text_hash(f"text {number}"), [float(number)] * 8) for number in range(10)]
+    cache.put_many("model", items)
+    cache.put_many("model", items)
+    cache.put_many("model", items[:3])
+
+    assert cache._size == stored_bytes(cache) == 10 * 8 * 4
+
+
+def test_restoring_vectors_does_not_evict(tmp_path):
+    # Room for exactly ten 8-float vectors
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_bytes=10 * 8 * 4)
+    keys = [text_hash(f"text {number}") for number in range(10)]
+    cache.put_many("model", [(key, [1.0] * 8) for key in keys])
+    cache.put_many("model", [(key, [1.0] * 8) for key in keys[5:]])
+    assert len(cache.get_many("model", keys)) == 10
+
+    # One more vector goes over the limit
+    cache.put_many("model", [(text_hash("new"), [1.0] * 8)])
+    assert len(cache.get_many("model", keys)) < 10
+    assert cache._size == stored_bytes(cache) <= 10 * 8 * 4
+
+
+def test_cached_embeddings_encode_each_text_once(tmp_path):
+    calls = []
+
+    class Model:
+        def embed_documents(self, texts):
+            calls.append(list(texts))
+            return [[float(len(text))] * 4 for text in texts]
+
+        def embed_query(self, text):
+            return [0.0] * 4
+
+    embeddings = CachedEmbeddings(Model(), "model", cache=EmbeddingCache(str(tmp_path / "embeddings.sqlite")))
+    first = embeddings.embed_documents(["a", "bb", "a"])
+    second = embeddings.embed_documents(["bb", "ccc"])
+
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert first == [[1.0] * 4, [2.0] * 4, [1.0] * 4]
+    assert second == [[2.0] * 4, [3.0] * 4]
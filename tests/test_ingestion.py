@@ -0,0 +1,34 @@
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+from langchain_community.document_loaders import PyPDFDirectoryLoader
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.synthetic import generate_corpus
+from index_manifest import IndexManifest
+from ingestion import index_directory
+
+
+def test_updates_replace_chunks_from_before_the_manifest(tmp_path):
+    directories = [str(tmp_path / "pdfs" / name) for name in ("a", "b")]
+    for seed, directory in enumerate(directories):
+        generate_corpus(directory, files=2, pages=2, words_per_page=200, seed=seed)
+    vector_store = Chroma(persist_directory=str(tmp_path / "db"), embedding_function=DeterministicFakeEmbedding(size=32))
+
+    # Built the way databases were before the manifest: random IDs and no chunk_id
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    for directory in directories:
+        vector_store.add_documents(splitter.split_documents(PyPDFDirectoryLoader(directory).load()))
+
+    # Each directory is updated on its own, so the second update runs with a manifest that is no longer empty
+    total = 0
+    for directory in directories:
+        manifest = IndexManifest(str(tmp_path / "db"))
+        written, changed, _ = index_directory(vector_store, manifest, directory, 500, 50, max_workers=1)
+        assert changed == 2
+        total += written
+
+    stored = vector_store.get(include=["metadatas"])
+    assert len(stored["ids"]) == total
+    assert all(metadata.get("chunk_id") for metadata in stored["metadatas"])
+    # Nothing from before the manifest is left, so later updates skip the scan
+    assert not IndexManifest(str(tmp_path / "db")).legacy_chunks
@@ -0,0 +1,35 @@
+from lexical_index import LexicalIndex, tokenize
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Form 1040-ES, see W-2.") == ["form", "1040-es", "1040", "es", "see", "w-2", "w", "2"]
+
+
+def test_add_remove_and_compaction_survive_save_and_load(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add("a", "The W-2 form reports wages")
+    index.add("b", "Form 1040-ES is for estimated tax")
+    index.add("c", "Travel policy and per diem rates")
+    index.save()
+
+    # Pending postings and tombstones are searched together with the merged arrays
+    index.add("d", "Estimated tax payments are due quarterly")
+    index.remove("b")
+    assert [chunk_id for chunk_id, _ in index.search("estimated tax")] == ["d"]
+
+    index.save()
+    loaded = LexicalIndex(str(tmp_path))
+    assert len(loaded) == 3
+    assert "b" not in loaded
+    assert [chunk_id for chunk_id, _ in loaded.search("estimated tax")] == ["d"]
+    assert loaded.search("w-2")[0][0] == "a"
+    # One removed document out of four reaches the compaction ratio, so it was purged on save
+    assert loaded.chunk_ids == ["a", "c", "d"]
+
+    # Replacing a chunk keeps a single live copy
+    loaded.add("a", "Wages are reported on form W-2 by the employer")
+    loaded.save()
+    reloaded = LexicalIndex(str(tmp_path))
+    assert len(reloaded) == 3
+    assert [chunk_id for chunk_id, _ in reloaded.search("employer")] == ["a"]
+    assert reloaded.search("nothing matches this") == []
@@ -0,0 +1,50 @@
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.synthetic import generate_corpus
+from index_manifest import IndexManifest
+from ingestion import index_directory
+from lexical_index import LexicalIndex
+from maintenance import format_report, open_collection, tune_database
+
+
+def test_tune_rebuilds_with_new_parameters_and_drops_stale_chunks(tmp_path):
+    db_path = str(tmp_path / "db")
+    paths = generate_corpus(str(tmp_path / "pdfs"), files=3, pages=2, words_per_page=200)
+    vector_store = Chroma(persist_directory=db_path, embedding_function=DeterministicFakeEmbedding(size=32))
+    lexical_index = LexicalIndex(db_path)
+    manifest = IndexManifest(db_path)
+    index_directory(vector_store, manifest, str(tmp_path / "pdfs"), 500, 50, max_workers=1, lexical_index=lexical_index)
+    total = len(vector_store.get(include=[])["ids"])
+
+    # Left behind in Chroma, as after an interrupted update
+    stale = manifest.chunk_ids(paths[0])
+    manifest.forget(paths[0])
+    manifest.save()
+
+    report = tune_database(db_path, hnsw={"M": 32, "search_ef": 50}, k=2, samples=5)
+
+    assert report["before"]["hnsw"] == {"M": 16, "construction_ef": 100, "search_ef": 10}
+    assert report["after"]["hnsw"] == {"M": 32, "construction_ef": 100, "search_ef": 50}
+    assert report["stale_chunks_removed"] == len(stale)
+    assert report["after"]["chunks"] == total - len(stale)
+    # A small collection is searched exactly
+    assert report["after"]["recall_at_k"] == 1.0
+    assert "Rebuilt in" in format_report(report)
+
+    _, collection = open_collection(db_path)
+    assert not set(stale) & set(collection.get(include=[])["ids"])
+    assert not set(stale) & set(LexicalIndex(db_path).chunk_ids)
+
+
+def test_measure_only_leaves_the_collection_alone(tmp_path):
+    db_path = str(tmp_path / "db")
+    generate_corpus(str(tmp_path / "pdfs"), files=1, pages=1, words_per_page=50)
+    vector_store = Chroma(persist_directory=db_path, embedding_function=DeterministicFakeEmbedding(size=32))
+    index_directory(vector_store, IndexManifest(db_path), str(tmp_path / "pdfs"), 500, 50, max_workers=1)
+
+    report = tune_database(db_path, k=10)
+
+    assert "after" not in report
+    assert report["before"]["recall_at_k"] is None
+    assert "too few to measure" in format_report(report)
@@ -0,0 +1,46 @@
+import time
+
+from rate_limiter import HostRateLimiter, parse_retry_after
+
+URL = "https://example.com/page"
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_throttling_halves_the_rate_and_recovers_gradually():
+    limiter = HostRateLimiter(60)
+    bucket = limiter._bucket(URL)
+
+    before = time.monotonic()
+    limiter.record(URL, 429, "5")
+    assert bucket.rate == 0.5
+    assert bucket.tokens == 0
+    assert 4.5 < bucket.blocked_until - before <= 5.5
+    # Other hosts are not affected
+    assert limiter._bucket("https://other.example.com/").rate == 1.0
+
+    limiter.record(URL, 503)
+    assert bucket.rate == 0.25
+
+    # Each run of successful responses adds a tenth of the maximum back
+    for _ in range(10):
+        limiter.record(URL, 200)
+    assert round(bucket.rate, 3) == 0.35
+    for _ in range(100):
+        limiter.record(URL, 200)
+    assert bucket.rate == 1.0
+
+
+async def test_acquire_waits_out_the_back_off():
+    limiter = HostRateLimiter(6000, default_backoff=0.2)
+    await limiter.acquire(URL)
+    limiter.record(URL, 429)
+
+    start = time.monotonic()
+    await limiter.acquire(URL)
+    assert time.monotonic() - start >= 0.2
@@ -0,0 +1,101 @@
+"""The query server end to end with a stub LLM and deterministic embeddings."""
+import argparse
+import importlib.util
+import os
+import shutil
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.synthetic import generate_corpus
+from server import create_app
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot expanded.py")
+
+
+@pytest.fixture
+def script(tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location("chatbot_expanded", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    embeddings = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(module, "get_embeddings", lambda db_path=None: embeddings)
+    module.config = {
+        "database_paths": {"1": {"name": "Test", "path": str(tmp_path / "db"), "chunk_size": 500, "chunk_overlap": 50}},
+        "ingest_workers": 1,
+        "answer_cache": {"enabled": False, "path": str(tmp_path / "answers.sqlite")},
+        "retrieval": {"k": 2},
+    }
+    return module
+
+
+@pytest.fixture
+async def client(script, aiohttp_client):
+    args = argparse.Namespace(fake_llm=True, workers=2, max_queue=8)
+    service = script.create_query_service(script.config["database_paths"], ["1"], args)
+    return await aiohttp_client(create_app(service))
+
+
+async def test_health(client):
+    response = await client.get("/health")
+    assert response.status == 200
+    body = await response.json()
+    assert body["status"] == "ok"
+    assert body["databases"] == ["Test"]
+
+
+async def test_ingest_then_query(client, tmp_path):
+    generate_corpus(str(tmp_path / "pdfs"), files=2, pages=2, words_per_page=200)
+
+    response = await client.post("/ingest", json={"database": "1", "directory": str(tmp_path / "pdfs")})
+    assert response.status == 200
+    body = await response.json()
+    assert body["files_changed"] == 2
+    assert body["chunks_written"] > 0
+
+    response = await client.post("/query", json={"question": "What is the W-2 policy?"})
+    assert response.status == 200
+    body = await response.json()
+    assert body["answer"] == "This is a stubbed answer."
+    assert body["cached"] is False
+    assert 0 < len(body["sources"]) <= 2
+    assert all(source["source"].endswith(".pdf") for source in body["sources"])
+
+
+
+async def test_sources_cite_files_dropped_as_duplicates(client, tmp_path):
+    original = generate_corpus(str(tmp_path / "pdfs"), files=1, pages=2, words_per_page=200)[0]
+    shutil.copy(original, tmp_path / "pdfs" / "copy.pdf")
+
+    response = await client.post("/ingest", json={"database": "1", "directory": str(tmp_path / "pdfs")})
+    assert (await response.json())["files_changed"] == 2
+
+    response = await client.post("/query", json={"question": "What is the W-2 policy?"})
+    sources = (await response.json())["sources"]
+    assert sources
+    for source in sources:
+        # The copy was never embedded, so every stored chunk stands in for it
+        cited = {os.path.basename(source["source"])} | {os.path.basename(found["source"]) for found in source["also_in"]}
+        assert cited == {"copy.pdf", os.path.basename(original)}
+
+async def test_ingest_unknown_database_is_a_client_error(client, tmp_path):
+    response = await client.post("/ingest", json={"database": "nope", "directory": str(tmp_path)})
+    assert response.status == 400
+    assert "nope" in (await response.json())["error"]
+
+    # The server keeps answering afterwards
+    assert (await client.get("/health")).status == 200
+
+
+async def test_bad_requests(client):
+    assert (await client.post("/query", json={})).status == 400
+    assert (await client.post("/ingest", json={"database": "1"})).status == 400
+
+
+def test_format_reference_lists_other_files(script):
+    from langchain_core.documents import Document
+
+    doc = Document(page_content="", metadata={"source": "/pdfs/a.pdf", "duplicates": [{"source": "/pdfs/b.pdf", "page": 0}, {"source": "/pdfs/b.pdf", "page": 1}, {"source": "/other/a.pdf", "page": 0}]})
+    assert script.format_reference(doc) == "a.pdf (also in b.pdf)"
+    assert script.format_reference(Document(page_content="", metadata={"source": "/pdfs/a.pdf"})) == "a.pdf"
@@ -0,0 +1,20 @@
+import aiohttp
+from aiohttp import web
+
+from static_fetch import fetch_links
+
+
+async def test_unknown_charset_falls_back_to_utf8(aiohttp_server):
+    async def page(request):
+        body = '<html><body><a href="/doc.pdf">Document</a></body></html>'.encode("utf-8")
+        return web.Response(body=body, headers={"Content-Type": "text/html; charset=x-unknown-charset"})
+
+    app = web.Application()
+    app.router.add_get("/", page)
+    server = await aiohttp_server(app)
+
+    async with aiohttp.ClientSession() as session:
+        status, _, links, _ = await fetch_links(session, str(server.make_url("/")))
+
+    assert status == 200
+    assert links == [str(server.make_url("/doc.pdf"))]
@@ -0,0 +1,38 @@
+from langchain_core.language_models import FakeListChatModel
+
+from streaming import LlmMetricsHandler, StreamingPrinter
+import instrumentation
+
+
+def test_streaming_printer_prints_tokens_and_summarizes(capsys):
+    llm = FakeListChatModel(responses=["Hello there"])
+    printer = StreamingPrinter()
+
+    printer.start_turn()
+    chunks = list(llm.stream("hi", config={"callbacks": [printer]}))
+
+    output = capsys.readouterr().out
+    assert output == "ScoutAI: Hello there\n"
+    assert printer.tokens == len(chunks) == len("Hello there")
+    assert printer.time_to_first_token is not None
+    assert printer.tokens_per_second is None or printer.tokens_per_second > 0
+    summary = printer.summary()
+    assert "time to first token" in summary
+    assert f"{printer.tokens} tokens" in summary
+
+
+def test_streaming_printer_summary_without_tokens():
+    printer = StreamingPrinter()
+    printer.start_turn()
+    assert printer.time_to_first_token is None
+    assert printer.summary() == "no tokens streamed, 0 tokens"
+
+
+def test_llm_metrics_handler_records_generation():
+    instrumentation.registry.reset()
+    llm = FakeListChatModel(responses=["ok"])
+    list(llm.stream("hi", config={"callbacks": [LlmMetricsHandler()]}))
+
+    snapshot = instrumentation.snapshot()
+    assert any(c["name"] == "llm_tokens" and c["value"] == 2 for c in snapshot["counters"])
+    assert any(h["name"] == "llm_generation_seconds" and h["count"] == 1 for h in snapshot["histograms"])
@@ -0,0 +1,92 @@
+"""In-memory index of URLs that were already downloaded or crawled.
+
+URLs are normalized and stored as 16-byte BLAKE2b digests in a set, which
+keeps membership checks O(1) and memory use small on logs with millions of
+rows. At 128 bits a collision is never expected, so the set is treated as
+exact. The index is loaded once per crawl and shared by every crawl task.
+"""
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from logging_models import PdfDownloadLog, CompletedPagesLog, url_host
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """Return a canonical form of a URL for duplicate detection.
+
+    Lowercases the scheme and host, drops default ports and fragments, and
+    sorts query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def _digest(url):
+    return hashlib.blake2b(normalize_url(url).encode("utf-8"), digest_size=16).digest()
+
+
+class UrlIndex:
+    """Set of known URLs, plus the URLs currently being downloaded.
+
+    PDFs downloaded by earlier crawls are kept apart from the URLs handled in
+    this one, so they can be claimed once more to check them for changes.
+    """
+
+    def __init__(self, urls=()):
+        self._known = set()
+        self._in_flight = set()
+        self._previous = set()
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        key = _digest(url)
+        return key in self._known or key in self._previous
+
+    def __len__(self):
+        return len(self._known | self._previous)
+
+    def add(self, url):
+        """Record a URL as done."""
+        key = _digest(url)
+        self._known.add(key)
+        self._in_flight.discard(key)
+
+    def claim(self, url, revalidate=False):
+        """Reserve a URL for download, returning False if it is done or already in progress.
+
+        A PDF downloaded by an earlier crawl is only reserved with revalidate,
+        once per crawl, so it can be fetched conditionally.
+        """
+        key = _digest(url)
+        if key in self._known or key in self._in_flight or (key in self._previous and not revalidate):
+            return False
+        self._in_flight.add(key)
+        return True
+
+    def release(self, url):
+        """Give up a claim without recording the URL, so it can be tried again."""
+        self._in_flight.discard(_digest(url))
+
+    @classmethod
+    def load(cls, session, url):
+        """Build the index from the logged downloads and completed pages for url's host."""
+        index = cls()
+        host = url_host(url)
+        for model, urls in ((PdfDownloadLog, index._previous), (CompletedPagesLog, index._known)):
+            # Uses the index on host rather than scanning every URL
+            query = session.query(model.url).filter(model.host == host)
+            for (logged_url,) in query.yield_per(10000):
+                # Older crawls also logged PDFs as completed pages, which would stop them being revalidated
+                if model is CompletedPagesLog and logged_url.endswith(".pdf"):
+                    continue
+                urls.add(_digest(logged_url))
+        return index